@@ -0,0 +1,118 @@
+# 模拟延迟/错误/限流的大模型客户端
+
+# path: bench/mock_llm.py
+"""
+Offline stand-in for the LLM providers.
+
+SimulatedClient answers like extractor.MockClient (single, batch and packed
+prompts) but:
+
+- sleeps for a latency drawn from a log-normal distribution (median
+  `latency_ms`, shape `sigma`; sigma=0 gives a fixed latency)
+- fails with HTTP 500 with probability `error_rate`
+- enforces a provider-side quota of `rpm` requests/minute and raises HTTP 429
+  beyond it, like the real APIs
+
+Errors carry `status_code`, so tools.ratelimit classifies them exactly like
+requests/httpx errors (429 throttled, 5xx retryable).
+
+Usage (build the clients once so counters and quotas span the whole run):
+    clients = make_clients(latency_ms=300, error_rate=0.01, rpm=600)
+    extractor.CLIENT_FACTORY = lambda: clients
+"""
+
+from __future__ import annotations
+
+import time
+import math
+import random
+import asyncio
+import threading
+from typing import Dict, Any, List, Optional
+
+try:
+    from tools.extractor import MockClient, DEFAULT_TEMPERATURE
+except Exception:
+    from extractor import MockClient, DEFAULT_TEMPERATURE
+
+
+class SimulatedHTTPError(Exception):
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"{status_code} {message}")
+        self.status_code = status_code
+
+
+class _ProviderQuota:
+    """Server-side sliding window: at most `rpm` requests in any 60 s."""
+
+    def __init__(self, rpm: Optional[float]):
+        self.rpm = rpm
+        self._times: List[float] = []
+        self._lock = threading.Lock()
+
+    def admit(self) -> bool:
+        if not self.rpm:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            cutoff = now - 60.0
+            i = 0
+            while i < len(self._times) and self._times[i] < cutoff:
+                i += 1
+            del self._times[:i]
+            if len(self._times) >= self.rpm:
+                return False
+            self._times.append(now)
+            return True
+
+
+class SimulatedClient(MockClient):
+    def __init__(self, name: str, latency_ms: float = 300.0, sigma: float = 0.5, error_rate: float = 0.0,
+                 rpm: Optional[float] = None, seed: Optional[int] = None):
+        super().__init__(name)
+        self.latency_ms = latency_ms
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.quota = _ProviderQuota(rpm)
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.throttled = 0
+
+    def _plan(self) -> float:
+        """Decide this call's latency and outcome; raises the simulated error if any."""
+        with self._rng_lock:
+            self.calls += 1
+            latency = self.latency_ms / 1000.0
+            if self.sigma > 0:
+                latency *= math.exp(self._rng.gauss(0.0, self.sigma))
+            fail = self._rng.random() < self.error_rate
+        if not self.quota.admit():
+            self.throttled += 1
+            # 限流响应很快返回
+            raise SimulatedHTTPError(429, "Too Many Requests (rate limit)")
+        if fail:
+            self.errors += 1
+            raise SimulatedHTTPError(500, "Internal Server Error")
+        return latency
+
+    def call(self, prompt: str, max_tokens: int = 300, temperature: float = DEFAULT_TEMPERATURE) -> Dict[str, Any]:
+        latency = self._plan()
+        time.sleep(latency)
+        resp = super().call(prompt, max_tokens, temperature)
+        resp["latency"] = latency
+        return resp
+
+    async def acall(self, prompt: str, max_tokens: int = 300, temperature: float = DEFAULT_TEMPERATURE) -> Dict[str, Any]:
+        latency = self._plan()
+        await asyncio.sleep(latency)
+        resp = MockClient.call(self, prompt, max_tokens, temperature)
+        resp["latency"] = latency
+        return resp
+
+
+def make_clients(latency_ms: float = 300.0, sigma: float = 0.5, error_rate: float = 0.0,
+                 rpm: Optional[float] = None, seed: int = 0,
+                 names=("glm-4-plus", "spark-4.0Ultra")) -> List[SimulatedClient]:
+    return [SimulatedClient(n, latency_ms, sigma, error_rate, rpm, seed=seed + i) for i, n in enumerate(names)]
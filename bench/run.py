@@ -0,0 +1,266 @@
+# 离线基准测试
+
+# path: bench/run.py
+"""
+Offline throughput benchmark: synthetic PDFs -> parse -> extract (simulated
+LLM latency/errors/rate limits) -> merge, each stage measured separately
+(wall time, CPU time, pages/s or calls/s, peak RSS).
+
+Results are saved as JSON (with the git commit) so runs can be compared;
+`--compare OLD.json` exits with status 1 when a stage's throughput drops by
+more than `--max_regression`, which makes it usable as a CI gate.
+
+Run (from the repo root):
+  python -m bench.run --pdfs 2 --pages 20 --latency_ms 200 --error_rate 0.01
+  python -m bench.run --engine async --concurrency 128 --compare bench/results/base.json
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import resource
+import platform
+import threading
+import subprocess
+from typing import Dict, Any, List, Optional
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import config as cfg
+import main as pipeline
+from tools import parser as pdf_parser
+from tools import extractor as llm_extractor
+from tools import merger as results_merger
+from tools import prefilter as relevance_prefilter
+from tools import telemetry
+from bench import synth
+from bench import mock_llm
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+RSS_SAMPLE_INTERVAL = 0.01
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        # 非 Linux：退回进程生命周期内的峰值（macOS 单位为字节，Linux 为 KB）
+        r = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return r if sys.platform == "darwin" else r * 1024
+
+
+def _children_maxrss() -> int:
+    r = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return r if sys.platform == "darwin" else r * 1024
+
+
+class Stage:
+    """Measures wall/CPU time and peak RSS (sampled) of the enclosed block."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.result: Dict[str, Any] = {}
+
+    def _sample(self) -> None:
+        while not self._stop.wait(RSS_SAMPLE_INTERVAL):
+            self._peak = max(self._peak, _rss_bytes())
+
+    def __enter__(self) -> "Stage":
+        self._peak = self._rss0 = _rss_bytes()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        self._cpu0 = time.process_time()
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        wall = time.perf_counter() - self._t0
+        cpu = time.process_time() - self._cpu0
+        self._stop.set()
+        self._thread.join()
+        self._peak = max(self._peak, _rss_bytes())
+        self.result.update({
+            "seconds": round(wall, 4),
+            "cpu_seconds": round(cpu, 4),
+            "rss_start_mb": round(self._rss0 / 2**20, 1),
+            "peak_rss_mb": round(self._peak / 2**20, 1),
+            "children_peak_rss_mb": round(_children_maxrss() / 2**20, 1),
+        })
+
+    def rate(self, key: str, count: float) -> None:
+        self.result[key.replace("_per_s", "")] = count
+        self.result[key] = round(count / self.result["seconds"], 2) if self.result["seconds"] else None
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=10,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def _counter_sum(snap: Dict[str, Any], name: str, **labels) -> float:
+    return sum(c["value"] for c in snap["counters"]
+               if c["name"] == name and all(c["labels"].get(k) == v for k, v in labels.items()))
+
+
+def run(args) -> Dict[str, Any]:
+    pdfs = synth.generate_corpus(args.data_dir, n_pdfs=args.pdfs, pages=args.pages, seed=args.seed,
+                                 paras_per_page=args.paras_per_page, tables_per_page=args.tables_per_page,
+                                 images_per_page=args.images_per_page, repeat_images=args.repeat_images)
+    clients = mock_llm.make_clients(latency_ms=args.latency_ms, sigma=args.latency_sigma,
+                                    error_rate=args.error_rate, rpm=args.provider_rpm, seed=args.seed)
+    llm_extractor.CLIENT_FACTORY = lambda: clients
+    limits = cfg.PROVIDER_LIMITS if args.rate_limit else None
+    select_metrics = (relevance_prefilter.RelevanceFilter(cfg.METRIC_SYNONYMS, threshold=cfg.PREFILTER_THRESHOLD)
+                      if args.prefilter else None)
+    telemetry.reset()
+    stages: Dict[str, Dict[str, Any]] = {}
+    t_total = time.perf_counter()
+
+    # 1) parse（不走解析缓存，测的是真实解析/OCR 开销）
+    with Stage("parse") as st:
+        paragraphs = []
+        for pdf in pdfs:
+            paras = pdf_parser.parse_pdf(pdf, render_images=args.ocr, workers=args.parse_workers, cache_dir=None,
+                                         engine=args.parser_engine)
+            for p in paras:
+                p["source_file"] = os.path.basename(pdf)
+            paragraphs.extend(paras)
+    st.rate("pages_per_s", args.pdfs * args.pages)
+    st.result["paragraphs"] = len(paragraphs)
+    stages["parse"] = st.result
+
+    # 2) extract
+    company_paragraphs = pipeline.select_company_paragraphs(paragraphs, cfg.COMPANIES)
+    with Stage("extract") as st:
+        rows: List[Dict[str, Any]] = []
+        for comp, paras in company_paragraphs.items():
+            opts = dict(batch_metrics=args.batch_metrics, select_metrics=select_metrics, limits=limits,
+                        pack_paragraphs=args.pack_paragraphs)
+            if args.engine == "async":
+                res = asyncio.run(llm_extractor.extract_metrics_async(paras, cfg.METRICS,
+                                                                      concurrency=args.concurrency, **opts))
+            else:
+                res = llm_extractor.extract_metrics(paras, cfg.METRICS, workers=args.workers, **opts)
+            for r in res:
+                r["company"] = comp
+            rows.extend(res)
+    snap = telemetry.snapshot()
+    st.rate("calls_per_s", _counter_sum(snap, "llm_calls_total"))
+    st.result.update({
+        "rows": len(rows),
+        "error_rows": sum(1 for r in rows if "error" in r),
+        "provider_requests": sum(c.calls for c in clients),
+        "provider_errors": sum(c.errors for c in clients),
+        "provider_throttled": sum(c.throttled for c in clients),
+        "retries": _counter_sum(snap, "llm_retries_total"),
+    })
+    lat = [h for h in snap["histograms"] if h["name"] == "llm_call_seconds"]
+    st.result["call_latency"] = {h["labels"].get("model"): {k: h[k] for k in ("p50", "p95", "p99")} for h in lat}
+    stages["extract"] = st.result
+
+    # 3) merge
+    with Stage("merge") as st:
+        merged = results_merger.merge_results(rows)
+    st.rate("rows_per_s", len(rows))
+    st.result["merged"] = len(merged)
+    stages["merge"] = st.result
+
+    return {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "params": {k: v for k, v in vars(args).items() if k not in ("out", "compare", "data_dir")},
+        "total_seconds": round(time.perf_counter() - t_total, 4),
+        "stages": stages,
+    }
+
+
+# 各阶段用于回归判断的吞吐指标（越大越好）
+THROUGHPUT_KEYS = {"parse": "pages_per_s", "extract": "calls_per_s", "merge": "rows_per_s"}
+
+
+def compare(new: Dict[str, Any], old: Dict[str, Any], max_regression: float) -> List[str]:
+    """Print a comparison table; return the stages whose throughput regressed beyond the threshold."""
+    bad = []
+    print(f"\nvs {old.get('commit')} ({old.get('timestamp')}):")
+    for stage, key in THROUGHPUT_KEYS.items():
+        a = (old.get("stages", {}).get(stage) or {}).get(key)
+        b = (new.get("stages", {}).get(stage) or {}).get(key)
+        if not a or b is None:
+            continue
+        change = (b - a) / a
+        flag = ""
+        if change < -max_regression:
+            flag = "  REGRESSION"
+            bad.append(stage)
+        print(f"  {stage:8s} {key:12s} {a:>10.2f} -> {b:>10.2f} ({change:+.1%}){flag}")
+    return bad
+
+
+def _print(result: Dict[str, Any]) -> None:
+    s = result["stages"]
+    print(f"parse   : {s['parse']['pages']} pages in {s['parse']['seconds']}s = {s['parse']['pages_per_s']} pages/s, "
+          f"peak RSS {s['parse']['peak_rss_mb']} MB (children {s['parse']['children_peak_rss_mb']} MB)")
+    print(f"extract : {s['extract']['calls']:.0f} calls in {s['extract']['seconds']}s = {s['extract']['calls_per_s']} calls/s, "
+          f"{s['extract']['error_rows']} error rows, {s['extract']['retries']:.0f} retries, "
+          f"{s['extract']['provider_throttled']} throttled, peak RSS {s['extract']['peak_rss_mb']} MB")
+    print(f"merge   : {s['merge']['rows']} rows in {s['merge']['seconds']}s = {s['merge']['rows_per_s']} rows/s, "
+          f"peak RSS {s['merge']['peak_rss_mb']} MB")
+    print(f"total   : {result['total_seconds']}s")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Offline pipeline benchmark")
+    ap.add_argument("--pdfs", type=int, default=1)
+    ap.add_argument("--pages", type=int, default=10)
+    ap.add_argument("--paras_per_page", type=int, default=6)
+    ap.add_argument("--tables_per_page", type=int, default=1)
+    ap.add_argument("--images_per_page", type=int, default=1)
+    ap.add_argument("--repeat_images", action="store_true", help="Same image on every page (exercises OCR dedup)")
+    ap.add_argument("--no_ocr", dest="ocr", action="store_false", help="Parse without rendering/OCR of images")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--parse_workers", type=int, default=cfg.PARSE_WORKERS)
+    ap.add_argument("--parser_engine", choices=["pdfplumber", "fitz", "auto"], default=cfg.PARSER_ENGINE)
+    ap.add_argument("--engine", choices=["sync", "async"], default="sync")
+    ap.add_argument("--workers", type=int, default=cfg.MAX_WORKERS)
+    ap.add_argument("--concurrency", type=int, default=cfg.ASYNC_CONCURRENCY)
+    ap.add_argument("--batch_metrics", action="store_true")
+    ap.add_argument("--pack_paragraphs", action="store_true")
+    ap.add_argument("--prefilter", action="store_true")
+    ap.add_argument("--rate_limit", action="store_true", help="Apply config.PROVIDER_LIMITS (client-side limits and retries)")
+    ap.add_argument("--latency_ms", type=float, default=300.0, help="Median simulated LLM latency")
+    ap.add_argument("--latency_sigma", type=float, default=0.5, help="Log-normal shape of the latency (0 = fixed)")
+    ap.add_argument("--error_rate", type=float, default=0.0, help="Probability of a simulated HTTP 500")
+    ap.add_argument("--provider_rpm", type=float, default=None, help="Simulated provider quota; beyond it calls get HTTP 429")
+    ap.add_argument("--data_dir", default=DATA_DIR, help="Where the synthetic PDFs are written")
+    ap.add_argument("--out", help="Result JSON path (default bench/results/<timestamp>-<commit>.json)")
+    ap.add_argument("--compare", help="Earlier result JSON to compare against")
+    ap.add_argument("--max_regression", type=float, default=0.10, help="Allowed throughput drop per stage for --compare")
+    args = ap.parse_args()
+
+    result = run(args)
+    _print(result)
+    out = args.out or os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{result['commit'] or 'nogit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"Results saved to {out}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            bad = compare(result, json.load(f), args.max_regression)
+        if bad:
+            print(f"Throughput regression in: {', '.join(bad)}")
+            sys.exit(1)
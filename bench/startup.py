@@ -0,0 +1,159 @@
+# 启动耗时基准
+
+# path: bench/startup.py
+"""
+Cold-start benchmark: each case runs in a fresh `python` process, `--repeat`
+times, and the median wall time is reported.
+
+- import_main: `import main` (what every CLI run pays before doing work)
+- import_server: `import server` (server boot: Flask app + job manager)
+- cli_mock: `python main.py --mock` end to end on a one-page synthetic PDF
+  (no LLM/parse cache), i.e. a small single-page request
+
+For the import cases it also records which heavy third-party modules
+(fitz, pdfplumber, pandas, pytesseract, zai, ...) were loaded at import, and
+the slowest imports by cumulative time from `python -X importtime`, so an
+eager import that sneaks back in shows up by name.
+
+Results are saved as JSON like bench/run.py; `--compare OLD.json` exits with
+status 1 when a case's median gets slower by more than `--max_regression`.
+
+Run (from the repo root):
+  python -m bench.startup
+  python -m bench.startup --repeat 10 --compare bench/results/startup-base.json
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+from typing import Dict, Any, List, Optional
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from bench import synth
+from bench.run import RESULTS_DIR, DATA_DIR, _git_commit
+
+HEAVY_MODULES = ("fitz", "pdfplumber", "pandas", "numpy", "pytesseract", "PIL", "zai",
+                 "requests", "httpx", "pyarrow", "ahocorasick", "flask")
+TOP_IMPORTS = 10
+
+
+def _run(cmd: List[str], cwd: str = ROOT) -> float:
+    t0 = time.perf_counter()
+    subprocess.run(cmd, cwd=cwd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - t0
+
+
+def _loaded_heavy(module: str) -> List[str]:
+    code = (f"import sys, json; import {module}; "
+            f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))")
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True, capture_output=True, text=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def _slowest_imports(module: str, n: int = TOP_IMPORTS) -> List[Dict[str, Any]]:
+    """Direct imports of `module` by cumulative time, from `python -X importtime`."""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=ROOT,
+                         check=True, capture_output=True, text=True)
+    # 每行 "import time: self | cumulative | <缩进>name"，子模块先于父模块输出
+    children: List[Dict[str, Any]] = []
+    top: List[Dict[str, Any]] = []
+    for line in out.stderr.splitlines():
+        parts = line[len("import time:"):].split("|") if line.startswith("import time:") else []
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].strip()
+        depth = (len(parts[2]) - len(parts[2].lstrip()) - 1) // 2
+        if depth == 1:
+            children.append({"module": name, "cumulative_ms": round(int(parts[1]) / 1000, 1)})
+        elif depth == 0:
+            if name == module:
+                top = children
+            children = []
+    top.sort(key=lambda r: -r["cumulative_ms"])
+    return top[:n]
+
+
+def _case(name: str, cmd: List[str], repeat: int, module: Optional[str] = None) -> Dict[str, Any]:
+    try:
+        times = [_run(cmd) for _ in range(repeat)]
+    except (subprocess.CalledProcessError, OSError) as e:
+        # 如 server 需要 flask 而本机未安装
+        print(f"{name:14s} skipped ({e})")
+        return {"skipped": str(e)}
+    res: Dict[str, Any] = {"median_s": round(statistics.median(times), 4), "min_s": round(min(times), 4),
+                           "runs": [round(t, 4) for t in times]}
+    if module:
+        res["heavy_modules"] = _loaded_heavy(module)
+        res["slowest_imports"] = _slowest_imports(module)
+    print(f"{name:14s} median {res['median_s'] * 1000:8.1f} ms  min {res['min_s'] * 1000:8.1f} ms"
+          + (f"  heavy: {', '.join(res['heavy_modules']) or '-'}" if module else ""))
+    return res
+
+
+def run(args) -> Dict[str, Any]:
+    py = sys.executable
+    pdf = synth.generate_pdf(os.path.join(args.data_dir, "startup-p1.pdf"), pages=1, images_per_page=0, seed=args.seed)
+    cases: Dict[str, Any] = {}
+    cases["import_main"] = _case("import_main", [py, "-c", "import main"], args.repeat, module="main")
+    cases["import_server"] = _case("import_server", [py, "-c", "import server"], args.repeat, module="server")
+    with tempfile.TemporaryDirectory(prefix="startup-") as out:
+        cases["cli_mock"] = _case("cli_mock", [py, "main.py", "--pdf", pdf, "--mock", "--no_llm_cache",
+                                               "--no_parse_cache", "--output_dir", out], args.repeat)
+    return {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "params": {"repeat": args.repeat, "seed": args.seed},
+        "cases": cases,
+    }
+
+
+def compare(new: Dict[str, Any], old: Dict[str, Any], max_regression: float) -> List[str]:
+    """Print a comparison table; return the cases whose median got slower beyond the threshold."""
+    bad = []
+    print(f"\nvs {old.get('commit')} ({old.get('timestamp')}):")
+    for name, b in new["cases"].items():
+        a = (old.get("cases", {}).get(name) or {}).get("median_s")
+        b = b.get("median_s")
+        if not a or b is None:
+            continue
+        change = (b - a) / a
+        flag = ""
+        if change > max_regression:
+            flag = "  REGRESSION"
+            bad.append(name)
+        print(f"  {name:14s} {a * 1000:>8.1f} ms -> {b * 1000:>8.1f} ms ({change:+.1%}){flag}")
+    return bad
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="CLI / server cold-start benchmark")
+    ap.add_argument("--repeat", type=int, default=5, help="Fresh processes per case")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--data_dir", default=DATA_DIR, help="Where the synthetic PDF is written")
+    ap.add_argument("--out", help="Result JSON path (default bench/results/startup-<timestamp>-<commit>.json)")
+    ap.add_argument("--compare", help="Earlier result JSON to compare against")
+    ap.add_argument("--max_regression", type=float, default=0.20, help="Allowed slowdown per case for --compare")
+    args = ap.parse_args()
+
+    result = run(args)
+    out = args.out or os.path.join(RESULTS_DIR, f"startup-{time.strftime('%Y%m%d-%H%M%S')}-{result['commit'] or 'nogit'}.json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"Saved {out}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            bad = compare(result, json.load(f), args.max_regression)
+        if bad:
+            print(f"Startup regression in: {', '.join(bad)}")
+            sys.exit(1)
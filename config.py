@@ -9,11 +9,21 @@ Contains company list, metric list, and some runtime options.
 
 COMPANIES = [
     # Put the canonical company names you want to scan for in the PDFs.
-    # Matching is simple substring search (case-sensitive for now). Add variants
-    # if necessary (e.g. short name, full name).
+    # All names and aliases are matched in one pass (Aho-Corasick, tools/company_matcher.py);
+    # put short names / full names / English names in COMPANY_ALIASES.
     "招商证券",
 ]
 
+# canonical name -> aliases; a paragraph mentioning any alias is tagged with the canonical name
+COMPANY_ALIASES = {
+    "招商证券": ["招商证券股份有限公司"],
+}
+# Case-insensitive matching (matters for Latin-script names / abbreviations)
+COMPANY_IGNORE_CASE = False
+# Optional company list file (`canonical,alias,...` per line, or JSON {canonical: [aliases]});
+# replaces COMPANIES when set (also main.py --companies_file)
+COMPANIES_FILE = None
+
 METRICS = [
     # Put the metrics you want to extract from documents.
     "营收",
@@ -22,12 +32,22 @@ METRICS = [
     "利率",
 ]
 
+# Synonyms per metric used by the relevance prefilter (tools/prefilter.py).
+# The metric name itself is always included.
+METRIC_SYNONYMS = {
+    "营收": ["营业收入", "营业总收入", "主营业务收入", "收入"],
+    "利润": ["净利润", "利润总额", "营业利润", "归属于母公司股东的净利润"],
+    "债券面值": ["面值", "票面金额", "发行规模", "发行金额", "债券余额"],
+    "利率": ["票面利率", "年利率", "利率(%)", "利率（%）"],
+}
+
 # Where to write intermediate and final outputs
 OUTPUT_DIR = "./output"
 PARSED_JSON = "{output_dir}/parsed.json"
 EXTRACTIONS_JSON = "{output_dir}/extractions.json"
 MERGED_JSON = "{output_dir}/merged.json"
 FINAL_JSON = "{output_dir}/final_company_metrics.json"
+RUN_METRICS_JSON = "{output_dir}/metrics.json"
 
 # PDF source(s) can be a list or a single file path. You can also supply via CLI.
 PDF_FILES = [
@@ -40,5 +60,85 @@ MOCK_EXTRACTOR = False
 
 # Other settings
 MAX_WORKERS = 6
+# Worker processes for page-parallel PDF parsing (1 = serial)
+PARSE_WORKERS = 1
+# PDF parser backend: "pdfplumber", "fitz" (PyMuPDF only, much faster on digital filings;
+# classifies pages as digital/scanned and OCRs only scanned pages or content images) or
+# "auto" (fitz when the installed PyMuPDF can find tables)
+PARSER_ENGINE = "pdfplumber"
+# Per-page parse cache keyed on PDF content hash (None disables)
+PARSE_CACHE_DIR = "./.cache/parse"
+# Streaming mode: start LLM calls while later pages are still being parsed
+STREAM_PIPELINE = False
+# Bound on queued/in-flight LLM calls in streaming mode (None = MAX_WORKERS * 4)
+STREAM_MAX_PENDING = None
+# One prompt per (paragraph, model) asking for all METRICS at once
+BATCH_METRICS = False
+# Relevance prefilter: skip (paragraph, metric) pairs scoring below the threshold
+PREFILTER_ENABLED = False
+PREFILTER_THRESHOLD = 0.7
+# Long paragraphs/tables: build the prompt from windows around metric synonyms
+# (and table header + matching rows) instead of head/tail truncation
+CONTEXT_WINDOW = False
+CONTEXT_WINDOW_CHARS = 150
+# Persistent LLM response cache (SQLite, LRU by size, optional TTL in seconds; None path disables)
+LLM_CACHE_PATH = "./.cache/llm_responses.sqlite3"
+LLM_CACHE_MAX_MB = 512
+LLM_CACHE_TTL = None
+# Async extraction engine (asyncio + pooled keep-alive HTTP); max requests in flight
+ASYNC_EXTRACT = False
+ASYNC_CONCURRENCY = 64
+
+# Cascade mode: call CASCADE_PRIMARY first and ask the other model(s) only when
+# it returns a value, unparseable JSON, an error, or a suspicious empty answer
+CASCADE = False
+CASCADE_PRIMARY = "glm-4-plus"
+
+# Pack consecutive short paragraphs (same company and file) into one prompt up
+# to the prompt budget; answers come back keyed by paragraph tag. Ignored in cascade mode
+PACK_PARAGRAPHS = False
+
+# Per-provider quotas (keyed by client name). Requests/min and tokens/min feed
+# token buckets; concurrency starts at initial_concurrency and adapts (AIMD)
+# up to max_concurrency. 429/5xx/timeouts are retried with jittered backoff.
+# Adjust to your account's quotas. Mock clients are never limited.
+PROVIDER_LIMITS = {
+    "glm-4-plus": {"rpm": 600, "tpm": 1_000_000, "max_concurrency": 32, "initial_concurrency": 4, "max_retries": 4},
+    "spark-4.0Ultra": {"rpm": 300, "tpm": 500_000, "max_concurrency": 16, "initial_concurrency": 4, "max_retries": 4},
+}
+
+
+
+# Stream parsed paragraphs / extraction rows / merged items to JSONL as they are
+# produced (instead of indented JSON at the end of each stage) and merge from disk;
+# JSONL_GZIP writes .jsonl.gz
+JSONL_OUTPUT = False
+JSONL_GZIP = False
+
+# Format of parsed/extractions/merged outputs when JSONL_OUTPUT is off: "json",
+# "parquet" or "arrow" (columnar, company/metric/model/unit dictionary-encoded;
+# needs pyarrow). Arrow files are memory-mapped by the later stages
+OUTPUT_FORMAT = "json"
+
+# Merge engine: "dict" (tools/merger.py, per-group dicts and Counters) or "columnar"
+# (tools/merge_columnar.py, pandas/numpy grouped votes; amounts in 万元/亿元/... are
+# converted to 元 before voting, so equal amounts in different units agree)
+MERGE_ENGINE = "dict"
+
+# Run store (tools/run_store.py): finished extraction calls kept across runs, keyed on
+# (PDF content hash, page, paragraph, metric, model, prompt version). A rerun after adding
+# a metric / company / model only calls the models for the new combinations. None disables
+RUN_STORE_PATH = None   # e.g. "./.cache/run_store.sqlite3"
 
+# Corpus mode (main.py --corpus DIR|MANIFEST): CORPUS_WORKERS PDFs run in parallel,
+# each into <output_dir>/<name>-<sha8>/; finished PDFs are appended to CORPUS_MANIFEST
+# and finished LLM calls to CORPUS_CALLS (per PDF), so a restart resumes where it stopped
+CORPUS_WORKERS = 2
+CORPUS_MANIFEST = "{output_dir}/corpus_manifest.jsonl"
+CORPUS_CALLS = "{output_dir}/calls.jsonl"
 
+# server.py job queue: pipelines run in-process on SERVER_JOB_WORKERS threads,
+# at most SERVER_MAX_QUEUED jobs wait; each job writes to SERVER_JOBS_DIR/<job_id>
+SERVER_JOB_WORKERS = 2
+SERVER_MAX_QUEUED = 32
+SERVER_JOBS_DIR = "./output/jobs"
@@ -0,0 +1,162 @@
+"""
+Corpus batch mode: run the pipeline over many PDFs with resumable progress.
+
+The corpus is a directory (searched recursively for *.pdf) or a manifest file:
+plain text with one path per line, a JSON list of paths, or JSONL objects with
+a "pdf" field. Relative manifest paths are resolved against the manifest's
+directory.
+
+- up to `workers` PDFs run concurrently, each through main.run_pipeline into its
+  own directory <output_dir>/<name>-<sha8>/ (the usual JSON outputs, except
+  metrics.json: run metrics for the whole corpus go to <output_dir>/metrics.json)
+- every finished or failed PDF is appended to <output_dir>/corpus_manifest.jsonl
+  (pdf, sha256, status, output_dir, seconds, error); identical files are
+  processed once
+- on restart, PDFs whose content hash is recorded as done are skipped, and
+  PDFs that were interrupted resume from their calls.jsonl checkpoint, so only
+  the (paragraph, metric, model) calls that never finished hit the models
+
+Usage:
+    python main.py --corpus ./reports --corpus_workers 4 --output_dir ./output/corpus
+    python main.py --corpus ./reports.txt --mock
+"""
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List
+
+import config as cfg
+
+try:
+    from tools import checkpoint as call_checkpoint
+    from tools import telemetry
+    from tools.parser import _file_sha256
+except Exception:
+    import checkpoint as call_checkpoint
+    import telemetry
+    from parser import _file_sha256
+
+
+def load_corpus(path: str) -> List[str]:
+    if os.path.isdir(path):
+        found = []
+        for root, _, files in os.walk(path):
+            found += [os.path.join(root, f) for f in files if f.lower().endswith('.pdf')]
+        return sorted(found)
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, encoding='utf-8') as f:
+        if path.endswith('.json'):
+            entries = json.load(f)
+        elif path.endswith('.jsonl'):
+            entries = [json.loads(line)['pdf'] for line in f if line.strip()]
+        else:
+            entries = [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+    return [p if os.path.isabs(p) else os.path.join(base, p) for p in entries]
+
+
+def pdf_output_dir(output_dir: str, pdf: str, sha: str) -> str:
+    name = os.path.splitext(os.path.basename(pdf))[0]
+    return os.path.join(output_dir, f'{name}-{sha[:8]}')
+
+
+class CorpusManifest:
+    """Append-only JSONL log of finished PDFs; the last record per content hash wins."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.records: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        if not os.path.exists(path):
+            return
+        with open(path, 'rb+') as f:
+            data = f.read()
+            end = data.rfind(b'\n') + 1
+            if end < len(data):
+                f.truncate(end)    # torn last line from an interrupted run
+        for line in data[:end].decode('utf-8').splitlines():
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            self.records[rec['sha256']] = rec
+
+    def is_done(self, sha: str) -> bool:
+        rec = self.records.get(sha)
+        return bool(rec and rec.get('status') == 'done'
+                    and os.path.exists(cfg.FINAL_JSON.format(output_dir=rec['output_dir'])))
+
+    def append(self, rec: Dict[str, Any]) -> None:
+        with self._lock:
+            self.records[rec['sha256']] = rec
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(rec, ensure_ascii=False) + '\n')
+
+
+def run_corpus(corpus: str, output_dir: str, workers: int = 2, **pipeline_kwargs) -> Dict[str, Any]:
+    """
+    Process every PDF of `corpus` not yet done; pipeline_kwargs go to run_pipeline
+    (companies/metrics default to config). Returns counts of done/skipped/failed PDFs.
+    """
+    import main as pipeline
+
+    os.makedirs(output_dir, exist_ok=True)
+    telemetry.reset()
+    manifest = CorpusManifest(cfg.CORPUS_MANIFEST.format(output_dir=output_dir))
+    pipeline_kwargs.setdefault('companies', cfg.COMPANIES)
+    pipeline_kwargs.setdefault('metrics', cfg.METRICS)
+
+    todo, seen, skipped = [], set(), 0
+    for pdf in load_corpus(corpus):
+        sha = _file_sha256(pdf)
+        if sha in seen or manifest.is_done(sha):
+            skipped += 1
+            continue
+        seen.add(sha)
+        todo.append((pdf, sha))
+    print(f'Corpus {corpus}: {len(todo)} PDFs to process, {skipped} already done or duplicate')
+
+    # calls.jsonl written under another prompt / parse / mock version is discarded on open
+    version = pipeline.call_version(pipeline_kwargs.get('parser_engine', 'pdfplumber'),
+                                    pipeline_kwargs.get('mock_extractor', False))
+
+    def run_one(pdf: str, sha: str) -> Dict[str, Any]:
+        out = pdf_output_dir(output_dir, pdf, sha)
+        # with a run store, finished calls are resumed from it instead of the per-PDF calls.jsonl
+        ckpt = None if pipeline_kwargs.get('run_store') else call_checkpoint.CallCheckpoint(
+            cfg.CORPUS_CALLS.format(output_dir=out), version)
+        t0 = time.perf_counter()
+        rec = {'pdf': os.path.abspath(pdf), 'sha256': sha, 'output_dir': out}
+        try:
+            # counters are process-wide and shared by the PDFs running in parallel, so there are no
+            # per-PDF metrics: only the corpus-level metrics.json written at the end
+            pipeline.run_pipeline([pdf], output_dir=out, reset_telemetry=False, checkpoint=ckpt,
+                                  write_metrics=False, **pipeline_kwargs)
+            rec.update(status='done', error=None)
+        except Exception as e:
+            rec.update(status='failed', error=f'{type(e).__name__}: {e}')
+        finally:
+            if ckpt is not None:
+                ckpt.close()
+        rec.update(seconds=round(time.perf_counter() - t0, 3), finished=time.time())
+        manifest.append(rec)
+        telemetry.inc('corpus_pdfs_total', status=rec['status'])
+        return rec
+
+    counts = {'done': 0, 'failed': 0, 'skipped': skipped}
+    ex = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='corpus')
+    try:
+        futs = [ex.submit(run_one, pdf, sha) for pdf, sha in todo]
+        for i, fut in enumerate(as_completed(futs), 1):
+            rec = fut.result()
+            counts[rec['status']] += 1
+            print(f'[{i}/{len(todo)}] {rec["status"]}: {rec["pdf"]} ({rec["seconds"]:.1f}s)'
+                  + (f' {rec["error"]}' if rec['error'] else ''))
+    finally:
+        # Ctrl-C: drop PDFs not started yet; running ones are resumed from their checkpoint next time
+        ex.shutdown(wait=True, cancel_futures=True)
+
+    pipeline.save_json(telemetry.snapshot(), cfg.RUN_METRICS_JSON.format(output_dir=output_dir))
+    print(f'Corpus finished: {counts} (manifest {manifest.path})')
+    return counts
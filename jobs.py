@@ -0,0 +1,182 @@
+"""
+In-process job queue for server.py.
+
+Each submitted job runs main.run_pipeline on a bounded thread pool (no
+subprocess, no repeated interpreter/import start-up) and writes to its own
+output directory, so concurrent requests never share ./output.
+
+- submit() returns immediately with a job id; beyond `max_queued` waiting jobs
+  it raises QueueFull
+- status()/list() expose state (queued/running/done/failed/cancelled) and
+  progress (current stage, company/PDF counters)
+- cancel() drops a queued job, or stops a running one at its next stage /
+  company / PDF boundary
+- per-job options (JOB_OPTIONS) are passed to run_pipeline as arguments, never
+  through process-wide state: 'mock' reaches the extractor's client factory for
+  that job only
+- each job opens its own RunStore on config.RUN_STORE_PATH (separate
+  connection and in-memory index; all jobs share the SQLite file, where
+  concurrent writers are serialized and the first result for a call wins);
+  jobs use no CallCheckpoint
+
+Usage:
+    jobs = JobManager(workers=2, max_queued=32, jobs_dir="./output/jobs")
+    job_id = jobs.submit(["pdfs/a.pdf"], {"mock": True})
+    jobs.status(job_id)
+"""
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import config as cfg
+import main as pipeline
+
+# Pipeline switches a job request may set (everything else comes from config.py)
+JOB_OPTIONS = ('mock', 'stream', 'batch_metrics', 'prefilter', 'async_extract', 'cascade', 'pack_paragraphs',
+               'context_window', 'jsonl_output')
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, job_id: str, pdf_files: List[str], options: Dict[str, Any], output_dir: str):
+        self.id = job_id
+        self.pdf_files = pdf_files
+        self.options = options
+        self.output_dir = output_dir
+        self.status = 'queued'
+        self.progress: Dict[str, Any] = {}
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.cancel_requested = threading.Event()
+        self.future = None
+
+    @property
+    def result_path(self) -> str:
+        return cfg.FINAL_JSON.format(output_dir=self.output_dir)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'pdf_files': self.pdf_files,
+            'options': self.options,
+            'progress': self.progress,
+            'error': self.error,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+            'output_dir': self.output_dir,
+        }
+
+
+class JobManager:
+    def __init__(self, workers: int = 2, max_queued: int = 32, jobs_dir: str = './output/jobs', max_kept: int = 1000):
+        self.jobs_dir = jobs_dir
+        self.max_queued = max_queued
+        self.max_kept = max_kept
+        self._jobs: 'OrderedDict[str, Job]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+
+    def submit(self, pdf_files: List[str], options: Optional[Dict[str, Any]] = None) -> str:
+        options = {k: bool(v) for k, v in (options or {}).items() if k in JOB_OPTIONS}
+        with self._lock:
+            if sum(1 for j in self._jobs.values() if j.status == 'queued') >= self.max_queued:
+                raise QueueFull(f'{self.max_queued} jobs already queued')
+            job_id = uuid.uuid4().hex[:12]
+            job = Job(job_id, list(pdf_files), options, os.path.join(self.jobs_dir, job_id))
+            self._jobs[job_id] = job
+            self._evict()
+            job.future = self._pool.submit(self._run, job)
+        return job_id
+
+    def _evict(self) -> None:
+        # 只淘汰已结束的旧任务
+        while len(self._jobs) > self.max_kept:
+            old = next((k for k, j in self._jobs.items() if j.finished is not None), None)
+            if old is None:
+                break
+            del self._jobs[old]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.get(job_id)
+        return job.to_dict() if job else None
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [j.to_dict() for j in self._jobs.values()]
+
+    def latest_done(self) -> Optional[Job]:
+        with self._lock:
+            done = [j for j in self._jobs.values() if j.status == 'done']
+        return max(done, key=lambda j: j.finished) if done else None
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.cancel_requested.set()
+        if job.future is not None and job.future.cancel():
+            # 还在排队，直接取消
+            job.status = 'cancelled'
+            job.finished = time.time()
+        return job.to_dict()
+
+    def _run(self, job: Job) -> None:
+        if job.cancel_requested.is_set():
+            job.status, job.finished = 'cancelled', time.time()
+            return
+        job.status, job.started = 'running', time.time()
+
+        def progress(stage: str, **info):
+            if job.cancel_requested.is_set():
+                raise JobCancelled()
+            job.progress = dict(info, stage=stage)
+
+        opts = job.options
+        try:
+            pipeline.run_pipeline(
+                job.pdf_files, pipeline.load_companies(cfg.COMPANIES_FILE), cfg.METRICS, job.output_dir,
+                mock_extractor=opts.get('mock', cfg.MOCK_EXTRACTOR), max_workers=cfg.MAX_WORKERS,
+                parse_workers=cfg.PARSE_WORKERS, parse_cache_dir=cfg.PARSE_CACHE_DIR, parser_engine=cfg.PARSER_ENGINE,
+                stream=opts.get('stream', cfg.STREAM_PIPELINE), max_pending=cfg.STREAM_MAX_PENDING,
+                batch_metrics=opts.get('batch_metrics', cfg.BATCH_METRICS),
+                prefilter=opts.get('prefilter', cfg.PREFILTER_ENABLED),
+                llm_cache_path=cfg.LLM_CACHE_PATH,
+                async_extract=opts.get('async_extract', cfg.ASYNC_EXTRACT), rate_limit=True,
+                cascade=cfg.CASCADE_PRIMARY if opts.get('cascade', cfg.CASCADE) else None,
+                pack_paragraphs=opts.get('pack_paragraphs', cfg.PACK_PARAGRAPHS),
+                context=opts.get('context_window', cfg.CONTEXT_WINDOW),
+                jsonl_output=opts.get('jsonl_output', cfg.JSONL_OUTPUT), jsonl_gzip=cfg.JSONL_GZIP,
+                merge_engine=cfg.MERGE_ENGINE, output_format=cfg.OUTPUT_FORMAT,
+                run_store=cfg.RUN_STORE_PATH,
+                progress=progress, reset_telemetry=False)
+            job.status = 'done'
+            job.progress = {'stage': 'done'}
+        except JobCancelled:
+            job.status = 'cancelled'
+        except Exception as e:
+            job.status = 'failed'
+            job.error = f'{type(e).__name__}: {e}'
+        finally:
+            job.finished = time.time()
+
+    def shutdown(self, wait: bool = False) -> None:
+        self._pool.shutdown(wait=wait, cancel_futures=True)
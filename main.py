@@ -7,14 +7,34 @@ Main pipeline entrypoint.
 - Calls tools.extractor.extract_metrics for paragraphs relevant to each company
 - Merges multi-model outputs via tools.merger.merge_results
 - Aggregates merged results into final JSON: company -> metric -> best entry
+- With --stream, parsing and extraction overlap (parser.iter_parse_pdf feeds
+  extractor.iter_extract_metrics page by page)
+- Stage timings and per-model call/latency/error counters (tools.telemetry)
+  are written to <output_dir>/metrics.json
+- --jsonl_output streams paragraphs / extraction rows / merged items to
+  (optionally gzipped) JSONL as they are produced and merges from disk
+- --output_format parquet|arrow writes the intermediate outputs as columnar
+  files (tools.records) that later stages memory-map instead of re-parsing JSON
+- --merge_engine columnar votes with grouped pandas/numpy operations
+  (tools.merge_columnar) instead of per-group dicts
+- --run_store PATH reuses finished calls across runs, so adding a metric,
+  company or model only sends the new (paragraph, metric, model) calls
+- --corpus DIR|MANIFEST runs many PDFs in parallel with a resumable manifest
+  and per-call checkpoints (corpus.py)
+- --trace out.json records a Chrome/Perfetto timeline (PDFs, pages, OCR images,
+  LLM calls, merge, JSON writes); --profile wraps the run in cProfile (or a
+  sampling profiler over all threads) and writes a sorted report
 
 Run:
   python main.py --pdf /path/to/doc.pdf
+  python main.py --pdf /path/to/doc.pdf --trace trace.json --profile
 
 """
 import os
 import sys
 import json
+import time
+import asyncio
 import argparse
 from collections import defaultdict
 from typing import List, Dict, Any
@@ -24,6 +44,16 @@ try:
     from tools import parser as pdf_parser
     from tools import extractor as llm_extractor
     from tools import merger as results_merger
+    from tools import prefilter as relevance_prefilter
+    from tools import llm_cache
+    from tools import run_store as extraction_store
+    from tools import ratelimit
+    from tools import context as context_window
+    from tools import telemetry
+    from tools import tracing
+    from tools import jsonl
+    from tools import company_matcher
+    from tools import records
 except Exception:
     # Try local import path fallback
     import importlib.util
@@ -32,6 +62,16 @@ except Exception:
     from tools import parser as pdf_parser
     from tools import extractor as llm_extractor
     from tools import merger as results_merger
+    from tools import prefilter as relevance_prefilter
+    from tools import llm_cache
+    from tools import run_store as extraction_store
+    from tools import ratelimit
+    from tools import context as context_window
+    from tools import telemetry
+    from tools import tracing
+    from tools import jsonl
+    from tools import company_matcher
+    from tools import records
 
 # Load config (config.py should be in same dir or pythonpath)
 import config as cfg
@@ -42,8 +82,31 @@ def ensure_output_dir(path: str):
 
 
 def save_json(obj: Any, path: str):
-    with open(path, 'w', encoding='utf-8') as f:
-        json.dump(obj, f, ensure_ascii=False, indent=2)
+    with telemetry.timer('stage_seconds', stage='write'), tracing.span('write_json', path=os.path.basename(path)), \
+            open(path, 'w', encoding='utf-8') as f:
+        if isinstance(obj, (list, dict)):
+            json.dump(obj, f, ensure_ascii=False, indent=2)
+        else:
+            # records.RecordTable / other iterables: same layout as a dumped list, one record at a time
+            n = 0
+            f.write('[')
+            for item in obj:
+                f.write(',\n  ' if n else '\n  ')
+                f.write(json.dumps(item, ensure_ascii=False, indent=2).replace('\n', '\n  '))
+                n += 1
+            f.write('\n]' if n else ']')
+
+
+def save_records(items, path: str, output_format: str = 'json'):
+    # output_format 'parquet' / 'arrow' writes parsed/extractions/merged as a columnar file
+    # next to the JSON path and returns a memory-mapped view of it (records.TableFile)
+    if output_format == 'json':
+        save_json(items, path)
+        return items, path
+    path = records.table_path(path, output_format)
+    with telemetry.timer('stage_seconds', stage='write'), tracing.span('write_table', path=os.path.basename(path)):
+        records.write_table(items, path)
+    return records.TableFile(path), path
 
 
 def load_pdf_list(cli_pdf: List[str]) -> List[str]:
@@ -54,17 +117,31 @@ def load_pdf_list(cli_pdf: List[str]) -> List[str]:
     raise SystemExit('No PDF files provided. Set config.PDF_FILES or pass --pdf')
 
 
-def find_companies_in_paragraph(paragraph_text: str, companies: List[str]) -> List[str]:
-    hits = []
-    for c in companies:
-        if c in paragraph_text:
-            hits.append(c)
-    return hits
+def load_companies(companies_file: str = None) -> List[str]:
+    # config.COMPANIES, or the names in companies_file (whose aliases are added to config.COMPANY_ALIASES)
+    if not companies_file:
+        return cfg.COMPANIES
+    companies, aliases = company_matcher.load_company_file(companies_file)
+    cfg.COMPANY_ALIASES = dict(cfg.COMPANY_ALIASES, **aliases)
+    return companies
 
 
-def aggregate_merged_for_company(merged_items: List[Dict[str, Any]]) -> Dict[str, Any]:
-    # Build metric -> best item (by confidence then support count)
-    metric_map = {}
+def find_companies_in_paragraph(paragraph_text: str, companies) -> List[str]:
+    # companies: a company_matcher.CompanyMatcher (one pass over the text, aliases -> canonical
+    # name) or a plain list of names
+    if not isinstance(companies, company_matcher.CompanyMatcher):
+        companies = company_matcher.CompanyMatcher(companies)
+    return companies.find(paragraph_text)
+
+
+def build_company_matcher(companies: List[str]):
+    return company_matcher.CompanyMatcher(companies, cfg.COMPANY_ALIASES, ignore_case=cfg.COMPANY_IGNORE_CASE)
+
+
+def aggregate_merged_for_company(merged_items: List[Dict[str, Any]], metric_map: Dict[str, Any] = None) -> Dict[str, Any]:
+    # Build metric -> best item (by confidence then support count); an existing
+    # metric_map is updated in place (one item at a time when merging from JSONL)
+    metric_map = {} if metric_map is None else metric_map
     rank = {'high': 3, 'medium': 2, 'low': 1}
     for item in merged_items:
         metric = item['metric']
@@ -78,84 +155,381 @@ def aggregate_merged_for_company(merged_items: List[Dict[str, Any]]) -> Dict[str
         if new_score > cur_score:
             metric_map[metric] = item
         elif new_score == cur_score:
-            # tie-breaker: more supporting models
-            if len(item.get('support',[])) > len(cur.get('support',[])):
+            # tie-breaker: more supporting models, then the earliest position in the document,
+            # so the pick does not depend on the order items arrive in (on-disk buckets)
+            n_new, n_cur = len(item.get('support',[])), len(cur.get('support',[]))
+            if n_new > n_cur or (n_new == n_cur and
+                                 results_merger.position_key(item) < results_merger.position_key(cur)):
                 metric_map[metric] = item
     return metric_map
 
 
-def run_pipeline(pdf_files: List[str], companies: List[str], metrics: List[str], output_dir: str, mock_extractor: bool, max_workers:int):
-    ensure_output_dir(output_dir)
-
-    all_paragraphs = []
-    # 1) Parse PDFs
+def parse_pdfs(pdf_files: List[str], parse_workers: int = 1, parse_cache_dir: str = None, writer=None,
+               parser_engine: str = 'pdfplumber') -> List[Dict[str, Any]]:
+    # with a jsonl.JsonlWriter, paragraphs are appended to it page by page instead of
+    # being kept, and a re-iterable view of the file is returned; otherwise they are kept
+    # column-wise in a records.RecordTable
+    all_paragraphs = records.RecordTable()
     for pdf in pdf_files:
         print(f'Parsing {pdf}...')
-        paras = pdf_parser.parse_pdf(pdf, ocr_lang='chi_sim+eng', render_images=True)
-        # add source file path in paragraphs
+        with telemetry.timer('parse_pdf_seconds'), tracing.span('parse_pdf', pdf=os.path.basename(pdf)):
+            sha = pdf_parser._file_sha256(pdf)
+            if writer is not None:
+                for p in pdf_parser.iter_parse_pdf(pdf, ocr_lang='chi_sim+eng', render_images=True, workers=parse_workers,
+                                                   cache_dir=parse_cache_dir, engine=parser_engine):
+                    p['source_file'] = os.path.basename(pdf)
+                    p['source_sha'] = sha
+                    writer.write(p)
+                continue
+            paras = pdf_parser.parse_pdf(pdf, ocr_lang='chi_sim+eng', render_images=True, workers=parse_workers,
+                                         cache_dir=parse_cache_dir, engine=parser_engine)
+        # add source file name and content hash in paragraphs
         for p in paras:
             p['source_file'] = os.path.basename(pdf)
+            p['source_sha'] = sha
         all_paragraphs.extend(paras)
-
-    parsed_path = cfg.PARSED_JSON.format(output_dir=output_dir)
-    save_json(all_paragraphs, parsed_path)
-    print(f'Parsed paragraphs saved to {parsed_path} (count={len(all_paragraphs)})')
-
-    # 2) For each company, select paragraphs mentioning company; if none, fallback to all paragraphs
-    company_paragraphs = {}
-    for comp in companies:
-        sel = [p for p in all_paragraphs if comp in (p.get('text') or '')]
+    if writer is not None:
+        writer.close()
+        return jsonl.JsonlFile(writer.path, writer.count)
+    return all_paragraphs
+
+
+def select_company_paragraphs(all_paragraphs: List[Dict[str, Any]], companies: List[str], matcher=None) -> Dict[str, List[Dict[str, Any]]]:
+    # For each company, select paragraphs mentioning company (or an alias); if none, fallback to all paragraphs.
+    # One matcher pass per paragraph tags all companies at once.
+    matcher = matcher or build_company_matcher(companies)
+    company_paragraphs = {comp: [] for comp in matcher.companies}
+    for p in all_paragraphs:
+        for comp in matcher.find(p.get('text') or ''):
+            company_paragraphs[comp].append(p)
+    for comp, sel in company_paragraphs.items():
         if not sel:
-            # fallback: look in source file name
-            sel = [p for p in all_paragraphs if comp in (p.get('source_file') or '')]
-        if not sel:
-            print(f'Warning: no paragraphs matched company {comp}, will search whole doc for metrics')
-            sel = all_paragraphs
-        company_paragraphs[comp] = sel
-
-    # 3) Call extractor for each company's paragraphs
-    extractor_results = []
-    # Optionally override mock mode
-    if mock_extractor:
-        os.environ['EXTRACTOR_MOCK'] = '1'
+            company_paragraphs[comp] = fallback_company_paragraphs(all_paragraphs, comp, matcher)
+    return company_paragraphs
+
+
+def iter_company_items(all_paragraphs, matcher):
+    # Lazy select_company_paragraphs over a re-iterable (e.g. jsonl.JsonlFile): one pass yields
+    # dict(paragraph, company=...) for every mention, then the fallback for companies never mentioned
+    matched = set()
+    for p in all_paragraphs:
+        for comp in matcher.find(p.get('text') or ''):
+            matched.add(comp)
+            yield dict(p, company=comp)
+    for comp in matcher.companies:
+        if comp not in matched:
+            for p in fallback_company_paragraphs(all_paragraphs, comp, matcher):
+                yield dict(p, company=comp)
+
+
+def fallback_company_paragraphs(all_paragraphs: List[Dict[str, Any]], comp: str, matcher=None) -> List[Dict[str, Any]]:
+    # fallback: look in source file name (canonical name or any alias)
+    names = matcher.names(comp) if matcher is not None else [comp]
+    sel = [p for p in all_paragraphs if any(n in (p.get('source_file') or '') for n in names)]
+    if not sel:
+        print(f'Warning: no paragraphs matched company {comp}, will search whole doc for metrics')
+        sel = all_paragraphs
+    return sel
+
+
+def parse_and_extract_streaming(pdf_files: List[str], companies: List[str], metrics: List[str], max_workers: int,
+                                parse_workers: int = 1, parse_cache_dir: str = None, max_pending: int = None,
+                                batch_metrics: bool = False, select_metrics=None, cache=None,
+                                async_extract: bool = False, limits=None, cascade: str = None,
+                                pack_paragraphs: bool = False, select_context=None, progress=None, checkpoint=None,
+                                para_writer=None, row_writer=None, parser_engine: str = 'pdfplumber', mock: bool = None):
+    """
+    Streaming variant of steps 1-3: paragraphs are fed to the extractor as soon as
+    each page is parsed, so LLM calls overlap with parsing/OCR. The extractor bounds
+    its pending calls, which blocks the parser when the models fall behind.
+    Returns (all_paragraphs, extractor_results). With para_writer/row_writer
+    (jsonl.JsonlWriter) paragraphs and rows go to those files as they are produced;
+    all_paragraphs is then a jsonl.JsonlFile and extractor_results is empty.
+    companies may be a company_matcher.CompanyMatcher (aliases resolved to canonical names).
+    """
+    matcher = companies if isinstance(companies, company_matcher.CompanyMatcher) else build_company_matcher(companies)
+    all_paragraphs = records.RecordTable()
+    matched = set()
+
+    def company_items():
+        nonlocal all_paragraphs
+        for i, pdf in enumerate(pdf_files):
+            if progress:
+                progress('parse_extract', pdf=os.path.basename(pdf), done=i, total=len(pdf_files))
+            print(f'Parsing {pdf} (streaming)...')
+            # in streaming mode the span covers parsing plus the extraction work interleaved with it
+            with tracing.span('parse_pdf', pdf=os.path.basename(pdf), streaming=True):
+                sha = pdf_parser._file_sha256(pdf)
+                for p in pdf_parser.iter_parse_pdf(pdf, ocr_lang='chi_sim+eng', render_images=True, workers=parse_workers,
+                                                   cache_dir=parse_cache_dir, engine=parser_engine):
+                    p['source_file'] = os.path.basename(pdf)
+                    p['source_sha'] = sha
+                    if para_writer is not None:
+                        para_writer.write(p)
+                    else:
+                        all_paragraphs.append(p)
+                    for comp in matcher.find(p.get('text') or ''):
+                        matched.add(comp)
+                        yield dict(p, company=comp)
+        if para_writer is not None:
+            para_writer.close()
+            all_paragraphs = jsonl.JsonlFile(para_writer.path, para_writer.count)
+        # companies never mentioned in the text: same fallback as the batch path, once parsing is done
+        for comp in matcher.companies:
+            if comp in matched:
+                continue
+            for p in fallback_company_paragraphs(all_paragraphs, comp, matcher):
+                yield dict(p, company=comp)
+
+    if async_extract:
+        extractor_results = records.RecordTable()
+        asyncio.run(llm_extractor.extract_metrics_async(
+            company_items(), metrics, concurrency=max_pending or cfg.ASYNC_CONCURRENCY, batch_metrics=batch_metrics,
+            select_metrics=select_metrics, cache=cache, limits=limits, cascade=cascade,
+            pack_paragraphs=pack_paragraphs, select_context=select_context, checkpoint=checkpoint,
+            on_row=row_writer.write if row_writer is not None else extractor_results.append, mock=mock))
     else:
-        os.environ['EXTRACTOR_MOCK'] = '0'
+        rows = llm_extractor.iter_extract_metrics(company_items(), metrics, workers=max_workers,
+                                                  max_pending=max_pending, batch_metrics=batch_metrics,
+                                                  select_metrics=select_metrics, cache=cache,
+                                                  limits=limits, cascade=cascade,
+                                                  pack_paragraphs=pack_paragraphs,
+                                                  select_context=select_context,
+                                                  checkpoint=checkpoint, mock=mock)
+        if row_writer is not None:
+            extractor_results = []
+            for r in rows:
+                row_writer.write(r)
+        else:
+            extractor_results = records.RecordTable(rows)
+    return all_paragraphs, extractor_results
+
+
+def call_version(parser_engine: str = 'pdfplumber', mock: bool = False) -> str:
+    """
+    Version of finished LLM calls for the run store and call checkpoints: prompt version,
+    parse variant (para ids only line up between runs with the same engine, thresholds and
+    OCR settings) and whether the answers came from the mock clients (also without API keys).
+    """
+    mock = bool(mock) or not llm_extractor.api_keys_configured()
+    variant = pdf_parser.parse_variant(ocr_lang='chi_sim+eng', render_images=True, engine=parser_engine)
+    return f'{llm_extractor.PROMPT_VERSION}.{variant}' + ('-mock' if mock else '')
+
+
+def run_pipeline(pdf_files: List[str], companies: List[str], metrics: List[str], output_dir: str, mock_extractor: bool, max_workers:int, parse_workers: int = 1,
+                 parse_cache_dir: str = None, stream: bool = False, max_pending: int = None,
+                 batch_metrics: bool = False, prefilter: bool = False, llm_cache_path: str = None,
+                 async_extract: bool = False, rate_limit: bool = False, cascade: str = None,
+                 pack_paragraphs: bool = False, context: bool = False, progress=None, reset_telemetry: bool = True,
+                 checkpoint=None, jsonl_output: bool = False, jsonl_gzip: bool = False, merge_engine: str = 'dict',
+                 output_format: str = 'json', run_store: str = None, parser_engine: str = 'pdfplumber',
+                 write_metrics: bool = True):
+    """
+    Run parse -> extract -> merge -> aggregate and write the JSON outputs to output_dir.
+
+    progress(stage, **info), if given, is called at each stage boundary (and per
+    company / per PDF); raising from it aborts the run there (used for job
+    cancellation in server.py). reset_telemetry=False keeps the process-wide
+    counters accumulating across runs (server mode), so metrics.json is cumulative.
+    write_metrics=False skips metrics.json (corpus mode writes one aggregate file instead).
+    checkpoint (tools.checkpoint.CallCheckpoint) records finished LLM calls and
+    replays them instead of calling again (corpus mode resume).
+    run_store (SQLite path, tools.run_store) keeps finished calls across runs keyed on
+    document hash / paragraph / metric / model / prompt and parse version, so a rerun with an
+    added metric, company or model only calls the models for the new combinations;
+    it takes the place of checkpoint.
+    jsonl_output=True appends paragraphs, extraction rows and merged items to
+    parsed/extractions/merged.jsonl (.jsonl.gz with jsonl_gzip) as they are produced
+    and merges from disk, so memory does not grow with the number of documents.
+    merge_engine='columnar' votes with tools.merge_columnar (pandas) instead of tools.merger.
+    output_format='parquet'/'arrow' writes parsed/extractions/merged as columnar files
+    (tools.records, needs pyarrow) and later stages read them memory-mapped; ignored
+    with jsonl_output. final_company_metrics.json and metrics.json stay JSON.
+    """
+    ensure_output_dir(output_dir)
+    if reset_telemetry:
+        telemetry.reset()
+
+    # Optional relevance prefilter: only (paragraph, metric) pairs with a synonym and a number go to the models
+    select_metrics = None
+    if prefilter:
+        select_metrics = relevance_prefilter.RelevanceFilter(cfg.METRIC_SYNONYMS, threshold=cfg.PREFILTER_THRESHOLD)
+
+    # Optional keyword-centred context windows for long paragraphs and tables
+    select_context = None
+    if context:
+        select_context = context_window.ContextSelector(cfg.METRIC_SYNONYMS, max_chars=llm_extractor.MAX_PROMPT_CHARS,
+                                                        window=cfg.CONTEXT_WINDOW_CHARS)
+
+    # Optional persistent LLM response cache
+    cache = None
+    if llm_cache_path:
+        cache = llm_cache.ResponseCache(llm_cache_path, max_bytes=cfg.LLM_CACHE_MAX_MB << 20, ttl=cfg.LLM_CACHE_TTL)
 
-    for comp, paras in company_paragraphs.items():
-        print(f'Running extraction for company {comp} on {len(paras)} paragraphs...')
-        res = llm_extractor.extract_metrics(paras, metrics, workers=max_workers)
-        # attach company tag
-        for r in res:
-            r['company'] = comp
-        extractor_results.extend(res)
+    # Per-provider rate limits, retry with backoff and adaptive concurrency
+    limits = cfg.PROVIDER_LIMITS if rate_limit else None
 
+    # Mock clients for this run only (passed to the extractor, not via the environment, so
+    # concurrent server jobs do not affect each other); without any API key the extractor is mock anyway
+    mock = bool(mock_extractor) or not llm_extractor.api_keys_configured()
+
+    # Company names and aliases -> one multi-pattern automaton, built once
+    matcher = build_company_matcher(companies)
+
+    # Optional run store: reuse finished (document, paragraph, metric, model) calls from earlier runs
+    store = None
+    if run_store:
+        docs = [pdf_parser._file_sha256(p) for p in pdf_files]
+        store = checkpoint = extraction_store.RunStore(run_store, docs, call_version(parser_engine, mock))
+
+    parsed_path = cfg.PARSED_JSON.format(output_dir=output_dir)
     ext_path = cfg.EXTRACTIONS_JSON.format(output_dir=output_dir)
-    save_json(extractor_results, ext_path)
-    print(f'Extraction results saved to {ext_path} (rows={len(extractor_results)})')
+    merged_path = cfg.MERGED_JSON.format(output_dir=output_dir)
+    para_writer = row_writer = None
+    if jsonl_output:
+        # Streamed outputs: records are appended as produced instead of dumped at the end of each stage
+        parsed_path, ext_path, merged_path = (jsonl.jsonl_path(p, jsonl_gzip) for p in (parsed_path, ext_path, merged_path))
+        para_writer = jsonl.JsonlWriter(parsed_path)
+        row_writer = jsonl.JsonlWriter(ext_path)
+
+    t0 = time.perf_counter()
+    if stream:
+        # 1-3) Parse and extract concurrently
+        all_paragraphs, extractor_results = parse_and_extract_streaming(
+            pdf_files, matcher, metrics, max_workers, parse_workers, parse_cache_dir, max_pending, batch_metrics,
+            select_metrics, cache, async_extract, limits, cascade, pack_paragraphs,
+            select_context, progress, checkpoint, para_writer, row_writer, parser_engine, mock)
+        telemetry.observe('stage_seconds', time.perf_counter() - t0, stage='parse_extract')
+        if para_writer is None:
+            all_paragraphs, parsed_path = save_records(all_paragraphs, parsed_path, output_format)
+        print(f'Parsed paragraphs saved to {parsed_path} (count={len(all_paragraphs)})')
+    else:
+        # 1) Parse PDFs
+        if progress:
+            progress('parse', total=len(pdf_files))
+        all_paragraphs = parse_pdfs(pdf_files, parse_workers, parse_cache_dir, para_writer, parser_engine)
+        telemetry.observe('stage_seconds', time.perf_counter() - t0, stage='parse')
+        if para_writer is None:
+            all_paragraphs, parsed_path = save_records(all_paragraphs, parsed_path, output_format)
+        print(f'Parsed paragraphs saved to {parsed_path} (count={len(all_paragraphs)})')
+
+        # 2) For each company, select paragraphs mentioning company
+        if para_writer is not None:
+            # a single pass over parsed.jsonl tags the paragraphs of all companies (items carry their company)
+            company_paragraphs = {None: iter_company_items(all_paragraphs, matcher)}
+        else:
+            company_paragraphs = select_company_paragraphs(all_paragraphs, companies, matcher)
+
+        # 3) Call extractor for each company's paragraphs
+        t0 = time.perf_counter()
+        extractor_results = records.RecordTable()
+        for i, (comp, paras) in enumerate(company_paragraphs.items()):
+            if progress:
+                progress('extract', company=comp, done=i, total=len(company_paragraphs))
+            n_paras = len(paras) if hasattr(paras, '__len__') else None
+            label = f'company {comp}' if comp is not None else f'{len(matcher)} companies'
+            print(f'Running extraction for {label}' + (f' on {n_paras} paragraphs' if n_paras is not None else '') + '...')
+
+            def emit(r, comp=comp):
+                # attach company tag
+                if comp is not None:
+                    r['company'] = comp
+                if row_writer is not None:
+                    row_writer.write(r)
+                else:
+                    extractor_results.append(r)
+
+            with tracing.span('extract_company', company=comp, paragraphs=n_paras):
+                if async_extract:
+                    asyncio.run(llm_extractor.extract_metrics_async(
+                        paras, metrics, concurrency=cfg.ASYNC_CONCURRENCY, batch_metrics=batch_metrics,
+                        select_metrics=select_metrics, cache=cache, limits=limits, cascade=cascade,
+                        pack_paragraphs=pack_paragraphs, select_context=select_context, checkpoint=checkpoint,
+                        on_row=emit, mock=mock))
+                else:
+                    for r in llm_extractor.iter_extract_metrics(paras, metrics, workers=max_workers, batch_metrics=batch_metrics,
+                                                                select_metrics=select_metrics, cache=cache, limits=limits,
+                                                                cascade=cascade, pack_paragraphs=pack_paragraphs,
+                                                                select_context=select_context, checkpoint=checkpoint,
+                                                                mock=mock):
+                        emit(r)
+        telemetry.observe('stage_seconds', time.perf_counter() - t0, stage='extract')
+
+    if select_metrics is not None:
+        print(f'Relevance {select_metrics.summary()}')
+    if select_context is not None:
+        print(f'Prompt {select_context.summary()}')
+    if limits and ratelimit.guards_summary():
+        print(f'Rate limiting: {ratelimit.guards_summary()}')
+    if checkpoint is not None:
+        print(checkpoint.summary())
+    if store is not None:
+        store.close()
+    if cache is not None:
+        print(cache.summary())
+        cache.close()
+
+    if row_writer is not None:
+        row_writer.close()
+        n_rows = row_writer.count
+    else:
+        extractor_results, ext_path = save_records(extractor_results, ext_path, output_format)
+        n_rows = len(extractor_results)
+    print(f'Extraction results saved to {ext_path} (rows={n_rows})')
 
     
     # 4) Merge per company/metric/paragraph
-    merged = results_merger.merge_results(extractor_results)
-    merged_path = cfg.MERGED_JSON.format(output_dir=output_dir)
-    save_json(merged, merged_path)
-    print(f'Merged results saved to {merged_path} (items={len(merged)})')
+    if progress:
+        progress('merge', rows=n_rows)
+    company_maps = {}
+    merge_columnar = None
+    if merge_engine == 'columnar':
+        # pandas is only needed for this engine
+        from tools import merge_columnar
+    with telemetry.timer('stage_seconds', stage='merge'), tracing.span('merge', rows=n_rows, engine=merge_engine):
+        if jsonl_output:
+            # merge from disk and pick each company's best item per metric in the same pass
+            merge_bucket = merge_columnar.merge_rows if merge_columnar else None
+            with jsonl.JsonlWriter(merged_path) as w:
+                for m in results_merger.iter_merge_jsonl(ext_path, tmp_dir=output_dir, merge_bucket=merge_bucket):
+                    w.write(m)
+                    aggregate_merged_for_company([m], company_maps.setdefault(m.get('company') or 'Unknown', {}))
+            n_merged = w.count
+        elif merge_columnar:
+            frame = merge_columnar.merge_frame(extractor_results)
+            merged = merge_columnar.to_records(frame)
+            company_maps = merge_columnar.best_by_company(frame)
+            n_merged = len(merged)
+        else:
+            merged = results_merger.merge_results(extractor_results)
+            n_merged = len(merged)
+    if not jsonl_output:
+        _, merged_path = save_records(merged, merged_path, output_format)
+    print(f'Merged results saved to {merged_path} (items={n_merged})')
 
     # 5) Aggregate into final company -> metric -> entry
+    if progress:
+        progress('aggregate', merged=n_merged)
+    t0 = time.perf_counter()
     final = {}
-    # group merged by company
-    by_company = defaultdict(list)
-    for m in merged:
-        comp = m.get('company') or 'Unknown'
-        by_company[comp].append(m)
-
+    if not jsonl_output and not merge_columnar:
+        # group merged by company
+        by_company = defaultdict(list)
+        for m in merged:
+            comp = m.get('company') or 'Unknown'
+            by_company[comp].append(m)
+        company_maps = {comp: aggregate_merged_for_company(items) for comp, items in by_company.items()}
+
+    # bbox of the paragraphs that made it into the final output only
+    wanted = {(item.get("page_id"), item.get("para_id")) for metric_map in company_maps.values() for item in metric_map.values()}
     para_bbox_map = {
         (p.get("page_id"), p.get("para_id")): p.get("bbox")
         for p in all_paragraphs
         if p.get("page_id") is not None and p.get("para_id") is not None
+        and (p.get("page_id"), p.get("para_id")) in wanted
     }
-  
-   for comp, items in by_company.items():
-        metric_map = aggregate_merged_for_company(items)
+
+    for comp, metric_map in company_maps.items():
         # transform into desired JSON shape: metric -> {value, unit, year, type, confidence, source}
         final_map = {}
         for metric, item in metric_map.items():
@@ -174,25 +548,109 @@ def run_pipeline(pdf_files: List[str], companies: List[str], metrics: List[str],
             }
         final[comp] = final_map
 
+    telemetry.observe('stage_seconds', time.perf_counter() - t0, stage='aggregate')
+
     final_path = cfg.FINAL_JSON.format(output_dir=output_dir)
     save_json(final, final_path)
     print(f'Final aggregated company metrics written to {final_path}')
 
+    # 6) Run metrics (stage timings, per-model calls/latency/errors, OCR and parse counters)
+    if write_metrics:
+        metrics_path = cfg.RUN_METRICS_JSON.format(output_dir=output_dir)
+        save_json(telemetry.snapshot(), metrics_path)
+        print(f'Run metrics written to {metrics_path}')
+
     return final
 
 
 if __name__ == '__main__':
     ap = argparse.ArgumentParser()
     ap.add_argument('--pdf', nargs='+', help='PDF file(s) to process')
+    ap.add_argument('--companies_file', default=cfg.COMPANIES_FILE, help='Company list (`canonical,alias,...` lines or JSON {name: [aliases]}) replacing config.COMPANIES')
     ap.add_argument('--output_dir', default='./output')
     ap.add_argument('--mock', action='store_true', help='Use mock extractor (no API keys)')
+    ap.add_argument('--parse_workers', type=int, default=cfg.PARSE_WORKERS, help='Worker processes for page-parallel PDF parsing')
+    ap.add_argument('--parse_cache_dir', default=cfg.PARSE_CACHE_DIR, help='On-disk parse cache directory')
+    ap.add_argument('--no_parse_cache', action='store_true', help='Disable the on-disk parse cache')
+    ap.add_argument('--parser_engine', choices=list(pdf_parser.ENGINES), default=cfg.PARSER_ENGINE,
+                    help='PDF backend: pdfplumber, fitz (PyMuPDF only, faster; OCR only on scanned pages / content images) or auto')
+    ap.add_argument('--stream', action='store_true', default=cfg.STREAM_PIPELINE, help='Overlap parsing and LLM extraction')
+    ap.add_argument('--max_pending', type=int, default=cfg.STREAM_MAX_PENDING, help='Max queued/in-flight LLM calls in streaming mode')
+    ap.add_argument('--batch_metrics', action='store_true', default=cfg.BATCH_METRICS, help='Ask for all metrics in one prompt per paragraph and model')
+    ap.add_argument('--prefilter', action='store_true', default=cfg.PREFILTER_ENABLED, help='Skip (paragraph, metric) pairs without a metric synonym and a number')
+    ap.add_argument('--async_extract', action='store_true', default=cfg.ASYNC_EXTRACT, help='Use the asyncio extraction engine with pooled HTTP connections')
+    ap.add_argument('--cascade', action='store_true', default=cfg.CASCADE, help='Call the secondary model only when the primary finds a value or is unsure')
+    ap.add_argument('--pack_paragraphs', action='store_true', default=cfg.PACK_PARAGRAPHS, help='Pack consecutive short paragraphs into one prompt')
+    ap.add_argument('--context_window', action='store_true', default=cfg.CONTEXT_WINDOW, help='Send only keyword windows / matching table rows of long paragraphs')
+    ap.add_argument('--no_rate_limit', action='store_true', help='Disable per-provider rate limiting and retries')
+    ap.add_argument('--llm_cache', default=cfg.LLM_CACHE_PATH, help='SQLite file for the LLM response cache')
+    ap.add_argument('--no_llm_cache', action='store_true', help='Disable the LLM response cache')
+    ap.add_argument('--jsonl_output', action='store_true', default=cfg.JSONL_OUTPUT, help='Append paragraphs/extraction rows/merged items to JSONL as produced and merge from disk')
+    ap.add_argument('--jsonl_gzip', action='store_true', default=cfg.JSONL_GZIP, help='Gzip the JSONL outputs (.jsonl.gz)')
+    ap.add_argument('--output_format', choices=['json', 'parquet', 'arrow'], default=cfg.OUTPUT_FORMAT, help='Format of parsed/extractions/merged outputs (parquet/arrow need pyarrow)')
+    ap.add_argument('--merge_engine', choices=['dict', 'columnar'], default=cfg.MERGE_ENGINE, help='Vote with per-group dicts or with grouped pandas/numpy operations')
+    ap.add_argument('--run_store', default=cfg.RUN_STORE_PATH, help='SQLite file of finished extraction calls reused across runs (only new metric/company/model combinations are sent)')
+    ap.add_argument('--no_run_store', action='store_true', help='Disable the run store')
+    ap.add_argument('--corpus', metavar='DIR_OR_MANIFEST', help='Process a directory / manifest of PDFs with resumable progress (see corpus.py)')
+    ap.add_argument('--corpus_workers', type=int, default=cfg.CORPUS_WORKERS, help='PDFs processed in parallel in corpus mode')
+    ap.add_argument('--trace', metavar='OUT_JSON', help='Write a Chrome/Perfetto trace of the run to this file')
+    ap.add_argument('--profile', nargs='?', const='cprofile', choices=['cprofile', 'sample'],
+                    help='Profile the run (cProfile of the main thread, or sampling of all threads) and write <output_dir>/profile.txt')
     args = ap.parse_args()
 
-    pdfs = load_pdf_list(args.pdf)
+    pdfs = [] if args.corpus else load_pdf_list(args.pdf)
+    cfg.COMPANIES = load_companies(args.companies_file)
     cfg.PDF_FILES = pdfs
     cfg.PARSED_JSON = cfg.PARSED_JSON
     cfg.EXTRACTIONS_JSON = cfg.EXTRACTIONS_JSON
     cfg.MERGED_JSON = cfg.MERGED_JSON
     cfg.FINAL_JSON = cfg.FINAL_JSON
 
-    run_pipeline(pdfs, cfg.COMPANIES, cfg.METRICS, args.output_dir, mock_extractor=(args.mock or cfg.MOCK_EXTRACTOR), max_workers=cfg.MAX_WORKERS)
+    if args.trace:
+        tracing.start()
+    profiler = None
+    if args.profile == 'cprofile':
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    elif args.profile == 'sample':
+        profiler = tracing.SamplingProfiler()
+        profiler.start()
+
+    pipeline_opts = dict(mock_extractor=(args.mock or cfg.MOCK_EXTRACTOR), max_workers=cfg.MAX_WORKERS, parse_workers=args.parse_workers,
+                         parse_cache_dir=None if args.no_parse_cache else args.parse_cache_dir,
+                         stream=args.stream, max_pending=args.max_pending,
+                         batch_metrics=args.batch_metrics, prefilter=args.prefilter,
+                         llm_cache_path=None if args.no_llm_cache else args.llm_cache,
+                         async_extract=args.async_extract, rate_limit=not args.no_rate_limit,
+                         cascade=cfg.CASCADE_PRIMARY if args.cascade else None,
+                         pack_paragraphs=args.pack_paragraphs, context=args.context_window,
+                         jsonl_output=args.jsonl_output, jsonl_gzip=args.jsonl_gzip, merge_engine=args.merge_engine,
+                         output_format=args.output_format, parser_engine=args.parser_engine,
+                         run_store=None if args.no_run_store else args.run_store)
+    if args.corpus:
+        import corpus
+        corpus.run_corpus(args.corpus, args.output_dir, workers=args.corpus_workers, **pipeline_opts)
+    else:
+        run_pipeline(pdfs, cfg.COMPANIES, cfg.METRICS, args.output_dir, **pipeline_opts)
+
+    if profiler is not None:
+        ensure_output_dir(args.output_dir)
+        report_path = os.path.join(args.output_dir, 'profile.txt')
+        if args.profile == 'cprofile':
+            import io
+            import pstats
+            profiler.disable()
+            profiler.dump_stats(os.path.join(args.output_dir, 'profile.prof'))
+            buf = io.StringIO()
+            pstats.Stats(profiler, stream=buf).sort_stats('cumulative').print_stats(60)
+            report = buf.getvalue()
+        else:
+            profiler.stop()
+            report = profiler.report()
+        with open(report_path, 'w', encoding='utf-8') as f:
+            f.write(report)
+        print(f'Profile report written to {report_path}')
+    if args.trace:
+        tracing.save(args.trace)
+        print(f'Trace written to {args.trace} (open in chrome://tracing or ui.perfetto.dev)')
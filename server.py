@@ -1,34 +1,93 @@
-from flask import Flask, send_from_directory, jsonify, request
-import subprocess
+from flask import Flask, Response, send_from_directory, jsonify, request
+import json
 import os
 
+import config as cfg
+from jobs import JobManager, QueueFull
+from tools import telemetry
+
 app = Flask(__name__, static_folder='frontend/dist', static_url_path='')
 
+# 抽取任务在进程内线程池中执行，每个任务独立输出目录
+jobs = JobManager(workers=cfg.SERVER_JOB_WORKERS, max_queued=cfg.SERVER_MAX_QUEUED, jobs_dir=cfg.SERVER_JOBS_DIR)
+
 # 路由：主页（前端）
 @app.route('/')
 def index():
     return send_from_directory(app.static_folder, 'index.html')
 
-# 路由：API - 调用 main.py 进行指标抽取
+def _read_json(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+# 路由：API - 提交抽取任务，立即返回任务 ID
+@app.route('/api/jobs', methods=['POST'])
 @app.route('/api/extract', methods=['POST'])
-def extract():
-    pdf_path = request.json.get("pdf_path")
-    output_dir = "./output"
-    if not pdf_path or not os.path.exists(pdf_path):
-        return jsonify({"error": "PDF not found"}), 400
-    subprocess.run(["python", "main.py", "--pdf", pdf_path, "--output_dir", output_dir])
-    return jsonify({"status": "ok", "result": os.path.join(output_dir, "final.json")})
-
-# 路由：返回最新抽取结果
+def submit_job():
+    body = request.get_json(silent=True) or {}
+    pdf_paths = body.get("pdf_paths") or ([body["pdf_path"]] if body.get("pdf_path") else [])
+    missing = [p for p in pdf_paths if not os.path.exists(p)]
+    if not pdf_paths or missing:
+        return jsonify({"error": "PDF not found", "missing": missing}), 400
+    try:
+        job_id = jobs.submit(pdf_paths, body.get("options"))
+    except QueueFull as e:
+        return jsonify({"error": f"Queue full: {e}"}), 503
+    return jsonify({"job_id": job_id, "status": "queued", "status_url": f"/api/jobs/{job_id}",
+                    "result_url": f"/api/jobs/{job_id}/result"}), 202
+
+# 路由：任务列表 / 单个任务状态与进度
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    return jsonify(jobs.list())
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    st = jobs.status(job_id)
+    if st is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(st)
+
+# 路由：取消任务（排队中直接取消，运行中在下一个阶段边界停止）
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    st = jobs.cancel(job_id)
+    if st is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(st)
+
+# 路由：任务结果（final_company_metrics.json）
+@app.route('/api/jobs/<job_id>/result')
+def job_result(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    if job.status != "done":
+        return jsonify({"error": f"Job is {job.status}", "status": job.status}), 409
+    return jsonify(_read_json(job.result_path))
+
+# 路由：返回最新抽取结果（最近完成的任务；没有任务时读命令行运行的 ./output）
 @app.route('/api/result')
 def get_result():
+    job = jobs.latest_done()
+    path = job.result_path if job else cfg.FINAL_JSON.format(output_dir=cfg.OUTPUT_DIR)
     try:
-        with open("./output/final.json", "r", encoding="utf-8") as f:
-            data = f.read()
-        return data
+        return jsonify(_read_json(path))
     except Exception:
         return jsonify({"error": "No result yet"}), 404
 
+# 路由：运行指标（Prometheus 文本格式）。服务端跑过任务时输出进程内累计值，否则读最近一次命令行运行的 metrics.json
+@app.route('/metrics')
+def metrics():
+    snap = telemetry.snapshot()
+    if not snap["counters"] and not snap["histograms"]:
+        try:
+            snap = _read_json(cfg.RUN_METRICS_JSON.format(output_dir=cfg.OUTPUT_DIR))
+        except Exception:
+            snap = {}
+    return Response(telemetry.render_prometheus(snap), mimetype="text/plain; version=0.0.4")
+
 # 静态文件（前端打包后）
 @app.route('/<path:path>')
 def static_proxy(path):
@@ -0,0 +1,106 @@
+# 抽取调用断点续跑
+
+# path: tools/checkpoint.py
+"""
+Append-only record of finished LLM calls, used to resume an interrupted run.
+
+Every successful extraction row is appended to a JSONL file as soon as its
+call returns, keyed on (page_id, para_id, metric, model). When the same file
+is opened again, the extractor asks `lookup()` before building each call and
+replays the stored row instead of calling the model; error rows are never
+stored, so failed calls are retried. A torn last line (process killed
+mid-write) is cut off when the file is reopened.
+
+The first line is a header record {"version": ...} (prompt version, parse
+variant, mock flag, as for tools.run_store): para ids and answers only carry
+over between runs with the same version, so a file written under another
+version (or without a header) is emptied when it is opened.
+
+Usage:
+    ckpt = CallCheckpoint("./output/doc/calls.jsonl", version)
+    extractor.extract_metrics(paras, metrics, checkpoint=ckpt)
+    ckpt.close()
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import threading
+from typing import Dict, Any, Optional, Tuple
+
+Key = Tuple[Any, Any, str, str]
+
+
+class CallCheckpoint:
+    def __init__(self, path: str, version: str):
+        self.path = path
+        self.version = version
+        self.replayed = 0
+        self.recorded = 0
+        self._rows: Dict[Key, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        if os.path.exists(path):
+            self._load(path)
+        self._f = open(path, "a", encoding="utf-8")
+        if self._f.tell() == 0:
+            self._f.write(json.dumps({"version": version}, ensure_ascii=False) + "\n")
+            self._f.flush()
+
+    def _load(self, path: str) -> None:
+        with open(path, "rb+") as f:
+            data = f.read()
+            end = data.rfind(b"\n") + 1
+            if end < len(data):
+                # 上次写到一半被中断：截掉残行，新记录从完整行之后追加
+                f.truncate(end)
+            lines = data[:end].decode("utf-8").splitlines()
+            try:
+                header = json.loads(lines[0]) if lines else {}
+            except ValueError:
+                header = {}
+            if header.get("version") != self.version:
+                # 其他版本（提示词/解析变体/mock）写下的记录：段落编号和答案都对不上，整个文件作废
+                f.truncate(0)
+                return
+        for line in lines[1:]:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue
+            self._rows[self._key(row, row.get("metric"), row.get("model"))] = row
+
+    @staticmethod
+    def _key(para: Dict[str, Any], metric: str, model: str) -> Key:
+        return (para.get("page_id"), para.get("para_id"), metric, model)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def lookup(self, para: Dict[str, Any], metric: str, model: str) -> Optional[Dict[str, Any]]:
+        row = self._rows.get(self._key(para, metric, model))
+        if row is not None:
+            self.replayed += 1
+        return row
+
+    def record(self, row: Dict[str, Any]) -> None:
+        if row.get("error") or not row.get("metric") or not row.get("model"):
+            return
+        key = self._key(row, row["metric"], row["model"])
+        with self._lock:
+            if key in self._rows:
+                return
+            self._rows[key] = row
+            self._f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            self._f.flush()
+            self.recorded += 1
+
+    def summary(self) -> str:
+        return f"checkpoint {self.path}: {self.replayed} calls replayed, {self.recorded} recorded"
+
+    def close(self) -> None:
+        with self._lock:
+            self._f.close()
@@ -0,0 +1,152 @@
+# 公司名多模式匹配（Aho-Corasick）
+
+# path: tools/company_matcher.py
+"""
+Find every company mentioned in a paragraph in one pass over the text.
+
+An Aho-Corasick automaton is built once from all canonical company names and
+their aliases (short names, full legal names, English names); `find(text)`
+walks the text once, whatever the number of companies, and returns the
+canonical names of all companies whose name or any alias occurs (overlapping
+and nested matches included). Uses the C implementation from pyahocorasick
+(`pip install pyahocorasick`) when it is installed, otherwise a pure-Python
+automaton with the same results.
+
+Usage:
+    m = CompanyMatcher(["招商证券"], aliases={"招商证券": ["招商证券股份有限公司", "CMS"]})
+    m.find("招商证券股份有限公司2023年...")   # -> ["招商证券"]
+
+Large issuer lists can be kept in a file (see load_company_file): one company
+per line as `canonical,alias1,alias2,...`, or a JSON object
+{canonical: [aliases]}.
+"""
+
+from __future__ import annotations
+
+import json
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import ahocorasick
+except Exception:
+    ahocorasick = None
+
+
+class CompanyMatcher:
+    def __init__(self, companies: List[str], aliases: Optional[Dict[str, List[str]]] = None,
+                 ignore_case: bool = False, use_native: bool = True):
+        self.companies = list(dict.fromkeys(companies))
+        self.ignore_case = ignore_case
+        aliases = aliases or {}
+        self._names: List[List[str]] = []
+        patterns: Dict[str, set] = {}
+        for i, comp in enumerate(self.companies):
+            names = [n for n in dict.fromkeys([comp] + list(aliases.get(comp) or [])) if n]
+            self._names.append(names)
+            for n in names:
+                patterns.setdefault(self._fold(n), set()).add(i)
+        self._patterns = patterns
+        self._native = None
+        if use_native and ahocorasick is not None and patterns:
+            a = ahocorasick.Automaton()
+            for pat, idxs in patterns.items():
+                a.add_word(pat, (len(pat), tuple(sorted(idxs))))
+            a.make_automaton()
+            self._native = a
+        else:
+            self._build(patterns)
+
+    def _fold(self, s: str) -> str:
+        return s.lower() if self.ignore_case else s
+
+    def _build(self, patterns: Dict[str, set]) -> None:
+        # goto 表 / 失败指针 / 每个状态的输出（沿失败链合并，匹配时无需再回溯）
+        goto: List[Dict[str, int]] = [{}]
+        out: List[List[Tuple[int, Tuple[int, ...]]]] = [[]]
+        for pat, idxs in patterns.items():
+            s = 0
+            for ch in pat:
+                nxt = goto[s].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[s][ch] = nxt
+                    goto.append({})
+                    out.append([])
+                s = nxt
+            out[s].append((len(pat), tuple(sorted(idxs))))
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            s = queue.popleft()
+            for ch, t in goto[s].items():
+                queue.append(t)
+                f = fail[s]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[t] = goto[f].get(ch, 0)
+                out[t] = out[t] + out[fail[t]]
+        self._goto, self._fail, self._out = goto, fail, out
+
+    def _iter(self, text: str):
+        """Yield (end index exclusive, pattern length, company indexes) for every occurrence."""
+        text = self._fold(text)
+        if self._native is not None:
+            for end, (n, idxs) in self._native.iter(text):
+                yield end + 1, n, idxs
+            return
+        goto, fail, out = self._goto, self._fail, self._out
+        s = 0
+        for pos, ch in enumerate(text):
+            while s and ch not in goto[s]:
+                s = fail[s]
+            s = goto[s].get(ch, 0)
+            if out[s]:
+                for n, idxs in out[s]:
+                    yield pos + 1, n, idxs
+
+    def find(self, text: str) -> List[str]:
+        """Canonical names of all companies mentioned in text, in the order of `companies`."""
+        if not text or not self._patterns:
+            return []
+        hit = set()
+        for _, _, idxs in self._iter(text):
+            hit.update(idxs)
+        return [self.companies[i] for i in sorted(hit)]
+
+    def find_spans(self, text: str) -> List[Tuple[int, int, str, str]]:
+        """Every occurrence as (start, end, matched text, canonical name), ordered by position."""
+        spans = []
+        for end, n, idxs in self._iter(text or ""):
+            for i in idxs:
+                spans.append((end - n, end, text[end - n:end], self.companies[i]))
+        spans.sort(key=lambda x: (x[0], -x[1]))
+        return spans
+
+    def names(self, company: str) -> List[str]:
+        """The canonical name followed by its aliases."""
+        try:
+            return list(self._names[self.companies.index(company)])
+        except ValueError:
+            return [company]
+
+    def __len__(self) -> int:
+        return len(self.companies)
+
+
+def load_company_file(path: str) -> Tuple[List[str], Dict[str, List[str]]]:
+    """Read (companies, aliases) from a JSON object {canonical: [aliases]} or `canonical,alias,...` lines."""
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".json"):
+            data = json.load(f)
+            return list(data), {k: list(v or []) for k, v in data.items()}
+        companies, aliases = [], {}
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            parts = [x.strip() for x in line.split(",") if x.strip()]
+            companies.append(parts[0])
+            if parts[1:]:
+                aliases.setdefault(parts[0], []).extend(parts[1:])
+        return companies, aliases
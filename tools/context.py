@@ -0,0 +1,151 @@
+# 关键词上下文窗口：只把指标附近的文本送进 prompt
+
+# path: tools/context.py
+"""
+Keyword-centred context selection for the LLM prompts.
+
+Paragraphs that fit in the prompt budget are sent unchanged. For longer ones,
+instead of keeping the head and tail, the prompt is built from:
+
+- text paragraphs: a window of `window` characters around each hit of a metric
+  synonym (config.METRIC_SYNONYMS; OCR spacing like "营 业 收 入" still matches),
+  widened so that numbers crossing the window edge are not cut. Windows with a
+  number nearby are kept first; the rest fill the remaining budget.
+- table paragraphs (`raw_table` present): the first `header_rows` rows plus
+  every row with a synonym in one of its cells, in table order.
+
+When nothing matches, the old head/tail truncation is used.
+
+Usage:
+    ctx = ContextSelector(cfg.METRIC_SYNONYMS, max_chars=3500)
+    extract_metrics(paras, metrics, select_context=ctx)
+    print(ctx.summary())
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Dict, List, Optional, Any, Tuple
+
+# 默认长度上限与首尾截断（找不到关键词时的回退）都沿用 extractor 的，只在一处定义
+try:
+    from tools.extractor import MAX_PROMPT_CHARS as DEFAULT_MAX_CHARS, _truncate_text as truncate
+except Exception:
+    from extractor import MAX_PROMPT_CHARS as DEFAULT_MAX_CHARS, _truncate_text as truncate
+
+WINDOW = 150
+HEADER_ROWS = 2
+GAP = "\n...\n"
+
+_NUM_RE = re.compile(r"\d+(?:[,，]\d{3})*(?:\.\d+)?%?")
+
+
+def _merge(spans: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    out: List[Tuple[int, int]] = []
+    for s, e in sorted(spans):
+        if out and s <= out[-1][1]:
+            out[-1] = (out[-1][0], max(out[-1][1], e))
+        else:
+            out.append((s, e))
+    return out
+
+
+class ContextSelector:
+    """
+    Callable `(para, metrics) -> str` for extractor.extract_metrics(select_context=...).
+
+    Returns the text to put in the prompt for the given metrics and keeps
+    character counts (before/after) for the run summary.
+    """
+
+    def __init__(self, synonyms: Optional[Dict[str, List[str]]] = None, max_chars: int = DEFAULT_MAX_CHARS,
+                 window: int = WINDOW, header_rows: int = HEADER_ROWS):
+        self.synonyms = synonyms or {}
+        self.max_chars = max_chars
+        self.window = window
+        self.header_rows = header_rows
+        self.chars_in = 0
+        self.chars_out = 0
+        self.windowed = 0
+        self._patterns: Dict[str, re.Pattern] = {}
+
+    def pattern(self, metric: str) -> re.Pattern:
+        pat = self._patterns.get(metric)
+        if pat is None:
+            syns = list(self.synonyms.get(metric) or [])
+            if metric not in syns:
+                syns.append(metric)
+            # 长的同义词优先；字符之间允许空白（OCR 常把汉字拆开）
+            alts = [r"\s*".join(map(re.escape, s)) for s in sorted(syns, key=len, reverse=True) if s]
+            pat = self._patterns[metric] = re.compile("|".join(alts))
+        return pat
+
+    def __call__(self, para: Dict[str, Any], metrics: List[str]) -> str:
+        text = para.get("text") or ""
+        self.chars_in += len(text)
+        if len(text) <= self.max_chars:
+            out = text
+        else:
+            pats = [self.pattern(m) for m in metrics]
+            out = None
+            if para.get("raw_table"):
+                out = self._table_context(para["raw_table"], pats)
+            if out is None:
+                out = self._text_context(text, pats)
+            if out is None:
+                out = truncate(text, self.max_chars)
+            else:
+                self.windowed += 1
+        self.chars_out += len(out)
+        return out
+
+    def _text_context(self, text: str, pats: List[re.Pattern]) -> Optional[str]:
+        hits = [(m.start(), m.end()) for p in pats for m in p.finditer(text)]
+        if not hits:
+            return None
+        nums = [(m.start(), m.end()) for m in _NUM_RE.finditer(text)]
+        windows = []
+        for s, e in hits:
+            ws, we = max(0, s - self.window), min(len(text), e + self.window)
+            near = False
+            for ns, ne in nums:
+                if ne > ws and ns < we:
+                    near = True
+                    # 数字跨过窗口边界时把整个数字包进来
+                    ws, we = min(ws, ns), max(we, ne)
+            windows.append((not near, ws, we))
+        # 附近有数字的窗口优先占用预算，输出时仍按原文顺序
+        chosen: List[Tuple[int, int]] = []
+        for _, ws, we in sorted(windows):
+            merged = _merge(chosen + [(ws, we)])
+            cost = sum(e - s for s, e in merged) + len(GAP) * (len(merged) - 1)
+            if cost > self.max_chars:
+                continue
+            chosen = merged
+        if not chosen:
+            return None
+        return GAP.join(text[s:e] for s, e in chosen)
+
+    def _table_context(self, rows: List[List[str]], pats: List[re.Pattern]) -> Optional[str]:
+        lines = [(i, " | ".join((c or "").strip() for c in r)) for i, r in enumerate(rows)
+                 if any((c or "").strip() for c in r)]
+        header = lines[: self.header_rows]
+        matched = [(i, line) for i, line in lines[self.header_rows:] if any(p.search(line) for p in pats)]
+        if not matched:
+            return None
+        out: List[str] = []
+        used = 0
+        prev = None
+        for i, line in header + matched:
+            piece = line if prev is None or i == prev + 1 else "..." + "\n" + line
+            if used + len(piece) + 1 > self.max_chars:
+                break
+            out.append(piece)
+            used += len(piece) + 1
+            prev = i
+        return "\n".join(out) if len(out) > len(header) else None
+
+    def summary(self) -> str:
+        rate = self.chars_out / self.chars_in if self.chars_in else 1.0
+        return (f"context windowing sent {self.chars_out}/{self.chars_in} chars ({rate:.1%}), "
+                f"{self.windowed} long paragraphs windowed")
@@ -5,6 +5,10 @@ Extractor module (updated for real APIs)
 - 支持智谱 GLM (通过 zai.ZhipuAiClient)
 - 支持讯飞星火 Spark (通过 v2/chat/completions)
 - 保持统一输出格式
+- 同步引擎：extract_metrics / iter_extract_metrics（线程池）
+- 异步引擎：extract_metrics_async（asyncio + 复用 keep-alive 连接的 httpx 连接池，
+  少量线程即可维持数百个在途请求；未安装 httpx 时退化为线程中执行同步 call）
+- 每次调用的次数/延迟/错误/prompt 与回复长度（有 usage 时为 token 数）记入 tools.telemetry
 """
 
 from __future__ import annotations
@@ -13,28 +17,71 @@ import os
 import time
 import json
 import re
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import List, Dict, Any, Optional
+import asyncio
+from contextvars import ContextVar
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Callable, Tuple
 
-import requests
+# 限流/重试/自适应并发
+try:
+    from tools import ratelimit
+except Exception:
+    import ratelimit
+
+# 运行指标
+try:
+    from tools import telemetry
+except Exception:
+    import telemetry
 
-# 智谱 SDK
+# 时间线（--trace）
 try:
-    from zai import ZhipuAiClient
+    from tools import tracing
 except Exception:
-    ZhipuAiClient = None
+    import tracing
+
+# requests / 智谱 zai SDK / httpx（可选）都在首次用到时才导入：
+# SparkClient、ZhipuClient 构建时，异步引擎建连接池时；--mock 运行与服务启动不加载
+_httpx: Any = False
+
+
+def _load_httpx():
+    """The httpx module, or None when it is not installed (imported on first use)."""
+    global _httpx
+    if _httpx is False:
+        try:
+            import httpx
+            _httpx = httpx
+        except Exception:
+            _httpx = None
+    return _httpx
 
 # ---------- 配置 ----------
+PROMPT_VERSION = "1"            # 改动 prompt 措辞或结果解析时加一：run_store 不会复用旧版本的结果
 MAX_PROMPT_CHARS = 3500
 DEFAULT_TEMPERATURE = 0.0
 CONCURRENCY = 6
 REQUEST_TIMEOUT = 30
+BATCH_TOKENS_PER_METRIC = 120   # 批量模式下按指标数放宽 max_tokens
+PACK_MAX_PARA_CHARS = 600       # 打包模式：不超过该长度的段落才参与打包
+PACK_MAX_PARAS = 20             # 打包模式：每个 prompt 最多段落数
+PACK_TOKENS_PER_ANSWER = 100    # 打包模式：每个 (段落, 指标) 答案预留的 max_tokens
 
 ZHIPU_API_KEY = os.getenv("ZHIPU_API_KEY","64f170d742a64de681b5c978d2f896ca.LykJN8uymnwNA0o6")
 SPARK_API_KEY = os.getenv("SPARK_API_KEY","jUKnJwaWgcKBuPzbJQOc:lKHUGblYvqXXIdryjDjv")
 SPARK_ENDPOINT = os.getenv("SPARK_ENDPOINT", "https://spark-api-open.xf-yun.com/v2/chat/completions")
+ZHIPU_ENDPOINT = os.getenv("ZHIPU_ENDPOINT", "https://open.bigmodel.cn/api/paas/v4/chat/completions")
+
+ASYNC_CONCURRENCY = 64          # 异步引擎的在途请求上限
+HTTP_POOL_SIZE = 100            # 连接池大小（keep-alive 连接数）
 
-MOCK_MODE = os.getenv("EXTRACTOR_MOCK", "0") 
+# extract_metrics_async 运行期间共享的 httpx.AsyncClient
+_ASYNC_HTTP: ContextVar[Any] = ContextVar("_ASYNC_HTTP", default=None)
+
+MOCK_MODE = os.getenv("EXTRACTOR_MOCK", "0") == "1"
+
+# 可替换的客户端工厂（如 bench.mock_llm 的模拟延迟客户端）；为 None 时按 MOCK_MODE / API key 构建
+CLIENT_FACTORY: Optional[Callable[[], List["BaseClient"]]] = None
 
 # ---------- 工具函数 ----------
 
@@ -56,26 +103,116 @@ def _build_prompt(paragraph_text: str, metric: str) -> str:
         "仅返回 JSON。"
     )
 
+
+def _build_batch_prompt(paragraph_text: str, metrics: List[str]) -> str:
+    """一次性抽取全部指标：返回以指标名为键的 JSON 对象。"""
+    p = _truncate_text(paragraph_text)
+    return (
+        f"请从下面的段落中分别抽取以下指标相关的数值信息：{json.dumps(metrics, ensure_ascii=False)}\n"
+        "返回严格的 JSON 对象，键为指标名，每个值是包含字段 value, unit, year, type, note 的对象。\n"
+        "某个指标没有相关信息时，其值为 {\"value\":\"\",\"unit\":\"\",\"year\":\"\",\"type\":\"\",\"note\":\"\"}。\n"
+        f"段落:\n{p}\n"
+        "仅返回 JSON。"
+    )
+
+def _text(para: Dict[str, Any], metrics: List[str], context: Optional[ContextSelector] = None) -> str:
+    """放进 prompt 的段落文本：有 context 选择器时只取指标相关的窗口。"""
+    if context is not None:
+        return context(para, metrics)
+    return para.get("text") or ""
+
+
+def _tag(para: Dict[str, Any]) -> str:
+    return f"P{para.get('page_id')}-{para.get('para_id')}"
+
+
+def _build_packed_prompt(items: List[Tuple[Dict[str, Any], List[str]]], metric: Optional[str] = None,
+                         metrics: Optional[List[str]] = None, context: Optional[ContextSelector] = None) -> str:
+    """多个短段落打包进一个 prompt，按段落编号返回结果；传 metrics 时同时抽取全部指标。"""
+    blocks = "\n".join(f"[{_tag(p)}] {_text(p, [metric] if metric else pm, context)}" for p, pm in items)
+    empty = "{\"value\":\"\",\"unit\":\"\",\"year\":\"\",\"type\":\"\",\"note\":\"\"}"
+    if metrics is not None:
+        ask = (
+            f"请从下面带编号的多个段落中，分别抽取每个段落里以下指标相关的数值信息：{json.dumps(metrics, ensure_ascii=False)}\n"
+            "返回严格的 JSON 对象，键为段落编号（如 \"P1-2\"），值是以指标名为键的对象，每个指标的值包含字段 value, unit, year, type, note。\n"
+            f"某段落没有某指标的信息时，该指标的值为 {empty}。\n"
+        )
+    else:
+        ask = (
+            f"请从下面带编号的多个段落中，分别抽取每个段落里与指标“{metric}”相关的数值信息。\n"
+            "返回严格的 JSON 对象，键为段落编号（如 \"P1-2\"），值是包含字段 value, unit, year, type, note 的对象。\n"
+            f"某段落没有相关信息时，其值为 {empty}。\n"
+        )
+    return ask + f"段落:\n{blocks}\n仅返回 JSON。"
+
 # ---------- 客户端实现 ----------
 
 class BaseClient:
     name: str = "base"
     def call(self, prompt: str, max_tokens: int = 300, temperature: float = DEFAULT_TEMPERATURE) -> Dict[str, Any]:
         raise NotImplementedError
+    async def acall(self, prompt: str, max_tokens: int = 300, temperature: float = DEFAULT_TEMPERATURE) -> Dict[str, Any]:
+        # 默认：在线程中执行同步 call
+        return await asyncio.to_thread(self.call, prompt, max_tokens, temperature)
 
 
 class MockClient(BaseClient):
     def __init__(self, name: str):
         self.name = name
     def call(self, prompt: str, max_tokens: int = 300, temperature: float = DEFAULT_TEMPERATURE) -> Dict[str, Any]:
-        return {"raw_text": json.dumps({"value":"100","unit":"亿元","year":"2023","type":"actual","note":"mock"},ensure_ascii=False), "latency":0.0, "ok":True}
+        ans = {"value":"100","unit":"亿元","year":"2023","type":"actual","note":"mock"}
+        m = re.search(r"以下指标相关的数值信息：(\[.*?\])", prompt)
+        if m:
+            ans = {metric: ans for metric in json.loads(m.group(1))}
+        tags = re.findall(r"^\[(P[^\]]+)\]", prompt, re.M)
+        if tags:
+            ans = {t: ans for t in tags}
+        return {"raw_text": json.dumps(ans,ensure_ascii=False), "latency":0.0, "ok":True}
+    async def acall(self, prompt: str, max_tokens: int = 300, temperature: float = DEFAULT_TEMPERATURE) -> Dict[str, Any]:
+        return self.call(prompt, max_tokens, temperature)
+
+
+async def _apost_chat(endpoint: str, headers: Dict[str, str], body: Dict[str, Any]) -> Dict[str, Any]:
+    """POST 到 chat/completions 接口，复用 extract_metrics_async 的连接池；返回 {raw_text, latency, ok}。"""
+    http = _ASYNC_HTTP.get()
+    t0 = time.time()
+    if http is None:
+        async with _new_async_http() as http:
+            r = await http.post(endpoint, headers=headers, json=body)
+    else:
+        r = await http.post(endpoint, headers=headers, json=body)
+    latency = time.time() - t0
+    r.raise_for_status()
+    data = r.json()
+    text = data.get("choices", [{}])[0].get("message", {}).get("content", "")
+    return {"raw_text": text, "latency": latency, "ok": True, "usage": _usage(data.get("usage"))}
+
+
+def _usage(u) -> Optional[Dict[str, int]]:
+    """接口返回的 token 用量（dict 或 SDK 对象），取不到时为 None。"""
+    if u is None:
+        return None
+    get = u.get if isinstance(u, dict) else lambda k: getattr(u, k, None)
+    pt, ct = get("prompt_tokens"), get("completion_tokens")
+    if pt is None and ct is None:
+        return None
+    return {"prompt_tokens": int(pt or 0), "completion_tokens": int(ct or 0)}
+
+
+def _new_async_http():
+    httpx = _load_httpx()
+    limits = httpx.Limits(max_connections=HTTP_POOL_SIZE, max_keepalive_connections=HTTP_POOL_SIZE)
+    return httpx.AsyncClient(limits=limits, timeout=REQUEST_TIMEOUT)
 
 
 class ZhipuClient(BaseClient):
     def __init__(self, api_key: str):
         self.name = "glm-4-plus"
-        if not ZhipuAiClient:
+        try:
+            from zai import ZhipuAiClient
+        except Exception:
             raise RuntimeError("zai SDK not installed")
+        self.api_key = api_key
         self.client = ZhipuAiClient(api_key=api_key)
     def call(self, prompt: str, max_tokens: int = 300, temperature: float = DEFAULT_TEMPERATURE) -> Dict[str, Any]:
         t0 = time.time()
@@ -87,23 +224,43 @@ class ZhipuClient(BaseClient):
         )
         latency = time.time() - t0
         text = resp.choices[0].message.content
-        return {"raw_text": text, "latency": latency, "ok": True}
+        return {"raw_text": text, "latency": latency, "ok": True, "usage": _usage(getattr(resp, "usage", None))}
+    async def acall(self, prompt: str, max_tokens: int = 300, temperature: float = DEFAULT_TEMPERATURE) -> Dict[str, Any]:
+        if _load_httpx() is None:
+            return await super().acall(prompt, max_tokens, temperature)
+        # zai SDK 只有同步接口，异步模式直接调用同一 HTTP 接口
+        headers = {"Authorization": f"Bearer {self.api_key}", "content-type": "application/json"}
+        body = {"model": "glm-4-plus", "messages":[{"role":"user","content":prompt}], "max_tokens": max_tokens, "temperature": temperature}
+        return await _apost_chat(ZHIPU_ENDPOINT, headers, body)
 
 
 class SparkClient(BaseClient):
     def __init__(self, api_key: str):
         self.name = "spark-4.0Ultra"
         self.api_key = api_key
-    def call(self, prompt: str, max_tokens: int = 300, temperature: float = DEFAULT_TEMPERATURE) -> Dict[str, Any]:
-        t0 = time.time()
+        import requests
+        from requests.adapters import HTTPAdapter
+        # 复用 keep-alive 连接，避免每次请求重新握手 TLS
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE))
+    def _request(self, prompt: str):
         headers = {"Authorization": f"Bearer {self.api_key}", "content-type": "application/json"}
         body = {"model": "4.0Ultra", "user": "user_id", "messages":[{"role":"user","content":prompt}], "stream": False}
-        r = requests.post(SPARK_ENDPOINT, headers=headers, json=body, timeout=REQUEST_TIMEOUT)
+        return headers, body
+    def call(self, prompt: str, max_tokens: int = 300, temperature: float = DEFAULT_TEMPERATURE) -> Dict[str, Any]:
+        t0 = time.time()
+        headers, body = self._request(prompt)
+        r = self.session.post(SPARK_ENDPOINT, headers=headers, json=body, timeout=REQUEST_TIMEOUT)
         latency = time.time() - t0
         r.raise_for_status()
         data = r.json()
         text = data.get("choices", [{}])[0].get("message", {}).get("content", "")
-        return {"raw_text": text, "latency": latency, "ok": True}
+        return {"raw_text": text, "latency": latency, "ok": True, "usage": _usage(data.get("usage"))}
+    async def acall(self, prompt: str, max_tokens: int = 300, temperature: float = DEFAULT_TEMPERATURE) -> Dict[str, Any]:
+        if _load_httpx() is None:
+            return await super().acall(prompt, max_tokens, temperature)
+        headers, body = self._request(prompt)
+        return await _apost_chat(SPARK_ENDPOINT, headers, body)
 
 # ---------- 输出解析 ----------
 
@@ -111,53 +268,566 @@ def _try_parse_json(s: str):
     try:
         return json.loads(s)
     except Exception:
-        m = re.search(r"\{[\s\S]*?\}", s)
-        if m:
-            try:
-                return json.loads(m.group(0))
-            except: return None
+        # 先试最外层花括号（批量模式的嵌套对象），再退回第一个扁平对象
+        for pattern in (r"\{[\s\S]*\}", r"\{[\s\S]*?\}"):
+            m = re.search(pattern, s)
+            if m:
+                try:
+                    return json.loads(m.group(0))
+                except Exception:
+                    continue
     return None
 
 
-def _normalize(raw: str) -> Dict[str, Any]:
+def _normalize(raw: str, metrics: Optional[List[str]] = None, tags: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    单指标：返回 {value, unit, year, type, note, raw}。
+    批量（传入 metrics）：返回 指标名 -> 上述结构，缺失的指标给空值。
+    打包（传入 tags）：返回 段落编号 -> 上述（单指标或批量）结构。
+    """
     j = _try_parse_json(raw)
+    if tags is not None:
+        if not isinstance(j, dict):
+            return {t: _split_metrics(None, raw, metrics) for t in tags}
+        return {t: _split_metrics(j.get(t) if isinstance(j.get(t), dict) else {}, raw, metrics) for t in tags}
+    return _split_metrics(j if isinstance(j, dict) else None, raw, metrics)
+
+
+def _split_metrics(j: Optional[Dict[str, Any]], raw: str, metrics: Optional[List[str]]) -> Dict[str, Any]:
+    if metrics is None:
+        return _normalize_fields(j, raw)
+    if not isinstance(j, dict):
+        return {m: _normalize_fields(None, raw) for m in metrics}
+    return {m: _normalize_fields(j.get(m) if isinstance(j.get(m), dict) else {}, raw) for m in metrics}
+
+
+def _normalize_fields(j: Optional[Dict[str, Any]], raw: str) -> Dict[str, Any]:
     if isinstance(j, dict):
         return {"value":str(j.get("value","")), "unit":str(j.get("unit","")), "year":str(j.get("year","")), "type":str(j.get("type","")), "note":str(j.get("note","")), "raw":raw}
     return {"value":"","unit":"","year":"","type":"","note":raw[:200],"raw":raw}
 
 # ---------- 主函数 ----------
 
-def extract_metrics(paragraphs: List[Dict[str,Any]], metrics: List[str], workers:int=CONCURRENCY) -> List[Dict[str,Any]]:
+# (paragraph, metrics) -> metrics worth extracting from that paragraph
+MetricSelector = Callable[[Dict[str,Any], List[str]], List[str]]
+# (paragraph, metrics) -> text to put in the prompt for those metrics
+ContextSelector = Callable[[Dict[str,Any], List[str]], str]
+# (primary model's row, paragraph) -> True if an empty answer can be trusted without a second model
+CascadeCheck = Callable[[Dict[str,Any], Dict[str,Any]], bool]
+
+def api_keys_configured() -> bool:
+    return bool(ZHIPU_API_KEY or SPARK_API_KEY)
+
+
+def _build_clients(cache=None, limits: Optional[Dict[str, Dict[str, Any]]]=None,
+                   mock: Optional[bool]=None) -> List[BaseClient]:
+    # mock 为 None 时按模块级 MOCK_MODE；显式传入时只影响本次调用（server 中并发的任务互不干扰）；
+    # 没有配置任何 API key 时总是 mock
+    mock = (MOCK_MODE if mock is None else mock) or not api_keys_configured()
     clients: List[BaseClient] = []
-    if MOCK_MODE:
+    if CLIENT_FACTORY is not None:
+        clients = list(CLIENT_FACTORY())
+    elif mock:
         clients = [MockClient("glm-4-plus"), MockClient("spark-4.0Ultra")]
     else:
         if ZHIPU_API_KEY:
             clients.append(ZhipuClient(ZHIPU_API_KEY))
         if SPARK_API_KEY:
             clients.append(SparkClient(SPARK_API_KEY))
-    results = []
+    if limits and (CLIENT_FACTORY is not None or not mock):
+        # 按服务商限流 + 可重试错误退避重试 + AIMD 并发（服务商维度进程内共享）
+        clients = [ratelimit.GuardedClient(c, ratelimit.get_guard(c.name, **limits[c.name])) if c.name in limits else c
+                   for c in clients]
+    if cache is not None:
+        # llm_cache.ResponseCache：相同 (模型, prompt, 温度, max_tokens) 直接读本地缓存
+        clients = [cache.wrap(c) for c in clients]
+    return [_MeteredClient(c) for c in clients]
+
+
+class _MeteredClient:
+    """最外层包装：按模型记录调用次数、端到端延迟（含限流等待与重试）、错误与 prompt/回复规模。"""
+
+    def __init__(self, client):
+        self.client = client
+        self.name = client.name
+
+    def _record(self, prompt: str, t0: float, resp: Optional[Dict[str, Any]], err: Optional[Exception]) -> None:
+        m = self.name
+        telemetry.observe("llm_call_seconds", time.perf_counter() - t0, model=m)
+        telemetry.inc("llm_prompt_chars_total", len(prompt), model=m)
+        if err is not None:
+            telemetry.inc("llm_calls_total", model=m, status="error")
+            telemetry.inc("llm_errors_total", model=m, error=type(err).__name__)
+            return
+        telemetry.inc("llm_calls_total", model=m, status="cached" if resp.get("cached") else "ok")
+        telemetry.inc("llm_completion_chars_total", len(resp.get("raw_text") or ""), model=m)
+        usage = resp.get("usage")
+        if usage:
+            telemetry.inc("llm_prompt_tokens_total", usage["prompt_tokens"], model=m)
+            telemetry.inc("llm_completion_tokens_total", usage["completion_tokens"], model=m)
+
+    def call(self, prompt: str, max_tokens: int = 300, temperature: float = DEFAULT_TEMPERATURE) -> Dict[str, Any]:
+        t0 = time.perf_counter()
+        try:
+            resp = self.client.call(prompt, max_tokens=max_tokens, temperature=temperature)
+        except Exception as e:
+            self._record(prompt, t0, None, e)
+            raise
+        self._record(prompt, t0, resp, None)
+        return resp
+
+    async def acall(self, prompt: str, max_tokens: int = 300, temperature: float = DEFAULT_TEMPERATURE) -> Dict[str, Any]:
+        t0 = time.perf_counter()
+        try:
+            resp = await self.client.acall(prompt, max_tokens=max_tokens, temperature=temperature)
+        except Exception as e:
+            self._record(prompt, t0, None, e)
+            raise
+        self._record(prompt, t0, resp, None)
+        return resp
+
+
+def extract_metrics(paragraphs: List[Dict[str,Any]], metrics: List[str], workers:int=CONCURRENCY,
+                    batch_metrics: bool=False, select_metrics: Optional[MetricSelector]=None,
+                    cache=None, limits: Optional[Dict[str, Dict[str, Any]]]=None,
+                    cascade: Optional[str]=None, cascade_check: Optional[CascadeCheck]=None,
+                    pack_paragraphs: bool=False, select_context: Optional[ContextSelector]=None,
+                    checkpoint=None, mock: Optional[bool]=None) -> List[Dict[str,Any]]:
+    return list(iter_extract_metrics(paragraphs, metrics, workers=workers, batch_metrics=batch_metrics,
+                                     select_metrics=select_metrics, cache=cache, limits=limits,
+                                     cascade=cascade, cascade_check=cascade_check, pack_paragraphs=pack_paragraphs,
+                                     select_context=select_context, checkpoint=checkpoint, mock=mock))
+
+
+def iter_extract_metrics(paragraphs: Iterable[Dict[str,Any]], metrics: List[str], workers:int=CONCURRENCY,
+                         max_pending: Optional[int]=None, batch_metrics: bool=False,
+                         select_metrics: Optional[MetricSelector]=None, cache=None,
+                         limits: Optional[Dict[str, Dict[str, Any]]]=None, cascade: Optional[str]=None,
+                         cascade_check: Optional[CascadeCheck]=None, pack_paragraphs: bool=False,
+                         select_context: Optional[ContextSelector]=None, checkpoint=None,
+                         mock: Optional[bool]=None) -> Iterator[Dict[str,Any]]:
+    """
+    流式版 extract_metrics：paragraphs 可以是生成器（如 parser.iter_parse_pdf），
+    每来一段就提交调用，结果在完成时逐条 yield。
+    排队+执行中的调用数不超过 max_pending（默认 workers*4），超过时阻塞上游，形成背压。
+    batch_metrics=True 时每段每个模型只调用一次，一个 prompt 同时抽取全部指标，
+    结果仍拆成逐指标的行。
+    select_metrics(para, metrics) 可返回该段值得抽取的指标子集（如 prefilter.RelevanceFilter），
+    其余 (段落, 指标) 组合不发请求。
+    cache 为 llm_cache.ResponseCache 时，各客户端的响应走本地持久缓存。
+    limits 为 模型名 -> ratelimit.ProviderGuard 参数（rpm/tpm/max_concurrency...），
+    对应客户端按配额限流，429/超时等可重试错误自动退避重试。
+    cascade 为主模型名时启用级联：先只调用主模型，仅当其返回非空值、JSON 无法解析、
+    调用失败或 cascade_check(row, para) 不通过时，才让其余模型复核该指标。
+    pack_paragraphs=True 时把同一公司、同一文件的连续短段落打包进一个 prompt
+    （总长不超过 MAX_PROMPT_CHARS），按段落编号取回结果；级联模式下不打包。
+    select_context(para, metrics) 返回放进 prompt 的文本（如 context.ContextSelector，
+    只保留指标关键词附近的窗口和表头/命中行）；默认整段，超长时首尾截断。
+    checkpoint 为 checkpoint.CallCheckpoint 时，成功的结果随完成写入断点文件；
+    已记录的 (段落, 指标, 模型) 直接回放旧结果、不再调用（级联模式下只记录不跳过）。
+    mock=True 使用 MockClient，None 时按 MOCK_MODE。
+    """
+    clients = _build_clients(cache, limits, mock)
+    workers = _pool_size(workers, clients)
+    max_pending = max_pending or workers * 4
     with ThreadPoolExecutor(max_workers=workers) as ex:
-        futs = []
-        for para in paragraphs:
-            txt = para.get("text","")
-            for m in metrics:
-                prompt = _build_prompt(txt, m)
-                for c in clients:
-                    futs.append(ex.submit(_call, c, prompt, m, para))
-        for f in as_completed(futs):
-            r = f.result()
-            if r: results.append(r)
-    return results
+        pending = set()
+        for items in _units(paragraphs, metrics, select_metrics, pack_paragraphs and not cascade):
+            for task in _unit_tasks(items, clients, batch_metrics, cascade=cascade, cascade_check=cascade_check,
+                                    context=select_context, checkpoint=checkpoint):
+                while len(pending) >= max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    yield from _rows(done, checkpoint)
+                pending.add(ex.submit(_queued, time.perf_counter(), task))
+            # 顺手取走已完成的结果，不阻塞
+            done = {f for f in pending if f.done()}
+            pending -= done
+            yield from _rows(done, checkpoint)
+        yield from _rows(as_completed(pending), checkpoint)
+
+
+def _pool_size(workers: int, clients) -> int:
+    """
+    同步引擎的线程数：有限流时取各服务商 AIMD 并发上限之和（不少于 workers），
+    否则线程池会先于 AimdLimiter 卡住在途请求数，自适应并发无法升到 max_concurrency 以上。
+    """
+    guards = {}
+    for c in clients:
+        while c is not None:
+            g = getattr(c, "guard", None)
+            if g is not None:
+                guards[id(g)] = g
+            c = getattr(c, "client", None)
+    if not guards:
+        return workers
+    return max(workers, sum(g.limiter.max_limit for g in guards.values()))
+
+
+def _queued(t_submit: float, task):
+    telemetry.observe("llm_queue_wait_seconds", time.perf_counter() - t_submit)
+    return task[0](*task[1:])
+
+
+def _units(paragraphs: Iterable[Dict[str,Any]], metrics: List[str], select_metrics: Optional[MetricSelector],
+           pack: bool) -> Iterator[List[Tuple[Dict[str,Any], List[str]]]]:
+    """
+    把段落流切成调用单元：每个单元是 [(段落, 该段要抽取的指标), ...]。
+    不打包时每段一个单元；打包时合并同一公司、同一文件的连续短段落。
+    """
+    buf: List[Tuple[Dict[str,Any], List[str]]] = []
+    size = 0
+    for para in paragraphs:
+        para_metrics = select_metrics(para, metrics) if select_metrics else metrics
+        if not para_metrics:
+            continue
+        n = len(para.get("text") or "") + len(_tag(para)) + 3
+        if not pack or n > PACK_MAX_PARA_CHARS:
+            if buf:
+                yield buf
+                buf, size = [], 0
+            yield [(para, para_metrics)]
+            continue
+        if buf:
+            head = buf[0][0]
+            if (size + n > MAX_PROMPT_CHARS or len(buf) >= PACK_MAX_PARAS
+                    or para.get("company") != head.get("company")
+                    or para.get("source_file") != head.get("source_file")
+                    or para.get("source_sha") != head.get("source_sha")
+                    or any(_tag(p) == _tag(para) for p, _ in buf)):
+                yield buf
+                buf, size = [], 0
+        buf.append((para, para_metrics))
+        size += n
+    if buf:
+        yield buf
+
+
+def _unit_tasks(items: List[Tuple[Dict[str,Any], List[str]]], clients: List[BaseClient], batch_metrics: bool,
+                is_async: bool=False, cascade: Optional[str]=None, cascade_check: Optional[CascadeCheck]=None,
+                context: Optional[ContextSelector]=None, checkpoint=None):
+    if checkpoint is not None and not cascade:
+        yield from _resume_tasks(items, clients, batch_metrics, is_async, context, checkpoint)
+        return
+    if len(items) == 1:
+        para, para_metrics = items[0]
+        yield from _para_tasks(para, para_metrics, clients, batch_metrics, is_async=is_async, cascade=cascade,
+                               cascade_check=cascade_check, context=context)
+        return
+    if batch_metrics:
+        # 各段被选中的指标可能不同：取并集一起问，拆行时再按段过滤
+        union = [m for m in dict.fromkeys(m for _, pm in items for m in pm)]
+        prompt = _build_packed_prompt(items, metrics=union, context=context)
+        fn = _acall_packed if is_async else _call_packed
+        for c in clients:
+            yield (fn, c, prompt, items, union, True)
+        return
+    all_metrics = list(dict.fromkeys(m for _, pm in items for m in pm))
+    for m in all_metrics:
+        sub = [(p, pm) for p, pm in items if m in pm]
+        if len(sub) == 1:
+            yield from _para_tasks(sub[0][0], [m], clients, False, is_async=is_async, context=context)
+            continue
+        prompt = _build_packed_prompt(sub, metric=m, context=context)
+        fn = _acall_packed if is_async else _call_packed
+        for c in clients:
+            yield (fn, c, prompt, sub, [m], False)
+
+
+def _resume_tasks(items: List[Tuple[Dict[str,Any], List[str]]], clients: List[BaseClient], batch_metrics: bool,
+                  is_async: bool, context: Optional[ContextSelector], checkpoint):
+    """断点续跑：每个模型只为未记录的 (段落, 指标) 发请求，已记录的结果一次性回放。"""
+    stored: List[Dict[str,Any]] = []
+    groups: Dict[Tuple, Tuple[List, List[BaseClient]]] = {}
+    for c in clients:
+        todo_items = []
+        for para, para_metrics in items:
+            todo = []
+            for m in para_metrics:
+                row = checkpoint.lookup(para, m, c.name)
+                if row is None:
+                    todo.append(m)
+                else:
+                    telemetry.inc("llm_calls_replayed_total", model=c.name)
+                    stored.append(dict(row, company=para.get("company")))
+            if todo:
+                todo_items.append((para, todo))
+        # 剩余工作相同的模型（通常是全部模型）仍共用同一组 prompt
+        key = tuple((id(p), tuple(ms)) for p, ms in todo_items)
+        groups.setdefault(key, (todo_items, []))[1].append(c)
+    for todo_items, group in groups.values():
+        if todo_items:
+            yield from _unit_tasks(todo_items, group, batch_metrics, is_async=is_async, context=context)
+    if stored:
+        yield (_areplay if is_async else _replay, stored)
+
+
+def _replay(rows: List[Dict[str,Any]]) -> List[Dict[str,Any]]:
+    return rows
+
+
+async def _areplay(rows: List[Dict[str,Any]]) -> List[Dict[str,Any]]:
+    return rows
+
+
+def _para_tasks(para: Dict[str,Any], metrics: List[str], clients: List[BaseClient], batch_metrics: bool,
+                is_async: bool=False, cascade: Optional[str]=None, cascade_check: Optional[CascadeCheck]=None,
+                context: Optional[ContextSelector]=None):
+    if cascade and len(clients) > 1:
+        primary = next((c for c in clients if c.name == cascade), clients[0])
+        secondaries = [c for c in clients if c is not primary]
+        check = cascade_check or default_cascade_check
+        fn = _acall_cascade if is_async else _call_cascade
+        groups = [metrics] if batch_metrics else [[m] for m in metrics]
+        for ms in groups:
+            yield (fn, primary, secondaries, _text(para, ms, context), ms, para, batch_metrics, check)
+        return
+    if batch_metrics:
+        prompt = _build_batch_prompt(_text(para, metrics, context), metrics)
+        fn = _acall_batch if is_async else _call_batch
+        for c in clients:
+            yield (fn, c, prompt, metrics, para)
+        return
+    fn = _acall if is_async else _call
+    for m in metrics:
+        prompt = _build_prompt(_text(para, [m], context), m)
+        for c in clients:
+            yield (fn, c, prompt, m, para)
+
+
+def _rows(futs, checkpoint=None) -> Iterator[Dict[str,Any]]:
+    for f in futs:
+        r = f.result()
+        rows = r if isinstance(r, list) else [r] if r else []
+        for row in rows:
+            if checkpoint is not None:
+                checkpoint.record(row)
+            yield row
+
+
+def _llm_span(client: BaseClient, metrics, para: Optional[Dict[str,Any]] = None,
+              paras: Optional[List[Dict[str,Any]]] = None):
+    if not tracing.enabled():
+        return tracing.span("llm_call")
+    if para is not None:
+        paras = [para]
+    return tracing.span("llm_call", cat="llm", model=client.name,
+                        metric=metrics if isinstance(metrics, str) else ",".join(metrics),
+                        company=paras[0].get("company"), paras=",".join(_tag(p) for p in paras))
 
 
 def _call(client: BaseClient, prompt: str, metric: str, para: Dict[str,Any]):
     try:
-        resp = client.call(prompt)
+        with _llm_span(client, metric, para):
+            resp = client.call(prompt)
+        norm = _normalize(resp.get("raw_text",""))
+        return _row(client, metric, norm, resp, para)
+    except Exception as e:
+        return _error_row(client, metric, e, para)
+
+
+def _call_batch(client: BaseClient, prompt: str, metrics: List[str], para: Dict[str,Any]):
+    try:
+        with _llm_span(client, metrics, para):
+            resp = client.call(prompt, max_tokens=_batch_max_tokens(metrics))
+        norms = _normalize(resp.get("raw_text",""), metrics)
+        return [_row(client, m, norms[m], resp, para) for m in metrics]
+    except Exception as e:
+        return [_error_row(client, m, e, para) for m in metrics]
+
+
+async def _acall(client: BaseClient, prompt: str, metric: str, para: Dict[str,Any]):
+    try:
+        with _llm_span(client, metric, para):
+            resp = await client.acall(prompt)
         norm = _normalize(resp.get("raw_text",""))
-        return {"model":client.name, "metric":metric, "value":norm["value"], "unit":norm["unit"], "year":norm["year"], "type":norm["type"], "note":norm["note"], "raw":norm["raw"], "latency":resp.get("latency"), "page_id":para.get("page_id"), "para_id":para.get("para_id"), "company":para.get("company")}
+        return _row(client, metric, norm, resp, para)
+    except Exception as e:
+        return _error_row(client, metric, e, para)
+
+
+async def _acall_batch(client: BaseClient, prompt: str, metrics: List[str], para: Dict[str,Any]):
+    try:
+        with _llm_span(client, metrics, para):
+            resp = await client.acall(prompt, max_tokens=_batch_max_tokens(metrics))
+        norms = _normalize(resp.get("raw_text",""), metrics)
+        return [_row(client, m, norms[m], resp, para) for m in metrics]
+    except Exception as e:
+        return [_error_row(client, m, e, para) for m in metrics]
+
+
+# ---------- 打包模式 ----------
+
+def _packed_max_tokens(items: List[Tuple[Dict[str,Any], List[str]]], metrics: List[str]) -> int:
+    return max(300, PACK_TOKENS_PER_ANSWER * len(items) * len(metrics))
+
+
+def _packed_rows(client: BaseClient, resp: Dict[str,Any], items: List[Tuple[Dict[str,Any], List[str]]],
+                 metrics: List[str], batch: bool) -> List[Dict[str,Any]]:
+    tags = [_tag(p) for p, _ in items]
+    norms = _normalize(resp.get("raw_text",""), metrics if batch else None, tags)
+    rows = []
+    for (para, para_metrics), t in zip(items, tags):
+        if batch:
+            rows.extend(_row(client, m, norms[t][m], resp, para) for m in metrics if m in para_metrics)
+        else:
+            rows.append(_row(client, metrics[0], norms[t], resp, para))
+    return rows
+
+
+def _packed_error_rows(client: BaseClient, e: Exception, items: List[Tuple[Dict[str,Any], List[str]]],
+                       metrics: List[str]) -> List[Dict[str,Any]]:
+    return [_error_row(client, m, e, para) for para, pm in items for m in metrics if m in pm]
+
+
+def _call_packed(client: BaseClient, prompt: str, items: List[Tuple[Dict[str,Any], List[str]]],
+                 metrics: List[str], batch: bool) -> List[Dict[str,Any]]:
+    try:
+        with _llm_span(client, metrics, paras=[p for p, _ in items]):
+            resp = client.call(prompt, max_tokens=_packed_max_tokens(items, metrics))
+        return _packed_rows(client, resp, items, metrics, batch)
     except Exception as e:
-        return {"model":client.name, "metric":metric, "error":str(e), "page_id":para.get("page_id"), "para_id":para.get("para_id"), "company":para.get("company")}
+        return _packed_error_rows(client, e, items, metrics)
+
+
+async def _acall_packed(client: BaseClient, prompt: str, items: List[Tuple[Dict[str,Any], List[str]]],
+                        metrics: List[str], batch: bool) -> List[Dict[str,Any]]:
+    try:
+        with _llm_span(client, metrics, paras=[p for p, _ in items]):
+            resp = await client.acall(prompt, max_tokens=_packed_max_tokens(items, metrics))
+        return _packed_rows(client, resp, items, metrics, batch)
+    except Exception as e:
+        return _packed_error_rows(client, e, items, metrics)
+
+
+# ---------- 级联模式 ----------
+
+def default_cascade_check(row: Dict[str,Any], para: Dict[str,Any]) -> bool:
+    """
+    主模型的空答案是否可信：段落里原样出现了指标名且带数字，却返回空值，则视为可疑。
+    （非空值、解析失败、调用失败总会升级，不经过这里。）
+    """
+    txt = para.get("text") or ""
+    return not (row.get("metric","") in txt and re.search(r"\d", txt))
+
+
+def _needs_confirmation(row: Dict[str,Any], para: Dict[str,Any], check: CascadeCheck) -> bool:
+    if "error" in row or row.get("value"):
+        return True
+    j = _try_parse_json(row.get("raw",""))
+    if not isinstance(j, dict):
+        return True
+    if "value" not in j and not isinstance(j.get(row["metric"]), dict):
+        # 批量回复里缺这个指标
+        return True
+    return not check(row, para)
+
+
+def _run_client(client: BaseClient, txt: str, metrics: List[str], para: Dict[str,Any], batch: bool) -> List[Dict[str,Any]]:
+    if batch:
+        return _call_batch(client, _build_batch_prompt(txt, metrics), metrics, para)
+    return [_call(client, _build_prompt(txt, m), m, para) for m in metrics]
+
+
+async def _arun_client(client: BaseClient, txt: str, metrics: List[str], para: Dict[str,Any], batch: bool) -> List[Dict[str,Any]]:
+    if batch:
+        return await _acall_batch(client, _build_batch_prompt(txt, metrics), metrics, para)
+    return [await _acall(client, _build_prompt(txt, m), m, para) for m in metrics]
+
+
+def _call_cascade(primary: BaseClient, secondaries: List[BaseClient], txt: str, metrics: List[str],
+                  para: Dict[str,Any], batch: bool, check: CascadeCheck) -> List[Dict[str,Any]]:
+    rows = _run_client(primary, txt, metrics, para, batch)
+    todo = [r["metric"] for r in rows if _needs_confirmation(r, para, check)]
+    if todo:
+        for c in secondaries:
+            rows.extend(_run_client(c, txt, todo, para, batch))
+    return rows
+
+
+async def _acall_cascade(primary: BaseClient, secondaries: List[BaseClient], txt: str, metrics: List[str],
+                         para: Dict[str,Any], batch: bool, check: CascadeCheck) -> List[Dict[str,Any]]:
+    rows = await _arun_client(primary, txt, metrics, para, batch)
+    todo = [r["metric"] for r in rows if _needs_confirmation(r, para, check)]
+    if todo:
+        for c in secondaries:
+            rows.extend(await _arun_client(c, txt, todo, para, batch))
+    return rows
+
+
+def _batch_max_tokens(metrics: List[str]) -> int:
+    return max(300, BATCH_TOKENS_PER_METRIC * len(metrics))
+
+
+def _row(client: BaseClient, metric: str, norm: Dict[str,Any], resp: Dict[str,Any], para: Dict[str,Any]) -> Dict[str,Any]:
+    return {"model":client.name, "metric":metric, "value":norm["value"], "unit":norm["unit"], "year":norm["year"], "type":norm["type"], "note":norm["note"], "raw":norm["raw"], "latency":resp.get("latency"), "page_id":para.get("page_id"), "para_id":para.get("para_id"), "company":para.get("company"), "source_file":para.get("source_file"), "source_sha":para.get("source_sha")}
+
+
+def _error_row(client: BaseClient, metric: str, e: Exception, para: Dict[str,Any]) -> Dict[str,Any]:
+    return {"model":client.name, "metric":metric, "error":str(e), "page_id":para.get("page_id"), "para_id":para.get("para_id"), "company":para.get("company"), "source_file":para.get("source_file"), "source_sha":para.get("source_sha")}
+
+
+# ---------- 异步引擎 ----------
+
+_END = object()
+
+
+async def extract_metrics_async(paragraphs: Iterable[Dict[str,Any]], metrics: List[str], concurrency:int=ASYNC_CONCURRENCY,
+                                batch_metrics: bool=False, select_metrics: Optional[MetricSelector]=None,
+                                cache=None, limits: Optional[Dict[str, Dict[str, Any]]]=None,
+                                cascade: Optional[str]=None, cascade_check: Optional[CascadeCheck]=None,
+                                pack_paragraphs: bool=False, select_context: Optional[ContextSelector]=None,
+                                checkpoint=None, on_row: Optional[Callable[[Dict[str,Any]], None]]=None,
+                                mock: Optional[bool]=None) -> List[Dict[str,Any]]:
+    """
+    异步版 extract_metrics：最多 concurrency 个请求同时在途，共享一个 keep-alive 连接池。
+    paragraphs 可以是同步生成器（如流式解析），在线程中取下一段，解析不会阻塞事件循环；
+    在途请求达到上限时暂停取段，形成背压。cache/limits/cascade/pack_paragraphs/select_context/checkpoint/mock
+    含义同 iter_extract_metrics。
+    on_row 不为空时每条结果完成即交给 on_row（如写入 JSONL），不再累积，返回空列表。
+    """
+    clients = _build_clients(cache, limits, mock)
+    sem = asyncio.Semaphore(concurrency)
+    results: List[Dict[str,Any]] = []
+    tasks = set()
+
+    async def run(t_submit, fn, *args):
+        telemetry.observe("llm_queue_wait_seconds", time.perf_counter() - t_submit)
+        try:
+            r = await fn(*args)
+        finally:
+            sem.release()
+        rows = r if isinstance(r, list) else [r] if r else []
+        if checkpoint is not None:
+            for row in rows:
+                checkpoint.record(row)
+        if on_row is not None:
+            for row in rows:
+                on_row(row)
+        else:
+            results.extend(rows)
+
+    http = _new_async_http() if _load_httpx() is not None else None
+    token = _ASYNC_HTTP.set(http)
+    try:
+        units = _units(paragraphs, metrics, select_metrics, pack_paragraphs and not cascade)
+        lazy = not isinstance(paragraphs, (list, tuple))
+        while True:
+            items = await asyncio.to_thread(next, units, _END) if lazy else next(units, _END)
+            if items is _END:
+                break
+            for task in _unit_tasks(items, clients, batch_metrics, is_async=True, cascade=cascade,
+                                    cascade_check=cascade_check, context=select_context, checkpoint=checkpoint):
+                await sem.acquire()
+                t = asyncio.create_task(run(time.perf_counter(), *task))
+                tasks.add(t)
+                t.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+    finally:
+        _ASYNC_HTTP.reset(token)
+        if http is not None:
+            await http.aclose()
+    return results
 
 
 if __name__ == "__main__":
@@ -0,0 +1,96 @@
+# 流式 JSONL 读写
+
+# path: tools/jsonl.py
+"""
+Append-as-you-go JSONL files, optionally gzip-compressed.
+
+JsonlWriter writes one compact JSON object per line as records are produced,
+so nothing has to be held until a stage ends; a path ending in ".gz" (or
+compress=True) writes gzip. JsonlFile is a re-iterable view of such a file:
+every iteration streams it from disk again, so it can stand in for a list
+that is scanned several times (company selection, fallback, bbox lookup)
+without keeping the records in memory. A torn last line is skipped.
+
+Usage:
+    with JsonlWriter("out/parsed.jsonl.gz") as w:
+        for p in paragraphs:
+            w.write(p)
+    for p in JsonlFile("out/parsed.jsonl.gz"):
+        ...
+"""
+
+from __future__ import annotations
+
+import os
+import gzip
+import json
+from typing import Dict, Any, Iterator, Optional
+
+GZIP_LEVEL = 5   # 压缩率与速度的折中（默认 9 写得太慢）
+
+
+def jsonl_path(json_path: str, compress: bool = False) -> str:
+    """parsed.json -> parsed.jsonl / parsed.jsonl.gz"""
+    return os.path.splitext(json_path)[0] + (".jsonl.gz" if compress else ".jsonl")
+
+
+def _open(path: str, mode: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8", compresslevel=GZIP_LEVEL)
+    return open(path, mode, encoding="utf-8")
+
+
+class JsonlWriter:
+    def __init__(self, path: str, compress: Optional[bool] = None):
+        if compress and not path.endswith(".gz"):
+            path += ".gz"
+        self.path = path
+        self.count = 0
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self._f = _open(path, "w")
+
+    def write(self, obj: Dict[str, Any]) -> None:
+        self._f.write(json.dumps(obj, ensure_ascii=False, separators=(",", ":")))
+        self._f.write("\n")
+        self.count += 1
+
+    def close(self) -> None:
+        if not self._f.closed:
+            self._f.close()
+
+    def __enter__(self) -> "JsonlWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def iter_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    with _open(path, "r") as f:
+        try:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+        except EOFError:
+            # gzip 写到一半被中断
+            return
+
+
+class JsonlFile:
+    """Re-iterable, read-only view of a JSONL file (streams from disk on each pass)."""
+
+    def __init__(self, path: str, count: Optional[int] = None):
+        self.path = path
+        self._count = count
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter_jsonl(self.path)
+
+    def __len__(self) -> int:
+        if self._count is None:
+            self._count = sum(1 for _ in self)
+        return self._count
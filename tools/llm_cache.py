@@ -0,0 +1,144 @@
+# 大模型响应缓存
+
+# path: tools/llm_cache.py
+"""
+Persistent cache for LLM responses, backed by a local SQLite file.
+
+Entries are keyed on (client class, model name, prompt hash, temperature,
+max_tokens). Only successful calls are stored. The store is bounded by total
+size with LRU eviction (least recently read first) and entries can optionally
+expire after `ttl` seconds. Hit/miss counters feed the run summary.
+
+Usage:
+    cache = ResponseCache("./.cache/llm_responses.sqlite3", max_bytes=512 << 20)
+    client = cache.wrap(ZhipuClient(key))     # or CachedClient(client, cache)
+    client.call(prompt)          # network on first call, SQLite afterwards
+    print(cache.summary())
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, Any, Optional
+
+
+class ResponseCache:
+    def __init__(self, path: str, max_bytes: int = 512 << 20, ttl: Optional[float] = None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+            " created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)")
+        self._size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def make_key(client_id: str, prompt: str, temperature: float, max_tokens: int) -> str:
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        return hashlib.sha256(f"{client_id}\x00{prompt_hash}\x00{temperature}\x00{max_tokens}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT value, size, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row and self.ttl is not None and row[2] < now - self.ttl:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._size -= row[1]
+                row = None
+            if not row:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        data = json.dumps(value, ensure_ascii=False)
+        size = len(data.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            old = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, data, size, now, now),
+            )
+            self._size += size - (old[0] if old else 0)
+            if self._size > self.max_bytes:
+                self._evict(int(self.max_bytes * 0.9))
+
+    def _evict(self, target: int) -> None:
+        # 按最近访问时间从旧到新删除，直到总大小降到 target 以下
+        cur = self._db.execute("SELECT key, size FROM responses ORDER BY accessed ASC")
+        doomed = []
+        for key, size in cur:
+            if self._size <= target:
+                break
+            doomed.append((key,))
+            self._size -= size
+        cur.close()
+        self._db.executemany("DELETE FROM responses WHERE key = ?", doomed)
+        self.evictions += len(doomed)
+
+    def wrap(self, client) -> "CachedClient":
+        return CachedClient(client, self)
+
+    def summary(self) -> str:
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        return f"LLM cache hits={self.hits} misses={self.misses} hit_rate={rate:.1%} evictions={self.evictions}"
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class CachedClient:
+    """Wraps an extractor client; same `name` and `call` signature, answers from the cache when possible."""
+
+    def __init__(self, client, cache: ResponseCache):
+        self.client = client
+        self.cache = cache
+        self.name = client.name
+        # 区分真实客户端与 MockClient（两者 name 相同）；按最内层客户端取类型，
+        # 外面是否套了 ratelimit.GuardedClient 等包装不影响缓存键
+        inner = client
+        while getattr(inner, "client", None) is not None:
+            inner = inner.client
+        self._client_id = f"{type(inner).__name__}:{client.name}"
+
+    def call(self, prompt: str, max_tokens: int = 300, temperature: float = 0.0) -> Dict[str, Any]:
+        key = ResponseCache.make_key(self._client_id, prompt, temperature, max_tokens)
+        hit = self.cache.get(key)
+        if hit is not None:
+            return {"raw_text": hit["raw_text"], "latency": 0.0, "ok": True, "cached": True}
+        resp = self.client.call(prompt, max_tokens=max_tokens, temperature=temperature)
+        if resp.get("ok"):
+            self.cache.put(key, {"raw_text": resp.get("raw_text", "")})
+        return resp
+
+    async def acall(self, prompt: str, max_tokens: int = 300, temperature: float = 0.0) -> Dict[str, Any]:
+        key = ResponseCache.make_key(self._client_id, prompt, temperature, max_tokens)
+        hit = self.cache.get(key)
+        if hit is not None:
+            return {"raw_text": hit["raw_text"], "latency": 0.0, "ok": True, "cached": True}
+        resp = await self.client.acall(prompt, max_tokens=max_tokens, temperature=temperature)
+        if resp.get("ok"):
+            self.cache.put(key, {"raw_text": resp.get("raw_text", "")})
+        return resp
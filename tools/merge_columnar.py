@@ -0,0 +1,234 @@
+# 列式多模型结果融合
+
+# path: tools/merge_columnar.py
+"""
+Columnar counterpart of tools/merger.py for very large extraction sets.
+
+Extraction rows are loaded once into a pandas DataFrame (only the fields the
+vote needs, strings as categoricals), and voting, confidence and the
+per-(company, metric) best pick are computed with grouped operations instead
+of per-group dicts and Counters:
+
+- values are canonicalized before voting: thousands separators and spaces are
+  stripped, accounting negatives "(1,234)" become -1234, and amounts in
+  元/千元/万元/百万元/千万元/亿元/万亿元 are converted to 元, so "1.5 亿元" and
+  "15,000 万元" vote together. The output keeps the representative row's
+  original value and unit.
+- confidence and support follow merger.vote_merge_group: ratio of the winning
+  vote >= 0.8 high, >= 0.5 medium, else low; a single answer is medium, or low
+  when empty; support lists every model that answered
+- ties go to the vote / item seen first, as in the dict path
+- note strings are built only where they say something: the "所有投票" detail
+  only for groups where the models disagree
+
+Usage:
+    frame = merge_frame(rows)           # one row per (company, metric, page, para)
+    merger.iter_merge_jsonl(path, merge_bucket=merge_rows)   # columnar vote per on-disk bucket
+    merged = to_records(frame)          # same shape as merger.merge_results
+    best = best_by_company(frame)       # company -> metric -> best merged item
+"""
+
+from __future__ import annotations
+
+import time
+from typing import Dict, Any, Iterable, List
+
+import numpy as np
+import pandas as pd
+
+try:
+    from tools import telemetry
+except Exception:
+    import telemetry
+
+_KEYS = ['company', 'metric', 'page_id', 'para_id']
+_FIELDS = _KEYS + ['value', 'unit', 'year', 'type', 'model']
+
+# 金额单位 -> 换算到“元”的倍数（去掉“人民币”等前后缀之后）
+UNIT_SCALE = {
+    '元': 1.0, '千元': 1e3, '万元': 1e4, '十万元': 1e5, '百万元': 1e6, '千万元': 1e7,
+    '亿元': 1e8, '十亿元': 1e9, '百亿元': 1e10, '千亿元': 1e11, '万亿元': 1e12,
+    '千': 1e3, '万': 1e4, '百万': 1e6, '千万': 1e7, '亿': 1e8, '万亿': 1e12,
+}
+_UNIT_NOISE = r'人民币|RMB|CNY|\s|[（(][^）)]*[）)]'
+_RANK = {'high': 3, 'medium': 2, 'low': 1}
+
+
+def load_frame(rows: Iterable[Dict[str, Any]]) -> pd.DataFrame:
+    """Only the vote fields of the rows (raw/note/latency never reach the frame)."""
+    if hasattr(rows, 'columns') and not isinstance(rows, pd.DataFrame):
+        # records.TableFile 只读需要的列；RecordTable 直接取列
+        df = pd.DataFrame(rows.columns(_FIELDS))
+    elif hasattr(rows, 'column'):
+        df = pd.DataFrame({f: rows.column(f) for f in _FIELDS})
+    else:
+        df = pd.DataFrame.from_records(rows if isinstance(rows, list) else list(rows), columns=_FIELDS)
+    if df.empty:
+        return df
+    keep = df['metric'].astype(bool) & df['company'].astype(bool) & df['metric'].notna() & df['company'].notna()
+    df = df[keep.to_numpy()]
+    # 失败调用的行（extractor._error_row）没有 value/unit/year/type：与 vote_merge_group 的
+    # item.get(k, '') 一致按空字符串投票，而不是 NaN
+    df = df.fillna({f: '' for f in ('value', 'unit', 'year', 'type')})
+    for f in ('company', 'metric', 'unit', 'year', 'type', 'model'):
+        df[f] = df[f].astype('category')
+    return df
+
+
+def canonical_amounts(value: pd.Series, unit: pd.Series):
+    """Return (numeric vote key in base units or NaN, string vote key, unit vote key)."""
+    text = value.fillna('').astype(str).str.replace(r'[,，\s]', '', regex=True)
+    neg = text.str.match(r'^[（(].*[）)]$')
+    text = text.where(~neg, '-' + text.str.slice(1, -1))
+    num = pd.to_numeric(text, errors='coerce')
+    u = unit.astype(object).fillna('').astype(str).str.replace(_UNIT_NOISE, '', regex=True)
+    scale = u.map(UNIT_SCALE)
+    base = num * scale.fillna(1.0)
+    # 统一到 12 位有效数字，消除 1.5*1e8 与 15000*1e4 之间的浮点误差
+    mag = np.floor(np.log10(np.abs(base.where(base != 0, 1.0))))
+    factor = np.power(10.0, 11 - mag)
+    vnum = np.round(base * factor) / factor
+    vstr = text.where(num.isna(), '')
+    # 只有数值才换算到元；非数值（如“约5”）保留原单位，与 vote_merge_group 的分组一致
+    vunit = u.where(scale.isna() | num.isna(), '元')
+    return vnum, vstr, vunit
+
+
+def merge_frame(rows) -> pd.DataFrame:
+    """
+    Vote per (company, metric, page_id, para_id). `rows` is an iterable of extraction
+    dicts or a frame from load_frame. One output row per group, in order of first appearance.
+    """
+    t0 = time.perf_counter()
+    df = rows if isinstance(rows, pd.DataFrame) else load_frame(rows)
+    out = _vote(df)
+    telemetry.inc("merge_input_rows_total", len(df))
+    telemetry.observe("merge_seconds", time.perf_counter() - t0)
+    return out
+
+
+def merge_rows(rows) -> List[Dict[str, Any]]:
+    """merge_frame as records without the input/timing counters: the per-bucket merge for
+    merger.iter_merge_jsonl(..., merge_bucket=merge_rows), which counts those itself."""
+    return to_records(_vote(load_frame(rows)))
+
+
+def _vote(df: pd.DataFrame) -> pd.DataFrame:
+    n_in = len(df)
+    if not n_in:
+        return _empty()
+    df = df.reset_index(drop=True)
+    df['row'] = np.arange(n_in)
+    # 规范化只在不同的 (value, unit) 组合上做一次，再按编码展开回每一行
+    pair = df.groupby(['value', 'unit'], sort=False, dropna=False, observed=True)
+    codes = pair.ngroup().to_numpy()
+    uniq = pair.head(1)    # 各组首行，顺序与 ngroup(sort=False) 的编码一致
+    for col, vals in zip(('vnum', 'vstr', 'vunit'), canonical_amounts(uniq['value'], uniq['unit'])):
+        df[col] = vals.to_numpy()[codes]
+    vote = ['gid', 'vnum', 'vstr', 'vunit', 'year', 'type']
+
+    df['gid'] = df.groupby(_KEYS, sort=False, dropna=False, observed=True).ngroup()
+    by_vote = df.groupby(vote, sort=False, dropna=False, observed=True)
+    df['votes'] = by_vote['row'].transform('size')
+    df['first'] = by_vote['row'].transform('min')
+    df['vid'] = by_vote.ngroup()
+    by_group = df.groupby('gid', sort=False)
+    df['total'] = by_group['row'].transform('size')
+
+    # 每组：票数最多、其次最先出现的值；代表项是该值的第一条记录
+    win = df.sort_values(['gid', 'votes', 'first', 'row'], ascending=[True, False, True, True], kind='stable')
+    win = win.drop_duplicates('gid').set_index('gid').sort_index()
+    n_values = by_group['vid'].nunique().sort_index()
+    # support：按 gid 稳定排序后切分模型列，保持各组内的原始顺序
+    gids = df['gid'].to_numpy()
+    models = df['model'].astype(object).to_numpy()[np.argsort(gids, kind='stable')].tolist()
+    ends = np.cumsum(np.bincount(gids)).tolist()
+    support = [models[a:b] for a, b in zip([0] + ends[:-1], ends)]
+
+    ratio = win['votes'] / win['total']
+    single = win['total'] == 1
+    has_value = win['value'].fillna('').astype(str) != ''
+    confidence = np.select(
+        [single & has_value, single, ratio >= 0.8, ratio >= 0.5],
+        ['medium', 'low', 'high', 'medium'], 'low')
+
+    # gid 为 0..n-1，按位置即可定位各组
+    notes: List[List[str]] = [[] for _ in range(len(win))]
+    for i in np.flatnonzero((single & ~has_value).to_numpy()):
+        notes[i] = ['仅 1 个模型作答且未找到该指标']
+    multi = ~single
+    head = ('投票结果: ' + win.loc[multi, 'votes'].astype(str) + '/' + win.loc[multi, 'total'].astype(str)
+            + ' 模型支持此值')
+    for i, h in zip(np.flatnonzero(multi.to_numpy()), head):
+        notes[i] = [h]
+    disputed = n_values[n_values > 1].index
+    if len(disputed):
+        # 只对存在分歧的组拼接各候选值的票数：先整列拼出每个候选，再按 gid 切分
+        cand = df[df['gid'].isin(disputed) & (df['row'] == df['first'])]
+        cand = cand.sort_values(['gid', 'votes', 'first'], ascending=[True, False, True], kind='stable')
+        text = (cand['value'].astype(object).fillna('').astype(str) + ' ' + cand['unit'].astype(str) + ' ('
+                + cand['year'].astype(str) + ', ' + cand['type'].astype(str) + '): ' + cand['votes'].astype(str) + '票')
+        cgid = cand['gid'].to_numpy()
+        starts = np.r_[0, np.flatnonzero(np.diff(cgid)) + 1].tolist()
+        parts = text.tolist()
+        for gid, a, b in zip(cgid[starts].tolist(), starts, starts[1:] + [len(parts)]):
+            notes[gid].append('所有投票: ' + '; '.join(parts[a:b]))
+
+    out = pd.DataFrame({
+        'company': win['company'].astype(object),
+        'metric': win['metric'].astype(object),
+        'value': win['value'],
+        'unit': win['unit'].astype(object),
+        'year': win['year'].astype(object),
+        'type': win['type'].astype(object),
+        'confidence': confidence,
+        'page_id': win['page_id'],
+        'para_id': win['para_id'],
+        'support': pd.Series(support, index=win.index, dtype=object),
+        'notes': pd.Series(notes, index=win.index, dtype=object),
+    })
+    for conf, n in out['confidence'].value_counts().items():
+        telemetry.inc("merged_items_total", int(n), confidence=conf)
+    return out.reset_index(drop=True)
+
+
+def _empty() -> pd.DataFrame:
+    return pd.DataFrame(columns=['company', 'metric', 'value', 'unit', 'year', 'type', 'confidence',
+                                 'page_id', 'para_id', 'support', 'notes'])
+
+
+def to_records(frame: pd.DataFrame) -> List[Dict[str, Any]]:
+    recs = frame.astype(object).where(frame.notna(), None).to_dict('records')
+    for r in recs:
+        for k in ('page_id', 'para_id'):
+            if isinstance(r[k], float) and r[k].is_integer():
+                r[k] = int(r[k])
+    return recs
+
+
+def best_by_company(frame: pd.DataFrame) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """
+    company -> metric -> best merged item, like main.aggregate_merged_for_company:
+    highest confidence, then most supporting models, then lowest (page_id, para_id).
+    """
+    if frame.empty:
+        return {}
+    f = frame.reset_index(drop=True)
+    rank = f['confidence'].map(_RANK).fillna(0)
+    n_support = f['support'].map(len)
+    # 缺失的页/段号排在最后，同 merger.position_key
+    page = pd.to_numeric(f['page_id'], errors='coerce')
+    para = pd.to_numeric(f['para_id'], errors='coerce')
+    order = pd.DataFrame({'rank': rank, 'n': n_support, 'page_na': page.isna(), 'page': page.fillna(0),
+                          'para_na': para.isna(), 'para': para.fillna(0), 'pos': np.arange(len(f))})
+    order = order.sort_values(['rank', 'n', 'page_na', 'page', 'para_na', 'para', 'pos'],
+                              ascending=[False, False, True, True, True, True, True], kind='stable')
+    best = f.loc[order.index].drop_duplicates(['company', 'metric'])
+    # 输出顺序同 dict 版：公司、指标均按首次出现排序
+    first = f.reset_index().groupby(['company', 'metric'], sort=False)['index'].min()
+    best = best.set_index(['company', 'metric'])
+    best = best.loc[first.sort_values().index]
+    out: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    for (comp, metric), item in zip(best.index, to_records(best.reset_index())):
+        out.setdefault(comp or 'Unknown', {})[metric] = item
+    return out
@@ -53,8 +53,21 @@
 我能怎么写，请你用python帮我写这个代码.
 """
 
+import os
+import json
+import time
+import zlib
+import shutil
+import tempfile
 from collections import defaultdict, Counter
 
+try:
+    from tools import telemetry
+    from tools import jsonl
+except Exception:
+    import telemetry
+    import jsonl
+
 def merge_results(results):
     """
     合并多个大模型的提取结果，使用投票制度选择最优值
@@ -75,27 +88,112 @@ def merge_results(results):
         只保留指定的字段：value, unit, year, type, confidence, page_id, para_id, support, notes
     """
     
+    t0 = time.perf_counter()
     # 按 (company, metric, page_id, para_id) 分组
+    grouped = _group(results)
+    merged_results = list(_merge_groups(grouped))
+
+    telemetry.inc("merge_input_rows_total", len(results))
+    telemetry.observe("merge_seconds", time.perf_counter() - t0)
+    return merged_results
+
+
+# iter_merge_jsonl 每个桶最多读入内存的记录数；超过时该桶再细分
+MAX_BUCKET_ROWS = 200000
+_MAX_SPLIT_DEPTH = 4
+
+
+def iter_merge_jsonl(path, buckets=16, tmp_dir=None, merge_bucket=None, max_bucket_rows=MAX_BUCKET_ROWS):
+    """
+    流式版 merge_results：从 extractions.jsonl(.gz) 逐行读取，结果逐条 yield，内存不随文档数增长。
+
+    先按 (company, metric, page_id, para_id) 的哈希把记录分到 buckets 个临时 JSONL 文件
+    （只保留投票需要的字段，去掉 raw 等大字段），再逐个桶读入、分组、投票；
+    同一组的记录必然落在同一个桶里，所以结果与 merge_results 相同（顺序不同）。
+    记录数超过 max_bucket_rows 的桶按哈希的下一位再分成 buckets 份，直到每个桶都不超过上限
+    （同一组的记录不可拆分，单组超限时照常读入），所以内存上限与总行数无关。
+    merge_bucket(rows) -> 合并结果列表，可替换每个桶的投票实现（如 merge_columnar.merge_rows）。
+    """
+    t0 = time.perf_counter()
+    tmp = tempfile.mkdtemp(prefix="merge-", dir=tmp_dir)
+    counter = {"n": 0}
+
+    def source():
+        for result in jsonl.iter_jsonl(path):
+            counter["n"] += 1
+            if not result.get('metric') or not result.get('company'):
+                continue
+            yield {k: result.get(k) for k in _VOTE_FIELDS if k in result}
+
+    try:
+        yield from _merge_partitioned(source(), tmp, buckets, merge_bucket, max_bucket_rows, depth=0,
+                                      on_split=lambda: telemetry.inc("merge_input_rows_total", counter["n"]))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+        telemetry.observe("merge_seconds", time.perf_counter() - t0)
+
+
+def _merge_partitioned(rows, tmp, buckets, merge_bucket, max_bucket_rows, depth, on_split=None):
+    paths = [os.path.join(tmp, f"{depth}-{i:03d}.jsonl") for i in range(buckets)]
+    writers = [jsonl.JsonlWriter(p) for p in paths]
+    try:
+        # 第 depth 层取哈希的第 depth 位（buckets 进制）：同一桶里的组在下一层按下一位分散
+        # （CRC 是线性的，给 key 加盐只会把原来的划分换个编号，分不开）
+        div = buckets ** depth
+        for row in rows:
+            key = json.dumps(_key(row), ensure_ascii=False)
+            writers[zlib.crc32(key.encode("utf-8")) // div % buckets].write(row)
+    finally:
+        for w in writers:
+            w.close()
+    if on_split is not None:
+        on_split()
+    for p, w in zip(paths, writers):
+        if w.count > max_bucket_rows and depth < _MAX_SPLIT_DEPTH:
+            sub = tempfile.mkdtemp(prefix=f"{depth + 1}-", dir=tmp)
+            yield from _merge_partitioned(jsonl.iter_jsonl(p), sub, buckets, merge_bucket, max_bucket_rows, depth + 1)
+            shutil.rmtree(sub, ignore_errors=True)
+        elif merge_bucket is not None:
+            yield from merge_bucket(jsonl.iter_jsonl(p))
+        else:
+            yield from _merge_groups(_group(jsonl.iter_jsonl(p)))
+        os.remove(p)
+
+
+# 投票与输出用到的字段
+_VOTE_FIELDS = ('company', 'metric', 'value', 'unit', 'year', 'type', 'model', 'page_id', 'para_id')
+
+
+def position_key(item):
+    """(page_id, para_id) for ordering; missing ids sort last. Final tie-break between merged items."""
+    return tuple((v is None or v == '', v if isinstance(v, (int, float)) else 0) for v in
+                 (item.get('page_id'), item.get('para_id')))
+
+
+def _key(result):
+    return (
+        result.get('company', 'Unknown'),
+        result.get('metric', ''),
+        result.get('page_id', ''),
+        result.get('para_id', '')
+    )
+
+
+def _group(results):
     grouped = defaultdict(list)
     for result in results:
         # 跳过无效记录
         if not result.get('metric') or not result.get('company'):
             continue
-            
-        key = (
-            result.get('company', 'Unknown'),
-            result.get('metric', ''),
-            result.get('page_id', ''),
-            result.get('para_id', '')
-        )
-        grouped[key].append(result)
-    
-    merged_results = []
-    
+        grouped[_key(result)].append(result)
+    return grouped
+
+
+def _merge_groups(grouped):
     for (company, metric, page_id, para_id), group in grouped.items():
         # 对每组进行投票合并
         merged_item = vote_merge_group(group)
-        
+
         # 只保留指定的字段
         final_item = {
             'company': company,
@@ -110,9 +208,8 @@ def merge_results(results):
             'support': merged_item.get('support', []),
             'notes': merged_item.get('notes', [])
         }
-        merged_results.append(final_item)
-    
-    return merged_results
+        telemetry.inc("merged_items_total", confidence=final_item['confidence'])
+        yield final_item
 
 
 def vote_merge_group(group):
@@ -132,9 +229,15 @@ def vote_merge_group(group):
     # 如果只有一个结果，直接返回
     if len(group) == 1:
         result = group[0].copy()
-        result['confidence'] = 'medium'  # 单个模型默认中等置信度
         result['support'] = [result.get('model', 'unknown')]
-        result['notes'] = []
+        if result.get('value'):
+            result['confidence'] = 'medium'  # 单个模型默认中等置信度
+            result['notes'] = []
+        else:
+            # 单模型的空答案（如级联模式下主模型未找到，未请求复核）：低置信度，
+            # 避免在公司汇总时压过其他段落中抽到的实际数值
+            result['confidence'] = 'low'
+            result['notes'] = ['仅 1 个模型作答且未找到该指标']
         return result
     
     # 对提取的值进行投票
@@ -25,24 +25,81 @@ Output format (list of dicts):
 
 Dependencies (pip):
   pip install pdfplumber pymupdf pillow pytesseract pandas
+  (imported on first use: pdfplumber/fitz when a PDF is opened, pytesseract and
+  pandas only when an image is OCR'd)
 
 Tesseract: must have tesseract installed on the system and in PATH.
 For Chinese OCR use language packs (e.g. chi_sim). Configure `ocr_lang` if needed.
 
+Two engines produce the same Paragraph output (`engine=` of parse_pdf /
+iter_parse_pdf): "pdfplumber" (default; pdfplumber for words and tables, fitz
+for images) and "fitz", which does everything with PyMuPDF (words, tables via
+Page.find_tables, images) and is much faster on digital filings. The fitz
+engine classifies each page as digital or scanned before OCR: scanned pages
+(almost no text layer, images covering most of the page) have all images
+OCR'd, digital pages only images that cover real content (not small logos or
+backgrounds behind text-layer words). "auto" picks fitz when the installed
+PyMuPDF supports find_tables (1.23+), else pdfplumber.
+
+Pages can be parsed in parallel with `parse_pdf(..., workers=N)`: page ranges
+are sharded across worker processes (each opening its own pdfplumber/fitz
+handle) and para_id numbering is identical to the serial output.
+
+Parsed pages can be cached on disk with `parse_pdf(..., cache_dir=...)`. Entries
+are keyed on the PDF content hash, page number, PARSER_VERSION, ocr_lang,
+render_images and the OCR skip thresholds, so only pages missing from the cache
+are parsed (and OCR'd).
+Bump PARSER_VERSION whenever the parsing output changes.
+
+OCR runs Tesseract once per image (TSV output, from which both text and table
+are rebuilt) on a bounded thread pool. Tiny or near-uniform images are skipped
+(OCR_MIN_IMAGE_SIDE / OCR_MIN_ENTROPY) and repeated images are OCR'd once.
+
+Page/OCR counts and timings go to tools.telemetry (worker processes send
+theirs back with the parsed pages), as do tools.tracing spans under --trace.
+"""
+
 # === enhanced parser.py ===
 from __future__ import annotations
-import json, re, fitz, pdfplumber
+import os, sys, json, re, time, hashlib, tempfile
+from bisect import bisect_right
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass, asdict
-from typing import List, Optional, Any, Dict
-from PIL import Image
-import pytesseract
-import pandas as pd
+from typing import TYPE_CHECKING, List, Optional, Any, Dict, Iterator, Tuple
+# fitz / pdfplumber / PIL / pytesseract（连带 pandas）在真正解析、OCR 时才导入，
+# 导入本模块（main.py、server.py 启动）不付这部分开销；类型标注用的名字只给类型检查器导入
+if TYPE_CHECKING:
+    import fitz
+    from PIL import Image
+
+try:
+    from tools import telemetry
+except Exception:
+    import telemetry
+try:
+    from tools import tracing
+except Exception:
+    import tracing
 
 DEFAULT_OCR_LANG = "chi_sim+eng"
 IMAGE_DPI = 300
 ROW_Y_EPS = 8
+PARSER_VERSION = "3"
+OCR_WORKERS = 4             # 每个解析进程内并发的 tesseract 数
+OCR_MIN_IMAGE_SIDE = 32     # 短边小于该像素数的图片（图标、线条）不做 OCR
+OCR_MIN_ENTROPY = 1.0       # 灰度熵低于该值的图片（纯色背景、简单 logo）不做 OCR
+ENGINES = ("pdfplumber", "fitz", "auto")
+# fitz 引擎的页面分类：文本层不足 SCANNED_MAX_CHARS 字且图片覆盖至少 SCANNED_MIN_IMAGE_COVER
+# 页面的视为扫描页，页内图片全部 OCR；其余为数字页，只 OCR 面积不小于 OCR_MIN_IMAGE_COVER、
+# 且所覆盖区域内文本层不足 OCR_MAX_COVERED_CHARS 字的图片（图表、截图，而非 logo 或文字背景图）
+WORD_X_TOLERANCE = 3        # fitz 引擎：同一行内相邻词合并的最大间距（pt），同 pdfplumber 默认值
+SCANNED_MAX_CHARS = 50
+SCANNED_MIN_IMAGE_COVER = 0.5
+OCR_MIN_IMAGE_COVER = 0.02
+OCR_MAX_COVERED_CHARS = 20
 
-@dataclass
+# 每页可能产生上千个段落对象：有 slots 支持（3.10+）时不带 __dict__
+@dataclass(**({"slots": True} if sys.version_info >= (3, 10) else {}))
 class Paragraph:
     page_id: int
     para_id: int
@@ -62,110 +119,524 @@ def _split_paragraphs(text: str) -> List[str]:
     return parts
 
 def _ocr_image_get_text_and_table(img: Image.Image, ocr_lang: str = DEFAULT_OCR_LANG) -> Dict[str, Any]:
-    ocr_text = pytesseract.image_to_string(img, lang=ocr_lang)
+    """Run Tesseract once (TSV output) and rebuild both plain text and a row-grouped table."""
+    import pytesseract   # Output.DATAFRAME 需要 pandas，只在 OCR 时加载
     tsv = pytesseract.image_to_data(img, lang=ocr_lang, output_type=pytesseract.Output.DATAFRAME)
     if tsv.empty:
-        return {"text": ocr_text.strip(), "table": None}
-    tsv = tsv[tsv.conf != -1]
+        return {"text": "", "table": None}
+    tsv = tsv[tsv.conf != -1].copy()
+    tsv['text'] = tsv['text'].fillna('').astype(str).str.strip()
+    tsv = tsv[tsv['text'] != '']
+    if tsv.empty:
+        return {"text": "", "table": None}
+
+    # 纯文本：按 block/par/line 还原，与 image_to_string 的换行结构一致
+    paras = []
+    for _, par in tsv.groupby(['block_num', 'par_num'], sort=True):
+        lines = [' '.join(g.sort_values('word_num')['text']) for _, g in par.groupby('line_num', sort=True)]
+        paras.append('\n'.join(lines))
+    ocr_text = '\n\n'.join(paras)
+
     rows = []
-    if not tsv.empty:
-        tsv['row_key'] = (tsv['top'] / ROW_Y_EPS).round().astype(int)
-        grouped = tsv.groupby('row_key')
-        for _, g in grouped:
-            row_words = [str(w) for w in g.sort_values('left')['text'].tolist() if str(w).strip()]
-            if row_words:
-                rows.append(row_words)
+    tsv['row_key'] = (tsv['top'] / ROW_Y_EPS).round().astype(int)
+    for _, g in tsv.groupby('row_key'):
+        row_words = g.sort_values('left')['text'].tolist()
+        if row_words:
+            rows.append(row_words)
     table = None
     if len(rows) >= 2 and any(len(r) > 1 for r in rows):
         table = rows
     return {"text": ocr_text.strip(), "table": table}
 
-def _extract_images_with_bbox(mupdf_doc: fitz.Document, page_number: int):
-    """Return list of (PIL Image, bbox) for each image."""
-    pg = mupdf_doc.load_page(page_number)
+def _page_images(mupdf_doc: fitz.Document, page_number: int, pg: Optional[fitz.Page] = None):
+    """Return list of (xref, digest, bbox) for each image on the page."""
+    pg = pg if pg is not None else mupdf_doc.load_page(page_number)
+    infos: Dict[int, List[Dict[str, Any]]] = {}
+    for b in pg.get_image_info(hashes=True, xrefs=True):
+        infos.setdefault(b.get("xref"), []).append(b)
     items = []
     for img in pg.get_images(full=True):
         xref = img[0]
-        bbox = None
-        # 查找图片矩形
-        for b in pg.get_image_info(xref):
-            bbox = [b["bbox"].x0, b["bbox"].y0, b["bbox"].x1, b["bbox"].y1]
+        # 查找图片矩形；同一 xref 在页内多次出现时按顺序对应
+        placed = infos.get(xref)
+        info = placed.pop(0) if placed else None
+        bbox = [float(v) for v in info["bbox"]] if info else None
+        digest = info["digest"].hex() if info and info.get("digest") else None
+        items.append((xref, digest, bbox))
+    return items
+
+def _load_image(mupdf_doc: fitz.Document, xref: int) -> Optional[Image.Image]:
+    import fitz
+    from PIL import Image
+    try:
+        pix = fitz.Pixmap(mupdf_doc, xref)
+        if pix.n >= 5:
+            pix = fitz.Pixmap(fitz.csRGB, pix)
+        mode = "RGB" if pix.n >= 3 else "L"
+        return Image.frombytes(mode, [pix.width, pix.height], pix.samples)
+    except Exception:
+        return None
+
+def _is_ocr_worthy(img: Image.Image, min_side: int, min_entropy: float) -> bool:
+    """Skip tiny images (icons, rules) and near-uniform ones (backgrounds, solid logos)."""
+    if min(img.size) < min_side:
+        return False
+    if min_entropy > 0:
+        gray = img.convert("L")
+        gray.thumbnail((256, 256))
+        if gray.entropy() < min_entropy:
+            return False
+    return True
+
+def _ocr_job(img: Image.Image, ocr_lang: str) -> Dict[str, Any]:
+    with telemetry.timer("ocr_image_seconds"), tracing.span("ocr_image", cat="ocr", width=img.width, height=img.height):
+        if max(img.size) < 800:
+            scale = int(IMAGE_DPI / 72)
+            img = img.resize((img.width * scale, img.height * scale))
+        return _ocr_image_get_text_and_table(img, ocr_lang)
+
+class _OcrPool:
+    """Bounded OCR thread pool for one document.
+
+    Images are deduplicated by content digest (falling back to xref), so a logo
+    repeated on every page is decoded and OCR'd once.
+    """
+
+    def __init__(self, mdoc: fitz.Document, ocr_lang: str, workers: int, min_side: int, min_entropy: float):
+        self.mdoc = mdoc
+        self.ocr_lang = ocr_lang
+        self.min_side = min_side
+        self.min_entropy = min_entropy
+        self._ex = ThreadPoolExecutor(max_workers=max(1, workers))
+        self._jobs: Dict[Any, Optional[Future]] = {}
+
+    def submit(self, xref: int, digest: Optional[str]) -> Optional[Future]:
+        """Future of the OCR result, or None if the image could not be decoded."""
+        key = digest or ("xref", xref)
+        if key not in self._jobs:
+            self._jobs[key] = self._start(xref)
+        else:
+            telemetry.inc("ocr_images_total", result="dedup")
+        return self._jobs[key]
+
+    def _start(self, xref: int) -> Optional[Future]:
+        # fitz 句柄不是线程安全的，解码留在调用线程，只把 OCR 放进线程池
+        img = _load_image(self.mdoc, xref)
+        if img is None:
+            telemetry.inc("ocr_images_total", result="undecodable")
+            return None
+        if not _is_ocr_worthy(img, self.min_side, self.min_entropy):
+            telemetry.inc("ocr_images_total", result="skipped")
+            return _no_ocr()
+        telemetry.inc("ocr_images_total", result="ocr")
+        return self._ex.submit(_ocr_job, img, self.ocr_lang)
+
+    def close(self):
+        self._ex.shutdown(wait=True)
+
+def _join_words(words: List[Dict[str, Any]]):
+    """Join word texts with spaces; also return each word's start offset in the joined text."""
+    starts, pos = [], 0
+    for w in words:
+        starts.append(pos)
+        pos += len(w["text"]) + 1
+    return " ".join(w["text"] for w in words), starts
+
+def _span_bbox(words: List[Dict[str, Any]], starts: List[int], begin: int, end: int) -> Optional[List[float]]:
+    """Bounding box of the words overlapping character range [begin, end) of the joined text."""
+    i = bisect_right(starts, begin) - 1
+    if i < 0:
+        i = 0
+    x0 = y0 = float("inf")
+    x1 = y1 = float("-inf")
+    while i < len(words) and starts[i] < end:
+        w = words[i]
+        x0, y0 = min(x0, w["x0"]), min(y0, w["top"])
+        x1, y1 = max(x1, w["x1"]), max(y1, w["bottom"])
+        i += 1
+    if x0 == float("inf"):
+        return None
+    return [x0, y0, x1, y1]
+
+def _parse_page(page, mdoc: fitz.Document, page_idx: int, ocr: Optional[_OcrPool]):
+    """Parse one page.
+
+    Returns (paragraphs, used) where each paragraph's para_id is its 1-based
+    slot within the page and `used` is the number of para_id slots consumed
+    (an image without OCR output still consumes a slot).
+    """
+    page_no = page_idx + 1
+    results: List[Paragraph] = []
+    para_counter = 1
+
+    # --- 1. 文本段落 + bbox ---
+    try:
+        words = page.extract_words()  # 每个词有 x0, top, x1, bottom；每页只提取一次
+        para_counter = _text_paragraphs(words, page_no, para_counter, results)
+    except Exception:
+        pass
+
+    # --- 2. 表格 ---
+    try:
+        tables = page.find_tables()
+    except Exception:
+        tables = []
+    para_counter = _table_paragraphs(tables, page_no, para_counter, results)
+
+    # --- 3. 图片 + OCR ---
+    if ocr is not None:
+        # 先提交整页图片，再按顺序取结果，保证 para_id 稳定
+        jobs = [(ocr.submit(xref, digest), bbox) for xref, digest, bbox in _page_images(mdoc, page_idx)]
+        para_counter = _image_paragraphs(jobs, page_no, para_counter, results)
+
+    return results, para_counter - 1
+
+def _text_paragraphs(words: List[Dict[str, Any]], page_no: int, para_counter: int, results: List[Paragraph]) -> int:
+    """Split the page's words into text paragraphs with bboxes; returns the next para slot."""
+    if not words:
+        return para_counter
+    text, starts = _join_words(words)
+    cursor = 0
+    for p in _split_paragraphs(text):
+        # 段落是 text 的有序子串，顺序查找其字符区间，再用索引定位覆盖的词
+        pos = text.find(p, cursor)
+        if pos >= 0:
+            cursor = pos + len(p)
+            bbox = _span_bbox(words, starts, pos, cursor)
+        else:
+            bbox = None
+        results.append(Paragraph(page_no, para_counter, "text", p, bbox=bbox))
+        para_counter += 1
+    return para_counter
+
+def _table_paragraphs(tables, page_no: int, para_counter: int, results: List[Paragraph]) -> int:
+    # pdfplumber 与 PyMuPDF 的表格对象都有 extract() 与 bbox
+    for table in tables:
         try:
-            pix = fitz.Pixmap(mupdf_doc, xref)
-            if pix.n >= 5:
-                pix = fitz.Pixmap(fitz.csRGB, pix)
-            mode = "RGB" if pix.n >= 3 else "L"
-            img_pil = Image.frombytes(mode, [pix.width, pix.height], pix.samples)
-            items.append((img_pil, bbox))
+            rows = table.extract()
         except Exception:
             continue
-    return items
+        clean_rows = [[(cell or "").strip() for cell in row] for row in rows]
+        text_repr = '\n'.join([' | '.join(r) for r in clean_rows if any(c.strip() for c in r)])
+        bbox = [float(v) for v in table.bbox] if table.bbox else None
+        results.append(Paragraph(page_no, para_counter, "table", text_repr, raw_table=clean_rows, bbox=bbox))
+        para_counter += 1
+    return para_counter
 
-def parse_pdf(pdf_path: str, ocr_lang: str = DEFAULT_OCR_LANG, render_images: bool = True) -> List[Dict[str, Any]]:
+def _image_paragraphs(jobs, page_no: int, para_counter: int, results: List[Paragraph]) -> int:
+    """OCR results in page order; every image consumes a para slot, except undecodable ones."""
+    for job, bbox in jobs:
+        if job is None:
+            continue
+        ocr_res = job.result()
+        text_o, tab = ocr_res.get('text', ''), ocr_res.get('table')
+        if tab:
+            text_repr = '\n'.join([' | '.join(r) for r in tab])
+            results.append(Paragraph(page_no, para_counter, "image_table", text_repr, raw_table=tab, bbox=bbox))
+        elif text_o:
+            results.append(Paragraph(page_no, para_counter, "image_text", text_o, bbox=bbox))
+        para_counter += 1
+    return para_counter
+
+def _no_ocr() -> Future:
+    fut: Future = Future()
+    fut.set_result({"text": "", "table": None})
+    return fut
+
+def _classify_page(words: List[Dict[str, Any]], images, page_area: float) -> str:
+    """'scanned' when the text layer is (almost) empty and images cover most of the page, else 'digital'."""
+    chars = sum(len(w["text"]) for w in words)
+    if chars >= SCANNED_MAX_CHARS or not images or page_area <= 0:
+        return "digital"
+    cover = sum((b[2] - b[0]) * (b[3] - b[1]) for _, _, b in images if b) / page_area
+    # 没有位置信息的图片按整页扫描件处理
+    if cover >= SCANNED_MIN_IMAGE_COVER or any(b is None for _, _, b in images):
+        return "scanned"
+    return "digital"
+
+def _covers_content(bbox: Optional[List[float]], words: List[Dict[str, Any]], page_area: float) -> bool:
+    """On a digital page: is the image big enough, and not just a background behind text-layer words?"""
+    if not bbox or page_area <= 0:
+        return True
+    x0, y0, x1, y1 = bbox
+    if (x1 - x0) * (y1 - y0) < OCR_MIN_IMAGE_COVER * page_area:
+        return False
+    covered = 0
+    for w in words:
+        cx, cy = (w["x0"] + w["x1"]) / 2, (w["top"] + w["bottom"]) / 2
+        if x0 <= cx <= x1 and y0 <= cy <= y1:
+            covered += len(w["text"])
+            if covered >= OCR_MAX_COVERED_CHARS:
+                return False
+    return True
+
+def _fitz_words(fpage) -> List[Dict[str, Any]]:
+    # 与 pdfplumber.extract_words 相同的字段，按阅读顺序（行、再从左到右）；
+    # 同一行内间距不超过 WORD_X_TOLERANCE 的相邻词合并（pdfplumber 的 x_tolerance），
+    # 否则 "2023年" 这类分段绘制的文字会被拆成 "2023 年"
+    words: List[Dict[str, Any]] = []
+    line = None
+    for x0, y0, x1, y1, text, block_no, line_no, _ in fpage.get_text("words", sort=True):
+        if words and line == (block_no, line_no) and x0 - words[-1]["x1"] <= WORD_X_TOLERANCE:
+            w = words[-1]
+            w["text"] += text
+            w["x1"], w["top"], w["bottom"] = x1, min(w["top"], y0), max(w["bottom"], y1)
+        else:
+            words.append({"text": text, "x0": x0, "top": y0, "x1": x1, "bottom": y1})
+        line = (block_no, line_no)
+    return words
+
+def _parse_page_fitz(fpage, mdoc: fitz.Document, page_idx: int, ocr: Optional[_OcrPool]):
+    """PyMuPDF-only counterpart of _parse_page (same Paragraph output and para slots).
+
+    The page is classified up front: on scanned pages every image is OCR'd,
+    on digital pages only images that cover real content (see _covers_content).
+    """
+    page_no = page_idx + 1
     results: List[Paragraph] = []
     para_counter = 1
 
+    try:
+        words = _fitz_words(fpage)
+    except Exception:
+        words = []
+    images = _page_images(mdoc, page_idx, fpage) if ocr is not None else []
+    page_area = float(fpage.rect.width * fpage.rect.height)
+    kind = _classify_page(words, images, page_area)
+    telemetry.inc("parse_page_kinds_total", kind=kind)
+
+    try:
+        para_counter = _text_paragraphs(words, page_no, para_counter, results)
+    except Exception:
+        pass
+
+    try:
+        tables = fpage.find_tables().tables
+    except Exception:
+        tables = []
+    para_counter = _table_paragraphs(tables, page_no, para_counter, results)
+
+    if ocr is not None:
+        jobs = []
+        for xref, digest, bbox in images:
+            if kind == "scanned" or _covers_content(bbox, words, page_area):
+                jobs.append((ocr.submit(xref, digest), bbox))
+            else:
+                # 不 OCR 也占一个段落序号，与 pdfplumber 引擎一致
+                telemetry.inc("ocr_images_total", result="skipped_digital")
+                jobs.append((_no_ocr(), bbox))
+        para_counter = _image_paragraphs(jobs, page_no, para_counter, results)
+
+    return results, para_counter - 1
+
+def resolve_engine(engine: str) -> str:
+    """'auto' -> 'fitz' when this PyMuPDF can find tables (1.23+), otherwise 'pdfplumber'."""
+    if engine not in ENGINES:
+        raise ValueError(f"unknown parser engine {engine!r} (expected one of {', '.join(ENGINES)})")
+    if engine != "auto":
+        return engine
+    import fitz
+    return "fitz" if hasattr(fitz.Page, "find_tables") else "pdfplumber"
+
+def _iter_parse_pages(pdf_path: str, page_idxs: List[int], ocr_lang: str, render_images: bool,
+                      ocr_opts: Dict[str, Any], engine: str = "pdfplumber") -> Iterator[Tuple[List[Paragraph], int]]:
+    """Parse the given pages in order with one pdfplumber/fitz handle pair, yielding each page's result."""
+    if engine == "fitz":
+        yield from _iter_parse_pages_fitz(pdf_path, page_idxs, ocr_lang, render_images, ocr_opts)
+        return
+    import fitz, pdfplumber
     with pdfplumber.open(pdf_path) as pdf, fitz.open(pdf_path) as mdoc:
-        for page_idx, page in enumerate(pdf.pages):
-            page_no = page_idx + 1
+        ocr = _OcrPool(mdoc, ocr_lang, **ocr_opts) if render_images else None
+        try:
+            for page_idx in page_idxs:
+                t0 = time.perf_counter()
+                page = pdf.pages[page_idx]
+                with tracing.span("parse_page", cat="parser", pdf=os.path.basename(pdf_path), page=page_idx + 1):
+                    try:
+                        res = _parse_page(page, mdoc, page_idx, ocr)
+                    finally:
+                        # 释放该页缓存的字符/版面对象，否则内存随已解析页数增长
+                        page.close()
+                telemetry.observe("parse_page_seconds", time.perf_counter() - t0)
+                telemetry.inc("parse_pages_total", source="parsed")
+                yield res
+        finally:
+            if ocr is not None:
+                ocr.close()
+
+def _iter_parse_pages_fitz(pdf_path: str, page_idxs: List[int], ocr_lang: str, render_images: bool,
+                           ocr_opts: Dict[str, Any]) -> Iterator[Tuple[List[Paragraph], int]]:
+    """Like _iter_parse_pages with a single PyMuPDF handle (no pdfplumber)."""
+    import fitz
+    with fitz.open(pdf_path) as mdoc:
+        ocr = _OcrPool(mdoc, ocr_lang, **ocr_opts) if render_images else None
+        try:
+            for page_idx in page_idxs:
+                t0 = time.perf_counter()
+                with tracing.span("parse_page", cat="parser", pdf=os.path.basename(pdf_path), page=page_idx + 1,
+                                  engine="fitz"):
+                    res = _parse_page_fitz(mdoc.load_page(page_idx), mdoc, page_idx, ocr)
+                telemetry.observe("parse_page_seconds", time.perf_counter() - t0)
+                telemetry.inc("parse_pages_total", source="parsed")
+                yield res
+        finally:
+            if ocr is not None:
+                ocr.close()
+
+def _parse_pages(pdf_path: str, page_idxs: List[int], ocr_lang: str, render_images: bool,
+                 ocr_opts: Dict[str, Any], trace: bool = False, engine: str = "pdfplumber"):
+    """Worker entry point: parse the given pages with its own pdfplumber/fitz handles.
+
+    Returns (page results, raw telemetry snapshot of this shard, trace events).
+    """
+    telemetry.reset()
+    if trace:
+        tracing.start()
+    else:
+        tracing.stop()
+    res = list(_iter_parse_pages(pdf_path, page_idxs, ocr_lang, render_images, ocr_opts, engine))
+    return res, telemetry.snapshot(raw=True), tracing.drain() if trace else []
 
-            # --- 1. 文本段落 + bbox ---
+def _shard_result(fut) -> List[Any]:
+    res, snap, events = fut.result()
+    telemetry.merge(snap)
+    tracing.extend(events)
+    return res
+
+# ---------- 解析缓存 ----------
+
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _cache_variant(ocr_lang: str, render_images: bool, ocr_opts: Dict[str, Any], engine: str = "pdfplumber") -> str:
+    variant = f"v{PARSER_VERSION}-{re.sub(r'[^A-Za-z0-9_+-]', '_', ocr_lang)}"
+    if engine == "fitz":
+        variant += (f"-fitz-c{SCANNED_MAX_CHARS}-{SCANNED_MIN_IMAGE_COVER}"
+                    f"-o{OCR_MIN_IMAGE_COVER}-{OCR_MAX_COVERED_CHARS}")
+    if not render_images:
+        return f"{variant}-noimg"
+    return f"{variant}-img-s{ocr_opts['min_side']}-e{ocr_opts['min_entropy']}"
+
+def parse_variant(ocr_lang: str = DEFAULT_OCR_LANG, render_images: bool = True,
+                  ocr_min_side: int = OCR_MIN_IMAGE_SIDE, ocr_min_entropy: float = OCR_MIN_ENTROPY,
+                  engine: str = "pdfplumber") -> str:
+    """Identifies the parse output for these options (version, engine and its thresholds, OCR
+    settings): pages cached, or paragraph ids stored, under another variant do not match."""
+    return _cache_variant(ocr_lang, render_images, {"min_side": ocr_min_side, "min_entropy": ocr_min_entropy},
+                          resolve_engine(engine))
+
+def _cache_page_path(cache_dir: str, pdf_hash: str, page_idx: int, variant: str) -> str:
+    return os.path.join(cache_dir, pdf_hash[:2], pdf_hash, variant, f"{page_idx + 1}.json")
+
+def _load_cached_page(path: str):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+        return [Paragraph(**d) for d in entry["paragraphs"]], entry["used"]
+    except Exception:
+        return None
+
+def _save_cached_page(path: str, page_result) -> None:
+    paras, used = page_result
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # 每次写入独立的临时文件：同一进程内的多个线程（server 任务、corpus）也可能同时缓存同一页
+    fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"used": used, "paragraphs": [asdict(p) for p in paras]}, f, ensure_ascii=False)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+def _page_shards(page_idxs: List[int], workers: int) -> List[List[int]]:
+    # 切成比 worker 数更多的小段，避免个别页（大量 OCR）拖慢整体
+    n_shards = min(len(page_idxs), workers * 4)
+    if n_shards <= 0:
+        return []
+    size, rem = divmod(len(page_idxs), n_shards)
+    shards, start = [], 0
+    for i in range(n_shards):
+        end = start + size + (1 if i < rem else 0)
+        shards.append(page_idxs[start:end])
+        start = end
+    return shards
+
+def iter_parse_pdf(pdf_path: str, ocr_lang: str = DEFAULT_OCR_LANG, render_images: bool = True, workers: int = 1,
+                   cache_dir: Optional[str] = None, ocr_workers: int = OCR_WORKERS,
+                   ocr_min_side: int = OCR_MIN_IMAGE_SIDE, ocr_min_entropy: float = OCR_MIN_ENTROPY,
+                   engine: str = "pdfplumber") -> Iterator[Dict[str, Any]]:
+    """Like parse_pdf, but yield paragraphs page by page as soon as each page is parsed."""
+    import fitz
+    engine = resolve_engine(engine)
+    ocr_opts = {"workers": ocr_workers, "min_side": ocr_min_side, "min_entropy": ocr_min_entropy}
+    with fitz.open(pdf_path) as mdoc:
+        n_pages = mdoc.page_count
+
+    cached: List[Any] = [None] * n_pages
+    cache_paths: Dict[int, str] = {}
+    if cache_dir:
+        pdf_hash = _file_sha256(pdf_path)
+        variant = _cache_variant(ocr_lang, render_images, ocr_opts, engine)
+        for page_idx in range(n_pages):
+            path = _cache_page_path(cache_dir, pdf_hash, page_idx, variant)
+            cache_paths[page_idx] = path
+            cached[page_idx] = _load_cached_page(path)
+    missing = [i for i, r in enumerate(cached) if r is None]
+    if n_pages > len(missing):
+        telemetry.inc("parse_pages_total", n_pages - len(missing), source="cache")
+
+    def page_results() -> Iterator[Tuple[int, Any]]:
+        if missing and workers and workers > 1:
+            shards = _page_shards(missing, workers)
+            with ProcessPoolExecutor(max_workers=min(workers, len(shards))) as ex:
+                futs = [ex.submit(_parse_pages, pdf_path, shard, ocr_lang, render_images, ocr_opts,
+                                  tracing.enabled(), engine) for shard in shards]
+                parsed = iter(zip(missing, (res for f in futs for res in _shard_result(f))))
+                yield from _merge_cached(cached, parsed)
+        else:
+            parsed = zip(missing, _iter_parse_pages(pdf_path, missing, ocr_lang, render_images, ocr_opts, engine))
+            yield from _merge_cached(cached, parsed)
+
+    # 每页内 para_id 是页内序号，这里按页累加成全局序号（与串行结果一致）
+    base = 0
+    for page_idx, (paras, used) in page_results():
+        if cache_dir and cached[page_idx] is None:
             try:
-                words = page.extract_words()  # 每个词有 x0, top, x1, bottom
-                if words:
-                    text = " ".join(w["text"] for w in words)
-                    paras = _split_paragraphs(text)
-                    for p in paras:
-                        # 定位该段文字的坐标范围
-                        w_in_para = [w for w in words if p[:10] in w["text"]] if p else []
-                        if w_in_para:
-                            x0 = min(w["x0"] for w in w_in_para)
-                            y0 = min(w["top"] for w in w_in_para)
-                            x1 = max(w["x1"] for w in w_in_para)
-                            y1 = max(w["bottom"] for w in w_in_para)
-                            bbox = [x0, y0, x1, y1]
-                        else:
-                            bbox = None
-                        results.append(Paragraph(page_no, para_counter, "text", p, bbox=bbox))
-                        para_counter += 1
-            except Exception:
+                _save_cached_page(cache_paths[page_idx], (paras, used))
+            except OSError:
                 pass
+        for p in paras:
+            telemetry.inc("paragraphs_total", type=p.type)
+            d = asdict(p)
+            d["para_id"] += base
+            yield d
+        base += used
 
-            # --- 2. 表格 ---
-            try:
-                tables = page.extract_tables()
-            except Exception:
-                tables = []
-            for table in tables:
-                clean_rows = [[(cell or "").strip() for cell in row] for row in table]
-                text_repr = '\n'.join([' | '.join(r) for r in clean_rows if any(c.strip() for c in r)])
-                # pdfplumber table 没直接 bbox，用表格所有文字 bbox 估计
-                try:
-                    words = page.extract_words()
-                    x0 = min(w["x0"] for w in words)
-                    y0 = min(w["top"] for w in words)
-                    x1 = max(w["x1"] for w in words)
-                    y1 = max(w["bottom"] for w in words)
-                    bbox = [x0, y0, x1, y1]
-                except Exception:
-                    bbox = None
-                results.append(Paragraph(page_no, para_counter, "table", text_repr, raw_table=clean_rows, bbox=bbox))
-                para_counter += 1
-
-            # --- 3. 图片 + OCR ---
-            if render_images:
-                for img, bbox in _extract_images_with_bbox(mdoc, page_idx):
-                    if max(img.size) < 800:
-                        scale = int(IMAGE_DPI / 72)
-                        new_size = (img.width * scale, img.height * scale)
-                        img = img.resize(new_size)
-                    ocr_res = _ocr_image_get_text_and_table(img, ocr_lang)
-                    text_o, tab = ocr_res.get('text', ''), ocr_res.get('table')
-                    if tab:
-                        text_repr = '\n'.join([' | '.join(r) for r in tab])
-                        results.append(Paragraph(page_no, para_counter, "image_table", text_repr, raw_table=tab, bbox=bbox))
-                    elif text_o:
-                        results.append(Paragraph(page_no, para_counter, "image_text", text_o, bbox=bbox))
-                    para_counter += 1
-
-    return [asdict(p) for p in results]
+def _merge_cached(cached: List[Any], parsed: Iterator[Tuple[int, Any]]) -> Iterator[Tuple[int, Any]]:
+    """Interleave cached page results with freshly parsed ones (both in page order)."""
+    nxt = 0
+    for page_idx, res in parsed:
+        # parsed 只包含未命中缓存的页，其间的页都在缓存里
+        while nxt < page_idx:
+            yield nxt, cached[nxt]
+            nxt += 1
+        yield page_idx, res
+        nxt = page_idx + 1
+    while nxt < len(cached):
+        yield nxt, cached[nxt]
+        nxt += 1
+
+def parse_pdf(pdf_path: str, ocr_lang: str = DEFAULT_OCR_LANG, render_images: bool = True, workers: int = 1,
+              cache_dir: Optional[str] = None, ocr_workers: int = OCR_WORKERS,
+              ocr_min_side: int = OCR_MIN_IMAGE_SIDE, ocr_min_entropy: float = OCR_MIN_ENTROPY,
+              engine: str = "pdfplumber") -> List[Dict[str, Any]]:
+    return list(iter_parse_pdf(pdf_path, ocr_lang, render_images, workers, cache_dir,
+                               ocr_workers, ocr_min_side, ocr_min_entropy, engine))
@@ -0,0 +1,112 @@
+# 相关性预筛：跳过不可能包含指标的段落
+
+# path: tools/prefilter.py
+"""
+Cheap relevance prefilter run before the LLM stage.
+
+Each (paragraph, metric) pair is scored from three features on the paragraph
+text (whitespace removed, so OCR output like "营 业 收 入" still matches):
+
+- a synonym of the metric occurs (config.METRIC_SYNONYMS, e.g. 营收/营业收入/营业总收入)
+- a numeric token occurs (bare years such as "2024年" do not count)
+- a numeric token lies within WINDOW characters of a synonym hit
+
+Only pairs whose score reaches the threshold are sent to the models. With the
+default weights and threshold a pair needs both a synonym and a number;
+proximity only raises the score.
+
+Usage:
+    flt = RelevanceFilter(cfg.METRIC_SYNONYMS, threshold=cfg.PREFILTER_THRESHOLD)
+    extract_metrics(paras, metrics, select_metrics=flt)
+    print(flt.summary())
+"""
+
+from __future__ import annotations
+
+import re
+from bisect import bisect_left
+from typing import Dict, List, Optional, Any
+
+W_SYNONYM = 0.4
+W_NUMBER = 0.3
+W_NEAR = 0.3
+DEFAULT_THRESHOLD = 0.7
+WINDOW = 60
+
+_WS_RE = re.compile(r"\s+")
+_NUM_RE = re.compile(r"(?<![\d.])\d+(?:[,，]\d{3})*(?:\.\d+)?(?![\d])")
+_YEAR_RE = re.compile(r"(?:19|20)\d{2}")
+
+
+def _numeric_positions(text: str) -> List[int]:
+    pos = []
+    for m in _NUM_RE.finditer(text):
+        tok = m.group(0)
+        # "2024年" / "2023年度" 只是年份，不算数值
+        if _YEAR_RE.fullmatch(tok) and text[m.end():m.end() + 1] == "年":
+            continue
+        pos.append(m.start())
+    return pos
+
+
+def _synonym_positions(text: str, synonyms: List[str]) -> List[int]:
+    pos = []
+    for syn in synonyms:
+        start = text.find(syn)
+        while start >= 0:
+            pos.append(start)
+            start = text.find(syn, start + 1)
+    return sorted(pos)
+
+
+def score(text: str, synonyms: List[str], window: int = WINDOW) -> float:
+    """Relevance score in [0, 1] of `text` for a metric with the given synonyms."""
+    t = _WS_RE.sub("", text or "")
+    syn_pos = _synonym_positions(t, synonyms)
+    num_pos = _numeric_positions(t)
+    s = 0.0
+    if syn_pos:
+        s += W_SYNONYM
+    if num_pos:
+        s += W_NUMBER
+    if syn_pos and num_pos:
+        for p in syn_pos:
+            i = bisect_left(num_pos, p - window)
+            if i < len(num_pos) and num_pos[i] <= p + window:
+                s += W_NEAR
+                break
+    return s
+
+
+class RelevanceFilter:
+    """
+    Callable metric selector for extractor.extract_metrics(select_metrics=...).
+
+    Returns the metrics of `metrics` worth asking about for one paragraph, and
+    counts kept/skipped (paragraph, metric) pairs for the run summary.
+    """
+
+    def __init__(self, synonyms: Optional[Dict[str, List[str]]] = None, threshold: float = DEFAULT_THRESHOLD,
+                 window: int = WINDOW):
+        self.synonyms = synonyms or {}
+        self.threshold = threshold
+        self.window = window
+        self.kept = 0
+        self.skipped = 0
+
+    def synonyms_for(self, metric: str) -> List[str]:
+        syns = list(self.synonyms.get(metric) or [])
+        if metric not in syns:
+            syns.append(metric)
+        return syns
+
+    def __call__(self, para: Dict[str, Any], metrics: List[str]) -> List[str]:
+        text = para.get("text") or ""
+        sel = [m for m in metrics if score(text, self.synonyms_for(m), self.window) >= self.threshold]
+        self.kept += len(sel)
+        self.skipped += len(metrics) - len(sel)
+        return sel
+
+    def summary(self) -> str:
+        total = self.kept + self.skipped
+        return f"prefilter kept {self.kept}/{total} (paragraph, metric) pairs, skipped {self.skipped}"
@@ -0,0 +1,265 @@
+# 按服务商限流、重试与自适应并发
+
+# path: tools/ratelimit.py
+"""
+Per-provider flow control for the extractor clients.
+
+- TokenBucket: requests/min and tokens/min budgets (tokens estimated from
+  prompt length + max_tokens), refilled continuously.
+- AimdLimiter: per-provider concurrency limit. Grows additively (about +1 per
+  `limit` successes) while latency stays near its observed baseline, halves
+  on throttling (HTTP 429 / rate-limit errors) or timeouts.
+- ProviderGuard: buckets + limiter + retry policy for one provider. Retryable
+  errors (429, 5xx, timeouts, connection errors) are retried with jittered
+  exponential backoff instead of becoming permanent `error` rows.
+- GuardedClient: wraps a client (same `name`, `call`, `acall`).
+
+Guards are process-wide per provider name (see `get_guard`), so budgets carry
+over between extract_metrics calls in one run.
+
+Usage:
+    guard = get_guard("glm-4-plus", rpm=600, tpm=1_000_000, max_concurrency=32)
+    client = GuardedClient(ZhipuClient(key), guard)
+"""
+
+from __future__ import annotations
+
+import time
+import random
+import asyncio
+import threading
+from typing import Dict, Any, Optional
+
+try:
+    from tools import telemetry
+except Exception:
+    import telemetry
+
+RETRY_MAX = 4
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+THROTTLE_COOLDOWN = 1.0     # 两次减半之间至少间隔的秒数
+LATENCY_SLACK = 2.0         # EWMA 延迟超过基线的倍数时不再加并发
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float, burst: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = burst if burst is not None else max(1.0, per_minute / 6.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, n: float) -> float:
+        """Take n tokens (may go negative); return how long the caller must wait."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # 单次请求超过桶容量时按容量计，避免永远等不到
+            self.tokens -= min(n, self.capacity)
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def acquire(self, n: float = 1.0) -> None:
+        wait = self._reserve(n)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, n: float = 1.0) -> None:
+        wait = self._reserve(n)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class AimdLimiter:
+    def __init__(self, initial: int = 4, min_limit: int = 1, max_limit: int = 64):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.in_flight = 0
+        self._baseline: Optional[float] = None
+        self._ewma: Optional[float] = None
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def try_acquire(self) -> bool:
+        with self._cond:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            return False
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    async def acquire_async(self) -> None:
+        delay = 0.005
+        while not self.try_acquire():
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.1)
+
+    def release(self) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self, latency: float) -> None:
+        with self._cond:
+            self._ewma = latency if self._ewma is None else 0.8 * self._ewma + 0.2 * latency
+            self._baseline = self._ewma if self._baseline is None else min(self._baseline, self._ewma)
+            if self._ewma <= self._baseline * LATENCY_SLACK:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+    def on_throttle(self) -> None:
+        with self._cond:
+            now = time.monotonic()
+            if now - self._last_decrease >= THROTTLE_COOLDOWN:
+                self.limit = max(self.min_limit, self.limit / 2)
+                self._last_decrease = now
+
+
+def _status_code(exc: Exception) -> Optional[int]:
+    resp = getattr(exc, "response", None)
+    code = getattr(resp, "status_code", None) or getattr(exc, "status_code", None)
+    try:
+        return int(code) if code is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def is_throttle(exc: Exception) -> bool:
+    if _status_code(exc) == 429:
+        return True
+    text = f"{type(exc).__name__} {exc}".lower()
+    return "ratelimit" in text or "rate limit" in text or "429" in text
+
+
+def is_retryable(exc: Exception) -> bool:
+    code = _status_code(exc)
+    if code is not None:
+        return code == 429 or code >= 500
+    if is_throttle(exc):
+        return True
+    name = type(exc).__name__.lower()
+    return any(k in name for k in ("timeout", "connection", "connect", "transport", "remotedisconnected"))
+
+
+def backoff_delay(attempt: int, base: float = RETRY_BASE_DELAY, cap: float = RETRY_MAX_DELAY) -> float:
+    """Full-jitter exponential backoff."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class ProviderGuard:
+    def __init__(self, name: str, rpm: Optional[float] = None, tpm: Optional[float] = None,
+                 max_concurrency: int = 64, initial_concurrency: int = 4, max_retries: int = RETRY_MAX,
+                 base_delay: float = RETRY_BASE_DELAY, max_delay: float = RETRY_MAX_DELAY):
+        self.name = name
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.limiter = AimdLimiter(initial=min(initial_concurrency, max_concurrency), max_limit=max_concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+        self.throttled = 0
+        self.failures = 0
+
+    @staticmethod
+    def estimate_tokens(prompt: str, max_tokens: int) -> int:
+        return len(prompt) + max_tokens
+
+    def _record_error(self, exc: Exception, attempt: int) -> bool:
+        """Update controller/counters; True if the call should be retried."""
+        if is_throttle(exc) or "timeout" in type(exc).__name__.lower():
+            self.throttled += 1
+            telemetry.inc("llm_throttled_total", model=self.name)
+            self.limiter.on_throttle()
+        if is_retryable(exc) and attempt < self.max_retries:
+            self.retries += 1
+            telemetry.inc("llm_retries_total", model=self.name)
+            return True
+        self.failures += 1
+        return False
+
+    def backoff(self, attempt: int) -> float:
+        return backoff_delay(attempt, self.base_delay, self.max_delay)
+
+    def summary(self) -> str:
+        return (f"{self.name}: concurrency_limit={self.limiter.limit:.1f} retries={self.retries} "
+                f"throttled={self.throttled} failures={self.failures}")
+
+
+class GuardedClient:
+    """Wraps an extractor client with its provider's rate limits, retries and adaptive concurrency."""
+
+    def __init__(self, client, guard: ProviderGuard):
+        self.client = client
+        self.guard = guard
+        self.name = client.name
+
+    def call(self, prompt: str, max_tokens: int = 300, temperature: float = 0.0) -> Dict[str, Any]:
+        g = self.guard
+        attempt = 0
+        while True:
+            if g.requests:
+                g.requests.acquire(1)
+            if g.tokens:
+                g.tokens.acquire(g.estimate_tokens(prompt, max_tokens))
+            g.limiter.acquire()
+            t0 = time.time()
+            try:
+                resp = self.client.call(prompt, max_tokens=max_tokens, temperature=temperature)
+            except Exception as e:
+                g.limiter.release()
+                if not g._record_error(e, attempt):
+                    raise
+                time.sleep(g.backoff(attempt))
+                attempt += 1
+                continue
+            g.limiter.release()
+            g.limiter.on_success(time.time() - t0)
+            return resp
+
+    async def acall(self, prompt: str, max_tokens: int = 300, temperature: float = 0.0) -> Dict[str, Any]:
+        g = self.guard
+        attempt = 0
+        while True:
+            if g.requests:
+                await g.requests.acquire_async(1)
+            if g.tokens:
+                await g.tokens.acquire_async(g.estimate_tokens(prompt, max_tokens))
+            await g.limiter.acquire_async()
+            t0 = time.time()
+            try:
+                resp = await self.client.acall(prompt, max_tokens=max_tokens, temperature=temperature)
+            except Exception as e:
+                g.limiter.release()
+                if not g._record_error(e, attempt):
+                    raise
+                await asyncio.sleep(g.backoff(attempt))
+                attempt += 1
+                continue
+            g.limiter.release()
+            g.limiter.on_success(time.time() - t0)
+            return resp
+
+
+_GUARDS: Dict[str, ProviderGuard] = {}
+_GUARDS_LOCK = threading.Lock()
+
+
+def get_guard(name: str, **limits) -> ProviderGuard:
+    """Process-wide guard for a provider; created with `limits` on first use."""
+    with _GUARDS_LOCK:
+        if name not in _GUARDS:
+            _GUARDS[name] = ProviderGuard(name, **limits)
+        return _GUARDS[name]
+
+
+def guards_summary() -> str:
+    with _GUARDS_LOCK:
+        return "; ".join(g.summary() for g in _GUARDS.values())
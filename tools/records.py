@@ -0,0 +1,183 @@
+# 紧凑记录表与列式中间文件
+
+# path: tools/records.py
+"""
+Compact in-memory storage and columnar files for paragraphs / extraction rows.
+
+RecordTable keeps records column by column (one Python list per field) instead
+of one dict per record, and interns the low-cardinality strings (company,
+metric, model, unit, year, type, source_file, source_sha) so each distinct value exists
+once. Iterating yields plain dicts again, so it can stand in for the lists of
+dicts passed between pipeline stages; columns can be read directly
+(merge_columnar builds its DataFrame from them).
+
+write_table / TableFile store the same records as Parquet (".parquet") or
+Arrow IPC (".arrow") through pyarrow (`pip install pyarrow`), with the
+interned fields dictionary-encoded. TableFile is a re-iterable view like
+jsonl.JsonlFile: Arrow files are memory-mapped and read batch by batch,
+Parquet files are read row group by row group, and `columns()` reads only
+the fields asked for. Fields a record did not have come back as None.
+
+Usage:
+    table = RecordTable(paragraphs)
+    write_table(table, "out/parsed.arrow")
+    for p in TableFile("out/parsed.arrow"):
+        ...
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import json
+from typing import Dict, Any, Iterable, Iterator, List, Optional
+
+pa = pq = None   # pyarrow 在第一次读写列式文件时才导入
+
+INTERNED = ('company', 'metric', 'model', 'unit', 'year', 'type', 'source_file', 'source_sha')
+FORMATS = {'parquet': '.parquet', 'arrow': '.arrow'}
+_MISSING = object()
+
+
+def table_path(json_path: str, fmt: str) -> str:
+    """parsed.json -> parsed.parquet / parsed.arrow"""
+    return os.path.splitext(json_path)[0] + FORMATS[fmt]
+
+
+class RecordTable:
+    """Column-wise list of dict records (append / extend / iterate / len)."""
+
+    __slots__ = ('fields', '_cols', '_n')
+
+    def __init__(self, records: Iterable[Dict[str, Any]] = ()):
+        self.fields: List[str] = []
+        self._cols: Dict[str, List[Any]] = {}
+        self._n = 0
+        self.extend(records)
+
+    def append(self, rec: Dict[str, Any]) -> None:
+        cols = self._cols
+        for k, v in rec.items():
+            col = cols.get(k)
+            if col is None:
+                # 新字段：之前的记录补“缺失”占位
+                col = cols[k] = [_MISSING] * self._n
+                self.fields.append(k)
+            if k in INTERNED and type(v) is str:
+                v = sys.intern(v)
+            col.append(v)
+        self._n += 1
+        for col in cols.values():
+            if len(col) < self._n:
+                col.append(_MISSING)
+
+    def extend(self, records: Iterable[Dict[str, Any]]) -> None:
+        for rec in records:
+            self.append(rec)
+
+    def __len__(self) -> int:
+        return self._n
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        fields = self.fields
+        for values in zip(*(self._cols[f] for f in fields)):
+            yield {f: v for f, v in zip(fields, values) if v is not _MISSING}
+
+    def column(self, name: str) -> List[Any]:
+        """Values of one field (None where a record did not have it)."""
+        col = self._cols.get(name)
+        if col is None:
+            return [None] * self._n
+        return [None if v is _MISSING else v for v in col]
+
+
+def _require_pyarrow() -> None:
+    global pa, pq
+    if pa is None:
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except Exception:
+            raise ImportError('Parquet/Arrow output needs pyarrow: pip install pyarrow')
+        pa, pq = pyarrow, pyarrow.parquet
+
+
+def _array(name: str, values: List[Any]):
+    try:
+        arr = pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # 类型混杂的字段（如数值与字符串混用）按 JSON 文本保存，读回时还原
+        return pa.array([None if v is None else json.dumps(v, ensure_ascii=False) for v in values]), True
+    if name in INTERNED and pa.types.is_string(arr.type):
+        arr = arr.dictionary_encode()
+    return arr, False
+
+
+def write_table(records: Iterable[Dict[str, Any]], path: str) -> int:
+    """Write records to `path` (.parquet or .arrow); returns the number of records."""
+    _require_pyarrow()
+    table = records if isinstance(records, RecordTable) else RecordTable(records)
+    arrays, fields = [], []
+    for name in table.fields:
+        arr, as_json = _array(name, table.column(name))
+        arrays.append(arr)
+        fields.append(pa.field(name, arr.type, metadata={'json': '1'} if as_json else None))
+    t = pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+    d = os.path.dirname(path)
+    if d:
+        os.makedirs(d, exist_ok=True)
+    if path.endswith('.parquet'):
+        pq.write_table(t, path, compression='zstd')
+    else:
+        with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, t.schema) as w:
+            w.write_table(t)
+    return len(table)
+
+
+class TableFile:
+    """Re-iterable, read-only view of a file written by write_table."""
+
+    def __init__(self, path: str):
+        _require_pyarrow()
+        self.path = path
+
+    def _batches(self, columns: Optional[List[str]] = None):
+        if self.path.endswith('.parquet'):
+            f = pq.ParquetFile(self.path)
+            names = f.schema_arrow.names
+            yield from f.iter_batches(columns=[c for c in columns if c in names] if columns else None)
+            return
+        with pa.memory_map(self.path) as src:
+            reader = pa.ipc.open_file(src)
+            for i in range(reader.num_record_batches):
+                b = reader.get_batch(i)
+                yield b.select([c for c in columns if c in b.schema.names]) if columns else b
+
+    def _decode(self, batch) -> List[Dict[str, Any]]:
+        rows = batch.to_pylist()
+        json_fields = [f.name for f in batch.schema if f.metadata and f.metadata.get(b'json') == b'1']
+        for r in rows:
+            for k in json_fields:
+                if r[k] is not None:
+                    r[k] = json.loads(r[k])
+        return rows
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for batch in self._batches():
+            yield from self._decode(batch)
+
+    def columns(self, names: List[str]) -> Dict[str, List[Any]]:
+        """Only the given fields, as lists (None for fields not in the file)."""
+        out: Dict[str, List[Any]] = {n: [] for n in names}
+        for batch in self._batches(names):
+            rows = self._decode(batch)
+            for name in names:
+                out[name].extend(r.get(name) for r in rows)
+        return out
+
+    def __len__(self) -> int:
+        if self.path.endswith('.parquet'):
+            return pq.ParquetFile(self.path).metadata.num_rows
+        with pa.memory_map(self.path) as src:
+            reader = pa.ipc.open_file(src)
+            return sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
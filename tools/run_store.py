@@ -0,0 +1,116 @@
+# 增量抽取结果库
+
+# path: tools/run_store.py
+"""
+Persistent store of finished extraction calls, so a rerun only sends what is new.
+
+Every successful extraction row is stored in a local SQLite file keyed on
+(document content hash, page_id, para_id, metric, model, prompt version).
+RunStore has the same lookup/record interface as tools.checkpoint.CallCheckpoint
+and is passed to the extractor as `checkpoint`: before building each call the
+extractor asks lookup(), stored rows are replayed (tagged with the current
+paragraph's company; prompts do not depend on the company) and only the
+missing (paragraph, metric, model) combinations go to the models. Replayed and
+new rows then go through the merge together, so:
+
+- adding a metric only calls the models for that metric
+- adding a company only calls them for paragraphs not asked before
+- adding a model only calls that model
+
+Documents are identified by content hash, taken from each paragraph's and
+row's `source_sha` (renamed or moved files are still found, and same-named
+files from different directories stay apart); paragraphs by their page_id /
+para_id within the document. The version string should change whenever
+stored answers stop being valid: main uses extractor.PROMPT_VERSION plus
+parser.parse_variant() (parser version, engine and OCR settings, which decide
+the paragraph text and numbering), and mock runs get their own version. Error
+rows are never stored.
+
+Usage:
+    store = RunStore("./.cache/run_store.sqlite3", [sha256], version="1.v3-chi_sim_eng-img-s32-e1.0")
+    extractor.extract_metrics(paras, metrics, checkpoint=store)   # paras carry source_sha
+    print(store.summary()); store.close()
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Dict, Any, Iterable, Optional, Tuple
+
+Key = Tuple[str, Any, Any, str, str]
+
+
+class RunStore:
+    def __init__(self, path: str, docs: Iterable[str], version: str):
+        """docs: content hashes of this run's PDFs (the paragraphs' source_sha); their rows are preloaded."""
+        self.path = path
+        self.version = version
+        self.replayed = 0
+        self.recorded = 0
+        self._docs = set(docs)
+        self._lock = threading.Lock()
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS calls ("
+            " doc TEXT NOT NULL, page_id INTEGER, para_id INTEGER, metric TEXT NOT NULL, model TEXT NOT NULL,"
+            " version TEXT NOT NULL, row TEXT NOT NULL, created REAL NOT NULL,"
+            " PRIMARY KEY (doc, version, page_id, para_id, metric, model))"
+        )
+        # 本次运行涉及的文档的结果一次读入内存，查找不再访问数据库
+        self._rows: Dict[Key, Dict[str, Any]] = {}
+        shas = sorted(s for s in self._docs if s)
+        for i in range(0, len(shas), 500):
+            chunk = shas[i:i + 500]
+            cur = self._db.execute(
+                f"SELECT doc, page_id, para_id, metric, model, row FROM calls"
+                f" WHERE version = ? AND doc IN ({','.join('?' * len(chunk))})", [version] + chunk)
+            for doc, page_id, para_id, metric, model, row in cur:
+                self._rows[(doc, page_id, para_id, metric, model)] = json.loads(row)
+
+    def _key(self, rec: Dict[str, Any], metric: str, model: str) -> Optional[Key]:
+        doc = rec.get("source_sha")
+        if not doc or doc not in self._docs:
+            return None
+        return (doc, rec.get("page_id"), rec.get("para_id"), metric, model)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def lookup(self, para: Dict[str, Any], metric: str, model: str) -> Optional[Dict[str, Any]]:
+        key = self._key(para, metric, model)
+        row = self._rows.get(key) if key else None
+        if row is not None:
+            self.replayed += 1
+        return row
+
+    def record(self, row: Dict[str, Any]) -> None:
+        if row.get("error") or not row.get("metric") or not row.get("model"):
+            return
+        key = self._key(row, row["metric"], row["model"])
+        if key is None:
+            return
+        with self._lock:
+            if key in self._rows:
+                return
+            self._rows[key] = row
+            self._db.execute(
+                "INSERT OR IGNORE INTO calls (doc, page_id, para_id, metric, model, version, row, created)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key[0], key[1], key[2], key[3], key[4], self.version, json.dumps(row, ensure_ascii=False), time.time()))
+            self.recorded += 1
+
+    def summary(self) -> str:
+        return f"run store {self.path}: {self.replayed} calls reused, {self.recorded} new calls stored"
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
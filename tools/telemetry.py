@@ -0,0 +1,186 @@
+# 运行指标：计数器与延迟直方图
+
+# path: tools/telemetry.py
+"""
+Lightweight in-process metrics registry for the pipeline.
+
+- counters: monotonically increasing numbers (pages parsed, LLM calls per
+  model, errors, retries, prompt/completion characters ...)
+- histograms: observed values (seconds) with count/sum/min/max and
+  p50/p95/p99 from a bounded reservoir sample
+
+Series are identified by a name plus labels, e.g.
+    inc("llm_calls_total", model="glm-4-plus", status="ok")
+    observe("llm_call_seconds", 0.82, model="glm-4-plus")
+    with timer("stage_seconds", stage="merge"):
+        ...
+
+`snapshot()` is what main.py writes to metrics.json; `render_prometheus()`
+turns a snapshot into Prometheus text format (server.py /metrics).
+Worker processes send their `snapshot(raw=True)` back to the parent, which
+folds it in with `merge()`.
+"""
+
+from __future__ import annotations
+
+import time
+import random
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple
+
+HIST_MAX_SAMPLES = 10000
+QUANTILES = (0.5, 0.95, 0.99)
+
+_Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _key(name: str, labels: Dict[str, Any]) -> _Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+class _Histogram:
+    __slots__ = ("count", "sum", "min", "max", "samples")
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+        self.samples: List[float] = []
+
+    def observe(self, v: float) -> None:
+        self.count += 1
+        self.sum += v
+        self.min = min(self.min, v)
+        self.max = max(self.max, v)
+        if len(self.samples) < HIST_MAX_SAMPLES:
+            self.samples.append(v)
+        else:
+            # reservoir sampling：样本量有界，分位数仍近似无偏
+            i = random.randrange(self.count)
+            if i < HIST_MAX_SAMPLES:
+                self.samples[i] = v
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        s = sorted(self.samples)
+        return s[min(len(s) - 1, int(q * len(s)))]
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[_Key, float] = {}
+        self.histograms: Dict[_Key, _Histogram] = {}
+        self.started = time.time()
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        k = _key(name, labels)
+        with self._lock:
+            self.counters[k] = self.counters.get(k, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        k = _key(name, labels)
+        with self._lock:
+            h = self.histograms.get(k)
+            if h is None:
+                h = self.histograms[k] = _Histogram()
+            h.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t0, **labels)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.started = time.time()
+
+    def snapshot(self, raw: bool = False) -> Dict[str, Any]:
+        """JSON-serialisable view. raw=True keeps histogram samples (for merge())."""
+        with self._lock:
+            counters = [{"name": n, "labels": dict(l), "value": v} for (n, l), v in sorted(self.counters.items())]
+            hists = []
+            for (n, l), h in sorted(self.histograms.items()):
+                entry: Dict[str, Any] = {"name": n, "labels": dict(l), "count": h.count, "sum": h.sum,
+                                         "min": h.min if h.count else None, "max": h.max if h.count else None}
+                if raw:
+                    entry["samples"] = list(h.samples)
+                else:
+                    for q in QUANTILES:
+                        entry[f"p{int(q * 100)}"] = h.quantile(q)
+                hists.append(entry)
+        return {"started": self.started, "wall_seconds": time.time() - self.started,
+                "counters": counters, "histograms": hists}
+
+    def merge(self, snap: Dict[str, Any]) -> None:
+        """Fold in a raw snapshot taken in another process."""
+        with self._lock:
+            for c in snap.get("counters", []):
+                k = _key(c["name"], c["labels"])
+                self.counters[k] = self.counters.get(k, 0) + c["value"]
+            for e in snap.get("histograms", []):
+                k = _key(e["name"], e["labels"])
+                h = self.histograms.get(k)
+                if h is None:
+                    h = self.histograms[k] = _Histogram()
+                h.count += e["count"]
+                h.sum += e["sum"]
+                if e["count"]:
+                    h.min = min(h.min, e["min"])
+                    h.max = max(h.max, e["max"])
+                h.samples.extend(e.get("samples", []))
+                if len(h.samples) > HIST_MAX_SAMPLES:
+                    h.samples = random.sample(h.samples, HIST_MAX_SAMPLES)
+
+
+REGISTRY = Registry()
+
+inc = REGISTRY.inc
+observe = REGISTRY.observe
+timer = REGISTRY.timer
+reset = REGISTRY.reset
+snapshot = REGISTRY.snapshot
+merge = REGISTRY.merge
+
+
+def _fmt_labels(labels: Dict[str, Any], extra: Optional[Dict[str, str]] = None) -> str:
+    items = list(labels.items()) + list((extra or {}).items())
+    if not items:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in items) + "}"
+
+
+def render_prometheus(snap: Dict[str, Any], prefix: str = "huatai_") -> str:
+    """Prometheus text exposition of a snapshot: counters as `counter`, histograms as `summary`."""
+    lines: List[str] = []
+    typed = set()
+    for c in snap.get("counters", []):
+        name = prefix + c["name"]
+        if name not in typed:
+            lines.append(f"# TYPE {name} counter")
+            typed.add(name)
+        lines.append(f"{name}{_fmt_labels(c['labels'])} {c['value']}")
+    for h in snap.get("histograms", []):
+        name = prefix + h["name"]
+        if name not in typed:
+            lines.append(f"# TYPE {name} summary")
+            typed.add(name)
+        for q in QUANTILES:
+            v = h.get(f"p{int(q * 100)}")
+            if v is not None:
+                lines.append(f"{name}{_fmt_labels(h['labels'], {'quantile': str(q)})} {v}")
+        lines.append(f"{name}_sum{_fmt_labels(h['labels'])} {h['sum']}")
+        lines.append(f"{name}_count{_fmt_labels(h['labels'])} {h['count']}")
+    if "wall_seconds" in snap:
+        lines.append(f"# TYPE {prefix}run_wall_seconds gauge")
+        lines.append(f"{prefix}run_wall_seconds {snap['wall_seconds']}")
+    return "\n".join(lines) + "\n"
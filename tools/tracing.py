@@ -0,0 +1,172 @@
+# 运行时间线（Chrome trace）与采样分析
+
+# path: tools/tracing.py
+"""
+Timeline tracing and profiling for a pipeline run.
+
+Spans are recorded only after `start()` (main.py --trace); otherwise `span()`
+is a no-op. `save(path)` writes the Chrome trace event format, viewable in
+chrome://tracing or https://ui.perfetto.dev:
+
+- spans in plain threads are complete events ("X") on their thread id
+- spans inside asyncio tasks are async begin/end pairs ("b"/"e") keyed by the
+  task, since many calls overlap on the event-loop thread
+- worker processes record their own spans and hand them back with
+  `drain()`; the parent adds them with `extend()` (timestamps are wall-clock
+  microseconds, so processes line up)
+
+Usage:
+    tracing.start()
+    with tracing.span("parse_page", cat="parser", page=3):
+        ...
+    tracing.save("out.json")
+
+SamplingProfiler samples the stacks of all threads (sys._current_frames) at a
+fixed interval, which, unlike cProfile, also covers worker threads.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import json
+import time
+import asyncio
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+
+_enabled = False
+_events: List[Dict[str, Any]] = []
+_lock = threading.Lock()
+
+
+def _now_us() -> int:
+    return time.time_ns() // 1000
+
+
+def _task_id() -> Optional[int]:
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        return None
+    return id(task) if task is not None else None
+
+
+def start() -> None:
+    global _enabled
+    with _lock:
+        _events.clear()
+        _enabled = True
+
+
+def stop() -> None:
+    global _enabled
+    _enabled = False
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+@contextmanager
+def span(name: str, cat: str = "pipeline", **args):
+    if not _enabled:
+        yield
+        return
+    pid, tid = os.getpid(), threading.get_ident()
+    task = _task_id()
+    ts = _now_us()
+    try:
+        yield
+    finally:
+        end = _now_us()
+        args = {k: v for k, v in args.items() if v is not None}
+        if task is None:
+            evs = [{"name": name, "cat": cat, "ph": "X", "ts": ts, "dur": end - ts, "pid": pid, "tid": tid, "args": args}]
+        else:
+            base = {"name": name, "cat": cat, "id": task, "pid": pid, "tid": tid}
+            evs = [dict(base, ph="b", ts=ts, args=args), dict(base, ph="e", ts=end)]
+        with _lock:
+            _events.extend(evs)
+
+
+def drain() -> List[Dict[str, Any]]:
+    """Take the recorded events (used by worker processes to return theirs)."""
+    with _lock:
+        evs = list(_events)
+        _events.clear()
+    return evs
+
+
+def extend(events: List[Dict[str, Any]]) -> None:
+    if _enabled and events:
+        with _lock:
+            _events.extend(events)
+
+
+def save(path: str) -> None:
+    with _lock:
+        evs = list(_events)
+    meta = []
+    for pid in {e["pid"] for e in evs}:
+        label = "main" if pid == os.getpid() else f"worker {pid}"
+        meta.append({"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": label}})
+    d = os.path.dirname(path)
+    if d:
+        os.makedirs(d, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": meta + evs, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+
+
+class SamplingProfiler:
+    """Samples every thread's stack each `interval` seconds; reports self and cumulative sample counts."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples = 0
+        self.self_counts: Counter = Counter()
+        self.cum_counts: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                self.samples += 1
+                seen = set()
+                leaf = True
+                while frame is not None:
+                    code = frame.f_code
+                    key = f"{code.co_filename}:{code.co_firstlineno}({code.co_name})"
+                    if leaf:
+                        self.self_counts[key] += 1
+                        leaf = False
+                    if key not in seen:
+                        self.cum_counts[key] += 1
+                        seen.add(key)
+                    frame = frame.f_back
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def report(self, top: int = 40) -> str:
+        n = max(1, self.samples)
+        lines = [f"{self.samples} thread samples every {self.interval * 1000:.1f} ms", "",
+                 "self %   cum %   function"]
+        for key, cum in self.cum_counts.most_common(top):
+            lines.append(f"{100 * self.self_counts.get(key, 0) / n:6.1f}  {100 * cum / n:6.1f}   {key}")
+        lines += ["", "top self samples:"]
+        for key, c in self.self_counts.most_common(top):
+            lines.append(f"{100 * c / n:6.1f}   {key}")
+        return "\n".join(lines)